@@ -0,0 +1,49 @@
+"""
+Measures oazure import time for each entry point, in fresh interpreters.
+
+    python -m benchmarks.bench_import
+"""
+import subprocess
+import sys
+
+REPEAT = 5
+
+# all components, as imported by oazure before lazy loading
+EAGER_IMPORT = "import oazure.async_blob_storage, oazure.logging_handler, oazure.async_batch_client, " \
+               "oazure.monitoring, oazure.sessions, oazure.instrumentation"
+
+ENTRY_POINTS = (
+    ("import oazure", "import oazure"),
+    ("AsyncBlobAPI", "from oazure import AsyncBlobAPI"),
+    ("AzureLoggingHandler", "from oazure import AzureLoggingHandler"),
+    ("AzureBatchClient", "from oazure import AzureBatchClient"),
+    ("LogAnalyticsClient", "from oazure import LogAnalyticsClient"),
+    ("MetricsRegistry", "from oazure import MetricsRegistry"),
+)
+
+_TIMED = "import time; start = time.perf_counter(); {}; print(time.perf_counter() - start)"
+
+
+def _measure(statement):
+    timings = []
+    for _ in range(REPEAT):
+        output = subprocess.run(
+            [sys.executable, "-c", _TIMED.format(statement)],
+            check=True,
+            capture_output=True,
+            text=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    # best of, least noisy
+    return min(timings)
+
+
+def run():
+    eager = _measure(EAGER_IMPORT) * 1000
+    print(f"{'entry point':<24}{'lazy (ms)':>12}{'eager (ms)':>12}")
+    for name, statement in ENTRY_POINTS:
+        print(f"{name:<24}{_measure(statement) * 1000:>12.1f}{eager:>12.1f}")
+
+
+if __name__ == "__main__":
+    run()
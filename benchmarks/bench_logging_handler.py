@@ -0,0 +1,58 @@
+"""
+Records per second per thread emitted through AzureLoggingHandler, telemetry being sent to a null sender.
+
+    python -m benchmarks.bench_logging_handler [threads_nb]
+"""
+import sys
+import time
+import logging
+import threading
+
+from applicationinsights.channel import TelemetryChannel, SynchronousQueue, NullSender
+
+from oazure import AzureLoggingHandler
+from oazure.logging_handler import LogSampler
+
+RECORDS_NB = 20000
+
+
+def _make_logger(name, **handler_kwargs):
+    handler = AzureLoggingHandler(
+        "00000000-0000-0000-0000-000000000000",
+        "benchmark",
+        telemetry_channel=TelemetryChannel(queue=SynchronousQueue(NullSender())),
+        **handler_kwargs
+    )
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger, handler
+
+
+def _emit(logger, results):
+    start = time.perf_counter()
+    for i in range(RECORDS_NB):
+        logger.info("simulation %s finished", i, extra=dict(simulation_id=i, duration=1.5, request=object()))
+    results.append(RECORDS_NB / (time.perf_counter() - start))
+
+
+def run(name, threads_nb, **handler_kwargs):
+    logger, handler = _make_logger(f"benchmark.{name}", **handler_kwargs)
+    results = []
+    threads = [threading.Thread(target=_emit, args=(logger, results)) for _ in range(threads_nb)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    handler.close()
+    print(f"{name:<20}{sum(results) / len(results):>12.0f} records/s/thread")
+
+
+if __name__ == "__main__":
+    threads_nb = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    print(f"{threads_nb} thread(s), {RECORDS_NB} records per thread")
+    run("inline", threads_nb)
+    run("queued", threads_nb, queue_size=10 * RECORDS_NB * threads_nb)
+    run("sampled (10%)", threads_nb, sampler=LogSampler(level_rates=dict(INFO=0.1)))
+    run("deduplicated", threads_nb, sampler=LogSampler(dedup_window=60))
@@ -0,0 +1,67 @@
+"""
+Compares ojson backends on representative payloads.
+
+    python -m benchmarks.bench_ojson
+"""
+import time
+import uuid
+import datetime as dt
+
+from oazure.snippets import ojson
+
+REPEAT = 20
+
+
+def _task_payload():
+    # AzureBatchClient.add_task body
+    return dict(
+        id=str(uuid.uuid4()),
+        commandLine="/bin/bash -c 'python -m simulation run'",
+        userIdentity=dict(autoUser=dict(scope="pool", elevationLevel="admin")),
+        environmentSettings=[dict(name=f"VARIABLE_{i}", value=str(uuid.uuid4())) for i in range(20)],
+        outputFiles=[]
+    )
+
+
+def _log_records(records_nb):
+    # LogAnalyticsClient records
+    now = dt.datetime.utcnow()
+    return [dict(
+        simulation_id=uuid.uuid4(),
+        created=now + dt.timedelta(seconds=i),
+        duration=i * 0.37,
+        status="success",
+        tags={"a", "b"},
+        nodes=[dict(name=f"node-{j}", load=j / 3) for j in range(5)]
+    ) for i in range(records_nb)]
+
+
+def _measure(function, payload):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        function(payload)
+    return (time.perf_counter() - start) / REPEAT
+
+
+def run():
+    payloads = (
+        ("batch task", _task_payload()),
+        ("100 log records", _log_records(100)),
+        ("10000 log records", _log_records(10000)),
+    )
+    backends = [ojson.JSON_BACKEND] + ([ojson.ORJSON_BACKEND] if ojson.orjson is not None else [])
+    initial_backend = ojson.get_backend()
+    try:
+        print(f"{'payload':<20}" + "".join(f"{backend + ' (ms)':>16}" for backend in backends))
+        for name, payload in payloads:
+            timings = []
+            for backend in backends:
+                ojson.set_backend(backend)
+                timings.append(_measure(ojson.dumpb, payload) * 1000)
+            print(f"{name:<20}" + "".join(f"{timing:>16.3f}" for timing in timings))
+    finally:
+        ojson.set_backend(initial_backend)
+
+
+if __name__ == "__main__":
+    run()
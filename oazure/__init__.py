@@ -1,9 +1,53 @@
-from .async_blob_storage import AsyncBlobAPI, \
-    AzureBlobStorageResourceNotFound, \
-    AzureBlobStorageAlreadyLeased,\
-    AzureBlobStorageAlreadyReleased, \
-    AzureBlobStorageLockedFile, \
-    AzureBlobStorageAsyncError
-from .logging_handler import AzureLoggingHandler
-from .async_batch_client import AzureBatchClient, BatchResponseError
-from .monitoring import LogAnalyticsClient
+import importlib
+
+# name: module, components (and their dependencies) are only imported on first access
+_LAZY_ATTRIBUTES = dict(
+    AsyncBlobAPI=".async_blob_storage",
+    AzureBlobStorageResourceNotFound=".async_blob_storage",
+    AzureBlobStorageAlreadyLeased=".async_blob_storage",
+    AzureBlobStorageAlreadyReleased=".async_blob_storage",
+    AzureBlobStorageLockedFile=".async_blob_storage",
+    AzureBlobStorageAsyncError=".async_blob_storage",
+    AzureBlobStorageConditionNotMet=".async_blob_storage",
+    BlobListener=".async_blob_storage",
+    BlobIndex=".blob_index",
+    AppendBlobWriter=".append_blob",
+    upload_directory=".blob_sync",
+    download_directory=".blob_sync",
+    resumable_upload=".blob_sync",
+    resumable_download=".blob_sync",
+    ShardedBlobAPI=".sharding",
+    rebalance=".sharding",
+    AzureLoggingHandler=".logging_handler",
+    LogSampler=".logging_handler",
+    AzureBatchClient=".async_batch_client",
+    BatchResponseError=".async_batch_client",
+    LogAnalyticsClient=".monitoring",
+    LogAnalyticsBuffer=".monitoring",
+    LogAnalyticsSender=".monitoring",
+    create_session=".sessions",
+    AdaptiveConcurrencyLimiter=".concurrency",
+    get_shared_limiter=".concurrency",
+    BlobRateLimiter=".rate_limiting",
+    HedgingPolicy=".hedging",
+    Instrumentation=".instrumentation",
+    MetricsRegistry=".instrumentation",
+    ApplicationInsightsExporter=".instrumentation"
+)
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    try:
+        module_name = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    # next accesses don't go through __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
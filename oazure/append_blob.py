@@ -0,0 +1,170 @@
+import asyncio
+import logging
+
+from .async_blob_storage import MAX_APPEND_BLOCK_SIZE, AzureBlobStorageConditionNotMet
+
+logger = logging.getLogger(__name__)
+
+
+class AppendBlobWriter:
+    """
+    Streams bytes to an append blob: small writes are coalesced into append blocks of at most block_size bytes.
+
+    A block is appended when block_size bytes are buffered, or flush_interval seconds after the previous one. Data is
+    appended in the order of write() calls, one block at a time. Each block is appended at the expected position
+    (x-ms-blob-condition-appendpos), so that retries never duplicate data. When max_buffer_size bytes are waiting,
+    write() waits for blocks to be appended.
+
+    If an append fails, the data is kept and the error is raised by the next write, flush or close.
+
+    open() creates the blob (create=True, replaces an existing blob) or appends to an existing append blob. close()
+    (or leaving the async context manager) appends the remaining data and stops the background task. Must be used from
+    a single event loop.
+    """
+    def __init__(
+            self,
+            blob_api,
+            container_name,
+            blob_name,
+            session,
+            block_size=MAX_APPEND_BLOCK_SIZE,
+            flush_interval=5.,
+            max_buffer_size=None,
+            create=True,
+            timeout=None
+    ):
+        if block_size > MAX_APPEND_BLOCK_SIZE:
+            raise ValueError(f"block_size must not exceed {MAX_APPEND_BLOCK_SIZE}")
+        self.blob_api = blob_api
+        self.container_name = container_name
+        self.blob_name = blob_name
+        self.session = session
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self.max_buffer_size = 4 * block_size if max_buffer_size is None else max_buffer_size
+        self.create = create
+        self.timeout = timeout
+
+        # blob size (appended bytes)
+        self.position = None
+        self.appended_blocks = 0
+
+        self._buffer = bytearray()
+        self._error = None
+        self._flush_event = None
+        self._space_event = None
+        self._flush_lock = None
+        self._task = None
+        self._closed = False
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def open(self):
+        if self._task is not None:
+            return
+        if self.create:
+            await self.blob_api.create_append_blob(
+                self.container_name, self.blob_name, self.session, timeout=self.timeout)
+            self.position = 0
+        else:
+            self.position = await self.blob_api.get_blob_size(
+                self.container_name, self.blob_name, self.session, timeout=self.timeout)
+        self._flush_event = asyncio.Event()
+        self._space_event = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.ensure_future(self._run())
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    async def write(self, data):
+        """
+        Parameters
+        ----------
+        data: bytes
+        """
+        if self._closed:
+            raise RuntimeError("writer is closed")
+        if self._task is None:
+            await self.open()
+        self._raise_error()
+        while len(self._buffer) >= self.max_buffer_size:
+            self._flush_event.set()
+            self._space_event.clear()
+            await self._space_event.wait()
+            self._raise_error()
+        self._buffer.extend(data)
+        if len(self._buffer) >= self.block_size:
+            self._flush_event.set()
+
+    async def flush(self):
+        """
+        Appends all buffered data.
+        """
+        if self._task is None:
+            return
+        async with self._flush_lock:
+            while self._buffer:
+                await self._append_block()
+        self._raise_error()
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._task is not None:
+            # wakes the background task up, which exits
+            self._flush_event.set()
+            await self._task
+            await self.flush()
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            async with self._flush_lock:
+                try:
+                    # only full blocks are appended on size triggers, everything on interval
+                    await self._append_block()
+                    while len(self._buffer) >= self.block_size:
+                        await self._append_block()
+                except Exception as e:
+                    logger.exception("could not append block to azure blob")
+                    self._error = e
+                    # wakes blocked writers up, they raise the error
+                    self._space_event.set()
+
+    async def _append_block(self):
+        block = bytes(self._buffer[:self.block_size])
+        if not block:
+            return
+        try:
+            await self.blob_api.append_block(
+                block,
+                self.container_name,
+                self.blob_name,
+                self.session,
+                append_position=self.position,
+                timeout=self.timeout
+            )
+        except AzureBlobStorageConditionNotMet:
+            # a previous attempt of this block may have succeeded without response
+            size = await self.blob_api.get_blob_size(
+                self.container_name, self.blob_name, self.session, timeout=self.timeout)
+            if size != self.position + len(block):
+                raise
+        # data is only removed once appended
+        del self._buffer[:len(block)]
+        self.position += len(block)
+        self.appended_blocks += 1
+        self._space_event.set()
@@ -3,11 +3,21 @@ import base64
 import hashlib
 import hmac
 import asyncio
+import time
+import bisect
 
-import aiohttp
 from aiohttp.client_exceptions import ClientError
 
-from .snippets.ojson import dumps
+from .snippets.ojson import dumpb
+from .instrumentation import NULL_INSTRUMENTATION
+from .sessions import create_session, DEFAULT_CONNECTOR_LIMIT, DEFAULT_CONNECTOR_LIMIT_PER_HOST, \
+    DEFAULT_KEEPALIVE_TIMEOUT, DEFAULT_TTL_DNS_CACHE
+
+# limits of an add task collection request
+MAX_TASKS_PER_COLLECTION = 100
+MAX_COLLECTION_SIZE = 1024 * 1024
+# {"value": [...]} around the task bodies of a collection
+_COLLECTION_ENVELOPE_SIZE = len(dumpb({"value": []}))
 
 
 class BatchResponseError(Exception):
@@ -20,17 +30,130 @@ class BatchResponseError(Exception):
         )
 
 
+def _task_graph(tasks):
+    # returns tasks by id and dependencies (task id: ids of the graph it depends on)
+    tasks_by_id = {}
+    for task in tasks:
+        if task["id"] in tasks_by_id:
+            raise ValueError(f"duplicate task id {task['id']}")
+        tasks_by_id[task["id"]] = task
+    # (int id, task id) of integer ids, for ranges
+    int_ids = sorted((int(task_id), task_id) for task_id in tasks_by_id if task_id.isdigit())
+
+    dependencies = {}
+    for task_id, task in tasks_by_id.items():
+        task_dependencies = set()
+        for dependency in task.get("depends_on") or ():
+            if dependency not in tasks_by_id:
+                raise ValueError(f"task {task_id} depends on unknown task {dependency}")
+            task_dependencies.add(dependency)
+        # ranges may include ids that are not tasks
+        for start, end in task.get("depends_on_ranges") or ():
+            task_dependencies.update(dependency for _, dependency in int_ids[
+                bisect.bisect_left(int_ids, (start, "")):bisect.bisect_left(int_ids, (end + 1, ""))])
+        dependencies[task_id] = task_dependencies
+    return tasks_by_id, dependencies
+
+
+def _topological_order(tasks_by_id, dependencies):
+    # depth first search, iterative (graphs may be deep)
+    order = []
+    state = {}  # task id: 1 visiting, 2 done
+    for root in tasks_by_id:
+        if root in state:
+            continue
+        state[root] = 1
+        stack = [(root, iter(sorted(dependencies[root])))]
+        while stack:
+            task_id, remaining = stack[-1]
+            for dependency in remaining:
+                if state.get(dependency) == 1:
+                    raise ValueError(f"task dependency cycle through {dependency}")
+                if dependency not in state:
+                    state[dependency] = 1
+                    stack.append((dependency, iter(sorted(dependencies[dependency]))))
+                    break
+            else:
+                stack.pop()
+                state[task_id] = 2
+                order.append(tasks_by_id[task_id])
+    return order
+
+
+def validate_task_graph(tasks):
+    """
+    Checks a task graph (see AzureBatchClient.add_task_graph): unique ids, known dependencies, no cycles.
+
+    Returns
+    -------
+    list of tasks in topological order (dependencies first, otherwise in the given order)
+    """
+    return _topological_order(*_task_graph(tasks))
+
+
 class AzureBatchClient:
-    def __init__(self, account_name, account_key, account_url):
+    """
+    May be used as an async context manager, the session is then closed on exit:
+
+        async with AzureBatchClient(name, key, url) as client:
+            await client.add_task(...)
+
+    If a session is given, it is shared (for example with AsyncBlobAPI calls) and is not closed by the client. Else,
+    a session is created on first request, with a connection pool sized by the connector parameters.
+    """
+    def __init__(
+            self,
+            account_name,
+            account_key,
+            account_url,
+            session=None,
+            connector_limit=DEFAULT_CONNECTOR_LIMIT,
+            connector_limit_per_host=DEFAULT_CONNECTOR_LIMIT_PER_HOST,
+            keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=DEFAULT_TTL_DNS_CACHE,
+            instrumentation=None,
+            concurrency_limiter=None
+    ):
         self.account_name = account_name
         self.account_key = account_key
         self.account_url = account_url.strip("/")
         self.api_version = "2018-12-01.8.0"
-        self.session = None
+        self.session = session
+        self._owns_session = session is None
+        self._connector_limit = connector_limit
+        self._connector_limit_per_host = connector_limit_per_host
+        self._keepalive_timeout = keepalive_timeout
+        self._ttl_dns_cache = ttl_dns_cache
+        self.instrumentation = NULL_INSTRUMENTATION if instrumentation is None else instrumentation
+        # AdaptiveConcurrencyLimiter (see get_shared_limiter), all requests go through it
+        self.concurrency_limiter = concurrency_limiter
+
+    async def __aenter__(self):
+        return self
 
-    async def _send(self, verb, path, params, headers, body=None, json=None, retries=3):
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """
+        Closes the session if it was created by the client (a shared session is left open).
+        """
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self):
         if self.session is None:
-            self.session = aiohttp.ClientSession()
+            self.session = create_session(
+                limit=self._connector_limit,
+                limit_per_host=self._connector_limit_per_host,
+                keepalive_timeout=self._keepalive_timeout,
+                ttl_dns_cache=self._ttl_dns_cache
+            )
+        return self.session
+
+    async def _send(self, verb, path, params, headers, body=None, json=None, retries=3, operation=None):
+        session = self._get_session()
 
         url = self.account_url + path
         response = None
@@ -40,12 +163,18 @@ class AzureBatchClient:
             headers["Content-Type"] = "application/octet-stream"
         elif json is not None:
             headers["Content-Type"] = "application/json; odata=minimalmetadata; charset=utf-8"
-            body = bytes(dumps(json), "utf-8")
+            body = dumpb(json)
         headers["Content-Length"] = str(len(body)) if body else "0"
         headers = self._authenticate(verb, path, params, headers)
+        operation = verb if operation is None else operation
+        limiter = self.concurrency_limiter
         for retry in range(retries):
+            if limiter is not None:
+                await limiter.acquire()
+            self.instrumentation.request_started("batch", operation)
+            start = time.monotonic()
             try:
-                response = await self.session.request(
+                response = await session.request(
                     verb,
                     url,
                     params=params,
@@ -53,10 +182,28 @@ class AzureBatchClient:
                     data=body,
                     skip_auto_headers=("Content-Type", "User-Agent", "Content-Length")
                 )
-            except ClientError:
-                if retry == retries - 1:
+            except BaseException as e:
+                if limiter is not None:
+                    limiter.release(time.monotonic() - start, error=e)
+                if isinstance(e, asyncio.CancelledError):
+                    self.instrumentation.request_cancelled("batch", operation, time.monotonic() - start, attempt=retry)
+                else:
+                    self.instrumentation.request_failed(
+                        "batch", operation, e, time.monotonic() - start, attempt=retry)
+                if not isinstance(e, ClientError) or retry == retries - 1:
                     raise
             else:
+                if limiter is not None:
+                    limiter.release(time.monotonic() - start, status=response.status)
+                self.instrumentation.request_ended(
+                    "batch",
+                    operation,
+                    response.status,
+                    time.monotonic() - start,
+                    bytes_sent=len(body) if body else 0,
+                    bytes_received=response.content_length or 0,
+                    attempt=retry
+                )
                 break
 
         if response.status // 100 == 2:
@@ -89,6 +236,177 @@ class AzureBatchClient:
         headers["Authorization"] = f"SharedKey {self.account_name}:{signature}"
         return headers
 
+    @staticmethod
+    def _task_body(task_id, command_line, environment_settings=None, output_files=None, depends_on=None,
+                   depends_on_ranges=None):
+        json_body = {
+            "id": task_id,
+            "commandLine": command_line,
+            # for now userIdentity is fixed to pool user and admin, can be modified if needed
+            "userIdentity": {
+                "autoUser": {
+                    "scope": "pool",
+                    "elevationLevel": "admin"
+                }
+            },
+            "environmentSettings": [] if environment_settings is None else environment_settings,
+            "outputFiles": [] if output_files is None else output_files
+        }
+        if depends_on or depends_on_ranges:
+            json_body["dependsOn"] = {
+                "taskIds": list(depends_on or ()),
+                "taskIdRanges": [dict(start=start, end=end) for start, end in depends_on_ranges or ()]
+            }
+        return json_body
+
+    async def add_job(self, job_id, pool_id, uses_task_dependencies=False, on_all_tasks_complete=None, timeout=None):
+        """
+
+        Parameters
+        ----------
+        job_id: str
+        pool_id: str
+        uses_task_dependencies: bool, must be True for tasks with dependencies (see add_task_graph)
+        on_all_tasks_complete: str, optional, 'noaction' or 'terminatejob'
+        timeout
+        """
+        path = "/jobs"
+        parameters = {
+            "api-version": self.api_version
+        }
+        if timeout is not None:
+            parameters["timeout"] = timeout
+
+        headers = {}
+
+        json_body = {
+            "id": job_id,
+            "poolInfo": {"poolId": pool_id},
+            "usesTaskDependencies": uses_task_dependencies
+        }
+        if on_all_tasks_complete is not None:
+            json_body["onAllTasksComplete"] = on_all_tasks_complete
+
+        response = await self._send("POST", path, parameters, headers, json=json_body, operation="add_job")
+        response.release()
+        return response
+
+    async def _add_task_collection(self, job_id, task_bodies, timeout=None, retries=3, exists_ok=False):
+        path = f"/jobs/{job_id}/addtaskcollection"
+        parameters = {
+            "api-version": self.api_version
+        }
+        if timeout is not None:
+            parameters["timeout"] = timeout
+
+        for retry in range(retries):
+            # not retried by _send: after a lost response the tasks may have been added, they must then be accepted
+            # as existing
+            try:
+                response = await self._send(
+                    "POST", path, parameters, {}, json={"value": task_bodies}, retries=1,
+                    operation="add_task_collection")
+                results = (await response.json())["value"]
+                response.release()
+            except ClientError:
+                if retry == retries - 1:
+                    raise
+                continue
+            # tasks that failed on server errors (or on lost responses) are sent again, a task added by a previous
+            # attempt then exists (as does a task added by a previous submission if exists_ok)
+            failed_ids = set()
+            for result in results:
+                if result["status"] == "success":
+                    continue
+                error = result.get("error") or {}
+                if (retry > 0 or exists_ok) and error.get("code") == "TaskExists":
+                    continue
+                if result["status"] == "servererror" and retry < retries - 1:
+                    failed_ids.add(result["taskId"])
+                    continue
+                raise BatchResponseError(
+                    error.get("code"),
+                    error.get("message") or dict(value=f"task {result['taskId']} was not added"),
+                    error.get("values") or []
+                )
+            if not failed_ids:
+                return
+            task_bodies = [task_body for task_body in task_bodies if task_body["id"] in failed_ids]
+
+    async def add_task_graph(self, job_id, tasks, concurrency=4, exists_ok=False, timeout=None):
+        """
+        Submits a graph of tasks in bulk (add task collection requests): batch schedules a task once its dependencies
+        succeeded, without client round trips. The job must use task dependencies (see add_job).
+
+        The graph is checked locally (see validate_task_graph), then sent in topological order, by collections of
+        at most MAX_TASKS_PER_COLLECTION tasks (and MAX_COLLECTION_SIZE bytes), so that dependencies are always added
+        before (or with) their dependent tasks. Collections that only depend on already added tasks are sent
+        concurrently (at most concurrency requests).
+
+        With exists_ok, tasks that already exist are not errors: a graph may be submitted again after a partial
+        submission (for example after a client crash), the existing tasks are left unchanged.
+
+        Parameters
+        ----------
+        job_id: str
+        tasks: list of dicts
+            id, command_line, environment_settings (optional), output_files (optional), depends_on (optional, list of
+            task ids of the graph), depends_on_ranges (optional, list of (start, end) of integer task ids, included)
+        concurrency: int
+        exists_ok: bool
+
+        Returns
+        -------
+        list of collections (lists of task ids), in submission order
+        """
+        tasks_by_id, dependencies = _task_graph(tasks)
+        ordered_tasks = _topological_order(tasks_by_id, dependencies)
+
+        collections = []
+        collection, collection_size = [], _COLLECTION_ENVELOPE_SIZE
+        for task in ordered_tasks:
+            task_body = self._task_body(
+                task["id"],
+                task["command_line"],
+                task.get("environment_settings"),
+                task.get("output_files"),
+                task.get("depends_on"),
+                task.get("depends_on_ranges")
+            )
+            # with its separating comma
+            task_size = len(dumpb(task_body)) + 1
+            if collection and (len(collection) == MAX_TASKS_PER_COLLECTION or
+                               collection_size + task_size > MAX_COLLECTION_SIZE):
+                collections.append(collection)
+                collection, collection_size = [], _COLLECTION_ENVELOPE_SIZE
+            collection.append((task, task_body))
+            collection_size += task_size
+        if collection:
+            collections.append(collection)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def add_collection(collection):
+            async with semaphore:
+                await self._add_task_collection(
+                    job_id, [task_body for _, task_body in collection], timeout=timeout, exists_ok=exists_ok)
+
+        # waves of collections only depending on previous waves
+        added_ids = set()
+        wave, wave_ids = [], set()
+        for collection in collections:
+            collection_ids = set(task["id"] for task, _ in collection)
+            available_ids = added_ids | collection_ids
+            if not all(dependencies[task["id"]] <= available_ids for task, _ in collection):
+                await asyncio.gather(*(add_collection(wave_collection) for wave_collection in wave))
+                added_ids |= wave_ids
+                wave, wave_ids = [], set()
+            wave.append(collection)
+            wave_ids |= collection_ids
+        await asyncio.gather(*(add_collection(wave_collection) for wave_collection in wave))
+
+        return [[task["id"] for task, _ in collection] for collection in collections]
+
     async def add_task(
             self,
             job_id,
@@ -96,7 +414,8 @@ class AzureBatchClient:
             command_line,
             environment_settings=None,
             output_files=None,
-            timeout=None
+            timeout=None,
+            depends_on=None
     ):
         """
 
@@ -108,6 +427,7 @@ class AzureBatchClient:
         environment_settings: list
         output_files: list
         timeout
+        depends_on: list of task ids, the task runs once they succeeded (the job must use task dependencies)
 
         Returns
         -------
@@ -122,21 +442,9 @@ class AzureBatchClient:
 
         headers = {}
 
-        json_body = {
-            "id": task_id,
-            "commandLine": command_line,
-            # for now userIdentity is fixed to pool user and admin, can be modified if needed
-            "userIdentity": {
-                "autoUser": {
-                    "scope": "pool",
-                    "elevationLevel": "admin"
-                }
-            },
-            "environmentSettings": [] if environment_settings is None else environment_settings,
-            "outputFiles": [] if output_files is None else output_files
-        }
+        json_body = self._task_body(task_id, command_line, environment_settings, output_files, depends_on)
 
-        response = await self._send("POST", path, parameters, headers, json=json_body)
+        response = await self._send("POST", path, parameters, headers, json=json_body, operation="add_task")
         response.release()
         return response
 
@@ -158,7 +466,7 @@ class AzureBatchClient:
 
         headers = {}
 
-        response = await self._send("GET", path, params, headers)
+        response = await self._send("GET", path, params, headers, operation="get_task")
         ret = await response.json()
         response.release()
 
@@ -175,7 +483,7 @@ class AzureBatchClient:
         params = {"api-version": self.api_version}
         headers = {}
 
-        response = await self._send("GET", path, params, headers)
+        response = await self._send("GET", path, params, headers, operation="list_tasks")
 
         tasks_list = [task['id'] for task in (await response.json())["value"]]
         response.release()
@@ -194,5 +502,5 @@ class AzureBatchClient:
         params = {"api-version": self.api_version}
         headers = {}
 
-        response = await self._send("DELETE", path, params, headers)
+        response = await self._send("DELETE", path, params, headers, operation="delete_task")
         response.release()
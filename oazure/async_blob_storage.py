@@ -1,11 +1,41 @@
 import hashlib, hmac, base64
 import datetime as dt
+import time
+import asyncio
+import random
+import inspect
+import email.utils
 import xml.etree.ElementTree as ET
+from urllib.parse import quote, unquote, urlencode, urlsplit
 
 from aiohttp.client_exceptions import ClientError
 
+from .instrumentation import NULL_INSTRUMENTATION
+from .hedging import hedge
+
 # TODO : reorganize to avoid having the same code everywhere
 
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+# maximum size of an append block
+MAX_APPEND_BLOCK_SIZE = 4 * 1024 * 1024
+# maximum size of a range azure returns the md5 of
+MAX_RANGE_MD5_SIZE = 4 * 1024 * 1024
+
+# standard headers of the shared key string to sign, in order
+_SIGNED_HEADERS = (
+    "Content-Encoding",
+    "Content-Language",
+    "Content-Length",
+    "Content-MD5",
+    "Content-Type",
+    "Date",
+    "If-Modified-Since",
+    "If-Match",
+    "If-None-Match",
+    "If-Unmodified-Since",
+    "Range"
+)
+
 
 class AzureBlobStorageAsyncError(Exception):
     pass
@@ -27,18 +57,178 @@ class AzureBlobStorageLockedFile(AzureBlobStorageAsyncError):
     pass
 
 
+class AzureBlobStorageConditionNotMet(AzureBlobStorageAsyncError):
+    """
+    The etag condition of a request was not met (blob was modified, or already exists).
+    """
+    pass
+
+
+class BlobListener:
+    """
+    Notified by AsyncBlobAPI of the writes and deletes it made (once they succeeded), for example to keep a BlobIndex
+    up to date. This base class does nothing, subclass it and override the hooks you need. Hooks are called from the
+    event loop: they must be cheap and must not raise.
+
+    size: int, None if unknown (block lists, copies)
+    etag: str
+    last_modified: utc datetime, None if unknown
+    """
+    def blob_written(self, container_name, blob_name, size, etag, last_modified):
+        pass
+
+    def blob_deleted(self, container_name, blob_name):
+        pass
+
+    def container_deleted(self, container_name):
+        pass
+
+
 class AsyncBlobAPI:
     
     def __init__(
             self,
             account_name,
             account_key,
+            instrumentation=None,
+            listeners=None,
+            concurrency_limiter=None,
+            rate_limiter=None,
+            hedging=None
     ):
         self.account_name = account_name
         self.account_key = account_key
         self.storage_type = 'blob'
         self.api_version = '2016-05-31'
-    
+        self.instrumentation = NULL_INSTRUMENTATION if instrumentation is None else instrumentation
+        # BlobListener instances
+        self.listeners = list(listeners or ())
+        # AdaptiveConcurrencyLimiter (see get_shared_limiter), all requests go through it
+        self.concurrency_limiter = concurrency_limiter
+        # BlobRateLimiter, requests wait for its budget before being sent
+        self.rate_limiter = rate_limiter
+        # HedgingPolicy of get_blob and get_blob_with_etag requests (opt-in)
+        self.hedging = hedging
+
+    def _notify_written(self, container_name, blob_name, size, response):
+        if not self.listeners:
+            return
+        last_modified = response.headers.get("Last-Modified")
+        if last_modified is not None:
+            last_modified = email.utils.parsedate_to_datetime(last_modified).replace(tzinfo=None)
+        for listener in self.listeners:
+            listener.blob_written(container_name, blob_name, size, response.headers.get("ETag"), last_modified)
+
+    @staticmethod
+    def _parse_url(url):
+        # container, blob (None for container requests)
+        container_name, _, blob_name = unquote(urlsplit(url).path).lstrip("/").partition("/")
+        return container_name, blob_name or None
+
+    async def _wait_rate_limit(self, operation, url, bytes_sent):
+        # returns container and blob names, to charge received bytes
+        container_name, blob_name = self._parse_url(url)
+        delay = await self.rate_limiter.acquire(container_name, blob_name, bytes_sent)
+        self.instrumentation.request_queued("blob", operation, delay)
+        return container_name, blob_name
+
+    async def _send(self, operation, session, method, url, headers, data=None, timeout=None, attempt=0):
+        """
+        Sends one request attempt, all requests go through this method.
+
+        Returns
+        -------
+        response, content: the response is released, its status and headers remain available
+        """
+        bytes_sent = len(data) if isinstance(data, (bytes, bytearray)) else 0
+        if self.rate_limiter is not None:
+            container_name, blob_name = await self._wait_rate_limit(operation, url, bytes_sent)
+        limiter = self.concurrency_limiter
+        if limiter is not None:
+            await limiter.acquire()
+        self.instrumentation.request_started("blob", operation)
+        start = time.monotonic()
+        try:
+            async with session.request(method, url, data=data, headers=headers, timeout=timeout) as response:
+                content = await response.read()
+        except BaseException as e:
+            if limiter is not None:
+                limiter.release(time.monotonic() - start, error=e)
+            if isinstance(e, asyncio.CancelledError):
+                self.instrumentation.request_cancelled("blob", operation, time.monotonic() - start, attempt=attempt)
+            else:
+                self.instrumentation.request_failed("blob", operation, e, time.monotonic() - start, attempt=attempt)
+            raise
+        if limiter is not None:
+            limiter.release(time.monotonic() - start, status=response.status)
+        if self.rate_limiter is not None:
+            self.rate_limiter.consume(container_name, blob_name, len(content))
+        self.instrumentation.request_ended(
+            "blob",
+            operation,
+            response.status,
+            time.monotonic() - start,
+            bytes_sent=bytes_sent,
+            bytes_received=len(content),
+            attempt=attempt
+        )
+        return response, content
+
+    async def _send_hedged(self, operation, session, method, url, headers, timeout=None, attempt=0):
+        """
+        Same as _send, hedged with self.hedging (if any). Only for idempotent requests.
+        """
+        if self.hedging is None:
+            return await self._send(operation, session, method, url, headers, timeout=timeout, attempt=attempt)
+        (response, content), hedged = await hedge(
+            self.hedging,
+            lambda: self._send(operation, session, method, url, headers, timeout=timeout, attempt=attempt)
+        )
+        if hedged:
+            self.instrumentation.request_hedged("blob", operation)
+        return response, content
+
+    def _prepare_request(self, method, container_name, blob_name=None, query=None, headers=None):
+        """
+        Signs a request with the shared key (x-ms-date and x-ms-version headers are added).
+
+        Parameters
+        ----------
+        query: dict of url parameters (not encoded)
+        headers: dict, standard headers (Content-Length, Content-Type, If-Match...) and x-ms-* headers
+
+        Returns
+        -------
+        url, headers
+        """
+        path = quote(
+            "/" + container_name + ("" if blob_name is None else "/" + blob_name),
+            safe="/()$=',~"
+        )
+        headers = dict(headers or ())
+        headers["x-ms-date"] = dt.datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S GMT')
+        headers["x-ms-version"] = self.api_version
+
+        string_to_sign = method.upper() + "\n"
+        for name in _SIGNED_HEADERS:
+            value = headers.get(name, "")
+            # a zero content length is signed as an empty string
+            string_to_sign += ("" if name == "Content-Length" and str(value) == "0" else str(value)) + "\n"
+        for name, value in sorted((name.lower(), value) for name, value in headers.items()):
+            if name.startswith("x-ms-"):
+                string_to_sign += name + ":" + str(value).strip() + "\n"
+        string_to_sign += "/" + self.account_name + path
+        for name, value in sorted((query or {}).items()):
+            string_to_sign += "\n" + name.lower() + ":" + str(value)
+
+        signature = base64.b64encode(hmac.new(base64.b64decode(self.account_key), string_to_sign.encode('utf8'),
+                                              digestmod=hashlib.sha256).digest()).decode('utf-8')
+        headers["Authorization"] = "SharedKey " + self.account_name + ":" + signature
+        url = "https://" + self.account_name + "." + self.storage_type + ".core.windows.net" + path
+        if query:
+            url += "?" + urlencode(query, quote_via=quote)
+        return url, headers
+
     async def get_blob(self, container_name, blob_name, session, timeout=None):
         date = dt.datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S GMT')
         string_to_sign = 'GET\n\n\n\n\n\n\n\n\n\n\n\nx-ms-date:' + date + '\nx-ms-version:' + self.api_version +\
@@ -56,20 +246,21 @@ class AsyncBlobAPI:
         retry = 0
         while True:
             try:
-                async with session.request("get", url, headers=headers, timeout=timeout) as response:
-                    content = await response.read()
-                    if response.status == 200:
-                        return content
-                    elif response.status == 404:
-                        raise AzureBlobStorageResourceNotFound(
+                response, content = await self._send_hedged(
+                    "get_blob", session, "get", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 200:
+                    return content
+                elif response.status == 404:
+                    raise AzureBlobStorageResourceNotFound(
+                        '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
+                                                                         blob_name))
+                else:
+                    retry += 1
+                    if retry > 2:
+                        raise AzureBlobStorageAsyncError(
                             '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
-                                                                             blob_name))
-                    else:
-                        retry += 1
-                        if retry > 2:
-                            raise AzureBlobStorageAsyncError(
-                                '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
-                                                                             blob_name))
+                                                                         blob_name))
             except ClientError:
                 retry += 1
                 if retry > 2:
@@ -104,29 +295,159 @@ class AsyncBlobAPI:
         retry = 0
         while True:
             try:
-                async with session.put(url, data=package, headers=headers, timeout=timeout) as response:
-                    content = await response.read()
-                    if response.status == 201:
-                        return
-                    elif response.status == 412:
-                        raise AzureBlobStorageLockedFile(
+                response, content = await self._send(
+                    "write_blob", session, "put", url, headers, data=package, timeout=timeout, attempt=retry
+                )
+                if response.status == 201:
+                    self._notify_written(container_name, blob_name, len(package), response)
+                    return
+                elif response.status == 412:
+                    raise AzureBlobStorageLockedFile(
+                        '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content),
+                                                                         container_name, blob_name))
+                else:
+                    retry += 1
+                    if retry > 2:
+                        raise AzureBlobStorageAsyncError(
                             '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content),
                                                                              container_name, blob_name))
-                    else:
-                        retry += 1
-                        if retry > 2:
-                            raise AzureBlobStorageAsyncError(
-                                '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content),
-                                                                                 container_name, blob_name))
             except ClientError:
                 retry += 1
                 if retry > 2:
                     raise
     
+    async def get_blob_range(
+            self,
+            container_name,
+            blob_name,
+            start,
+            end,
+            session,
+            if_match=None,
+            range_md5=False,
+            timeout=None
+    ):
+        """
+        Parameters
+        ----------
+        start, end: int, first and last (included) bytes
+        if_match: str, optional
+            etag, raises AzureBlobStorageConditionNotMet if the blob was modified since
+        range_md5: bool
+            if True, azure returns the md5 of the range (at most MAX_RANGE_MD5_SIZE bytes), the content is checked
+            against it (retried on mismatch)
+
+        Returns
+        -------
+        bytes
+        """
+        headers = {"x-ms-range": "bytes={}-{}".format(start, end)}
+        if range_md5:
+            if end - start + 1 > MAX_RANGE_MD5_SIZE:
+                raise ValueError(f"range_md5 requires ranges of at most {MAX_RANGE_MD5_SIZE} bytes")
+            headers["x-ms-range-get-content-md5"] = "true"
+        if if_match is not None:
+            headers["If-Match"] = if_match
+        url, headers = self._prepare_request("GET", container_name, blob_name, headers=headers)
+
+        retry = 0
+        while True:
+            try:
+                response, content = await self._send(
+                    "get_blob_range", session, "get", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status in (200, 206):
+                    if not range_md5 or response.headers.get("Content-MD5") == base64.b64encode(
+                            hashlib.md5(content).digest()).decode("utf-8"):
+                        return content
+                    message = 'Md5Mismatch\nContainer name : {}\nBlob name : {}'.format(container_name, blob_name)
+                    retry += 1
+                    if retry > 2:
+                        raise AzureBlobStorageAsyncError(message)
+                    continue
+                message = '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content),
+                                                                           container_name, blob_name)
+                if response.status == 404:
+                    raise AzureBlobStorageResourceNotFound(message)
+                elif response.status == 412:
+                    raise AzureBlobStorageConditionNotMet(message)
+                retry += 1
+                if retry > 2:
+                    raise AzureBlobStorageAsyncError(message)
+            except ClientError:
+                retry += 1
+                if retry > 2:
+                    raise
+
     async def get_blob_to_text(self, container_name, blob_name, session, encoding='utf-8', timeout=None):
         bytes = await self.get_blob(container_name, blob_name, session, timeout=timeout)
         return bytes.decode(encoding)
 
+    async def iter_blob(self, container_name, blob_name, session, chunk_size=DEFAULT_CHUNK_SIZE, timeout=None):
+        """
+        Downloads a blob by chunks of at most chunk_size bytes (async generator), without loading it in memory. Is not
+        retried.
+        """
+        date = dt.datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S GMT')
+        string_to_sign = 'GET\n\n\n\n\n\n\n\n\n\n\n\nx-ms-date:' + date + '\nx-ms-version:' + self.api_version +\
+                         '\n/' + self.account_name + '/' + container_name + '/' + blob_name
+        signature = base64.b64encode(hmac.new(base64.b64decode(self.account_key), string_to_sign.encode('utf8'),
+                                              digestmod=hashlib.sha256).digest()).decode('utf-8')
+        headers = {
+            "x-ms-date": date,
+            "x-ms-version": self.api_version,
+            "Authorization": "SharedKey " + self.account_name + ":" + signature
+        }
+        url = "https://" + self.account_name + "." + self.storage_type + ".core.windows.net/" + container_name + "/" +\
+              blob_name
+
+        rate_limiter = self.rate_limiter
+        if rate_limiter is not None:
+            await self._wait_rate_limit("iter_blob", url, 0)
+        limiter = self.concurrency_limiter
+        if limiter is not None:
+            await limiter.acquire()
+        self.instrumentation.request_started("blob", "iter_blob")
+        start = time.monotonic()
+        bytes_received = 0
+        try:
+            async with session.request("get", url, headers=headers, timeout=timeout) as response:
+                if response.status == 200:
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        bytes_received += len(chunk)
+                        if rate_limiter is not None:
+                            # the next chunk is read once the bytes budget allows it
+                            delay = rate_limiter.consume(container_name, blob_name, len(chunk))
+                            if delay > 0:
+                                await asyncio.sleep(delay)
+                        yield chunk
+                else:
+                    content = await response.read()
+                    bytes_received = len(content)
+        except BaseException as e:
+            if limiter is not None:
+                # an early close of the generator is not an error of the request
+                limiter.release(
+                    time.monotonic() - start, error=None if isinstance(e, GeneratorExit) else e, status=200)
+            if isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+                self.instrumentation.request_cancelled("blob", "iter_blob", time.monotonic() - start)
+            else:
+                self.instrumentation.request_failed("blob", "iter_blob", e, time.monotonic() - start)
+            raise
+        if limiter is not None:
+            limiter.release(time.monotonic() - start, status=response.status)
+        self.instrumentation.request_ended(
+            "blob", "iter_blob", response.status, time.monotonic() - start, bytes_received=bytes_received)
+
+        if response.status == 404:
+            raise AzureBlobStorageResourceNotFound(
+                '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
+                                                                 blob_name))
+        elif response.status != 200:
+            raise AzureBlobStorageAsyncError(
+                '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
+                                                                 blob_name))
+
     async def write_blob_from_text(
             self,
             text,
@@ -140,6 +461,422 @@ class AsyncBlobAPI:
         package = bytes(text, encoding)
         await self.write_blob(package, container_name, blob_name, session, lock_id=lock_id, timeout=timeout)
 
+    async def get_blob_with_etag(self, container_name, blob_name, session, if_none_match=None, timeout=None):
+        """
+        Parameters
+        ----------
+        if_none_match: str, optional
+            etag, the content is only returned if the blob was modified since
+
+        Returns
+        -------
+        content, etag (content is None if the blob was not modified since if_none_match)
+        """
+        headers = {}
+        if if_none_match is not None:
+            headers["If-None-Match"] = if_none_match
+        url, headers = self._prepare_request("GET", container_name, blob_name, headers=headers)
+
+        retry = 0
+        while True:
+            try:
+                response, content = await self._send_hedged(
+                    "get_blob", session, "get", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 200:
+                    return content, response.headers["ETag"]
+                elif response.status == 304:
+                    return None, response.headers.get("ETag", if_none_match)
+                elif response.status == 404:
+                    raise AzureBlobStorageResourceNotFound(
+                        '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
+                                                                         blob_name))
+                retry += 1
+                if retry > 2:
+                    raise AzureBlobStorageAsyncError(
+                        '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
+                                                                         blob_name))
+            except ClientError:
+                retry += 1
+                if retry > 2:
+                    raise
+
+    async def write_blob_conditional(
+            self,
+            package,
+            container_name,
+            blob_name,
+            session,
+            if_match=None,
+            if_none_match=None,
+            timeout=None
+    ):
+        """
+        Writes a block blob only if its etag matches if_match, or (with if_none_match='*') only if it does not exist.
+        Not retried on failed conditions.
+
+        After a connection error the write may have been applied with its response lost, so the blob is read again:
+        the write is only retried if the blob still meets the conditions, the etag is returned if the blob has the
+        written content, else the connection error is raised (the outcome of the write is unknown).
+
+        Returns
+        -------
+        etag of the written blob
+
+        Raises
+        ------
+        AzureBlobStorageConditionNotMet
+        """
+        headers = {
+            "Content-Length": str(len(package)),
+            "Content-Type": "application/octet-stream",
+            "x-ms-blob-type": "BlockBlob"
+        }
+        if if_match is not None:
+            headers["If-Match"] = if_match
+        if if_none_match is not None:
+            headers["If-None-Match"] = if_none_match
+        url, headers = self._prepare_request("PUT", container_name, blob_name, headers=headers)
+
+        retry = 0
+        while True:
+            try:
+                response, content = await self._send(
+                    "write_blob", session, "put", url, headers, data=package, timeout=timeout, attempt=retry
+                )
+                if response.status == 201:
+                    self._notify_written(container_name, blob_name, len(package), response)
+                    return response.headers["ETag"]
+                error = self.parse_error_code(content)
+                message = '{}\nContainer name : {}\nBlob name : {}'.format(error, container_name, blob_name)
+                if error in ("ConditionNotMet", "BlobAlreadyExists"):
+                    raise AzureBlobStorageConditionNotMet(message)
+                elif response.status == 412:
+                    raise AzureBlobStorageLockedFile(message)
+                elif response.status == 404:
+                    raise AzureBlobStorageResourceNotFound(message)
+                retry += 1
+                if retry > 2:
+                    raise AzureBlobStorageAsyncError(message)
+            except ClientError:
+                retry += 1
+                if retry > 2:
+                    raise
+                if if_match is None and if_none_match is None:
+                    continue
+                # a retry of an applied write would fail on its own write (and update_blob would update twice)
+                try:
+                    current_content, etag = await self.get_blob_with_etag(
+                        container_name, blob_name, session, timeout=timeout)
+                except AzureBlobStorageResourceNotFound:
+                    current_content, etag = None, None
+                if current_content == package:
+                    return etag
+                if not self._conditions_met(etag, if_match, if_none_match):
+                    raise
+
+    @staticmethod
+    def _conditions_met(etag, if_match, if_none_match):
+        # etag is None if the blob does not exist
+        if if_match is not None and (etag is None or if_match not in ("*", etag)):
+            return False
+        if if_none_match is not None and etag is not None and if_none_match in ("*", etag):
+            return False
+        return True
+
+    async def delete_blob_conditional(self, container_name, blob_name, if_match, session, timeout=None):
+        """
+        Deletes a blob (and its snapshots) only if its etag matches if_match.
+
+        Raises
+        ------
+        AzureBlobStorageConditionNotMet
+        """
+        url, headers = self._prepare_request(
+            "DELETE",
+            container_name,
+            blob_name,
+            headers={"If-Match": if_match, "x-ms-delete-snapshots": "include"}
+        )
+
+        retry = 0
+        while True:
+            try:
+                response, content = await self._send(
+                    "delete_blob", session, "delete", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 202:
+                    for listener in self.listeners:
+                        listener.blob_deleted(container_name, blob_name)
+                    return
+                error = self.parse_error_code(content)
+                message = '{}\nContainer name : {}\nBlob name : {}'.format(error, container_name, blob_name)
+                if error == "ConditionNotMet":
+                    raise AzureBlobStorageConditionNotMet(message)
+                elif response.status == 404:
+                    raise AzureBlobStorageResourceNotFound(message)
+                raise AzureBlobStorageAsyncError(message)
+            except ClientError:
+                retry += 1
+                if retry > 2:
+                    raise
+
+    async def update_blob(
+            self,
+            container_name,
+            blob_name,
+            update,
+            session,
+            max_attempts=10,
+            retry_delay=0.05,
+            timeout=None
+    ):
+        """
+        Read-modify-write without lease (optimistic concurrency): reads the blob and its etag, writes update(content)
+        if the blob was not modified in between, else starts again.
+
+        Parameters
+        ----------
+        update: function or coroutine function
+            called with the current content (None if the blob does not exist), returns the new content (bytes)
+        max_attempts: int
+            AzureBlobStorageConditionNotMet is raised after max_attempts conflicts
+        retry_delay: float
+            seconds, maximum random delay before the nth attempt is retry_delay * 2 ** (n - 1)
+
+        Returns
+        -------
+        new content, etag
+        """
+        for attempt in range(max_attempts):
+            if attempt > 0:
+                await asyncio.sleep(random.uniform(0, retry_delay * 2 ** (attempt - 1)))
+            try:
+                content, etag = await self.get_blob_with_etag(container_name, blob_name, session, timeout=timeout)
+            except AzureBlobStorageResourceNotFound:
+                content, etag = None, None
+            new_content = update(content)
+            if inspect.isawaitable(new_content):
+                new_content = await new_content
+            try:
+                etag = await self.write_blob_conditional(
+                    new_content,
+                    container_name,
+                    blob_name,
+                    session,
+                    if_match=etag,
+                    if_none_match="*" if etag is None else None,
+                    timeout=timeout
+                )
+            except AzureBlobStorageConditionNotMet:
+                continue
+            return new_content, etag
+        raise AzureBlobStorageConditionNotMet(
+            'Too many conflicts\nContainer name : {}\nBlob name : {}'.format(container_name, blob_name))
+
+    async def create_append_blob(self, container_name, blob_name, session, if_none_match=None, timeout=None):
+        """
+        Creates an empty append blob (replaces an existing blob, unless if_none_match='*').
+
+        Returns
+        -------
+        etag
+        """
+        headers = {"Content-Length": "0", "x-ms-blob-type": "AppendBlob"}
+        if if_none_match is not None:
+            headers["If-None-Match"] = if_none_match
+        url, headers = self._prepare_request("PUT", container_name, blob_name, headers=headers)
+
+        retry = 0
+        while True:
+            try:
+                response, content = await self._send(
+                    "create_append_blob", session, "put", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 201:
+                    self._notify_written(container_name, blob_name, 0, response)
+                    return response.headers["ETag"]
+                error = self.parse_error_code(content)
+                message = '{}\nContainer name : {}\nBlob name : {}'.format(error, container_name, blob_name)
+                if error in ("ConditionNotMet", "BlobAlreadyExists"):
+                    raise AzureBlobStorageConditionNotMet(message)
+                elif response.status == 412:
+                    raise AzureBlobStorageLockedFile(message)
+                retry += 1
+                if retry > 2:
+                    raise AzureBlobStorageAsyncError(message)
+            except ClientError:
+                retry += 1
+                if retry > 2:
+                    raise
+
+    async def append_block(self, data, container_name, blob_name, session, append_position=None, timeout=None):
+        """
+        Appends data (at most MAX_APPEND_BLOCK_SIZE bytes) to an append blob.
+
+        Parameters
+        ----------
+        append_position: int, optional
+            if given, data is only appended if the blob size is append_position (else AzureBlobStorageConditionNotMet
+            is raised), which makes retries safe
+
+        Returns
+        -------
+        offset at which data was appended
+        """
+        headers = {"Content-Length": str(len(data)), "Content-Type": "application/octet-stream"}
+        if append_position is not None:
+            headers["x-ms-blob-condition-appendpos"] = str(append_position)
+        url, headers = self._prepare_request(
+            "PUT", container_name, blob_name, query=dict(comp="appendblock"), headers=headers)
+
+        retry = 0
+        while True:
+            try:
+                response, content = await self._send(
+                    "append_block", session, "put", url, headers, data=data, timeout=timeout, attempt=retry
+                )
+                if response.status == 201:
+                    self._notify_written(container_name, blob_name, None, response)
+                    return int(response.headers["x-ms-blob-append-offset"])
+                error = self.parse_error_code(content)
+                message = '{}\nContainer name : {}\nBlob name : {}'.format(error, container_name, blob_name)
+                if error == "AppendPositionConditionNotMet":
+                    raise AzureBlobStorageConditionNotMet(message)
+                elif response.status == 404:
+                    raise AzureBlobStorageResourceNotFound(message)
+                retry += 1
+                if retry > 2:
+                    raise AzureBlobStorageAsyncError(message)
+            except ClientError:
+                retry += 1
+                if retry > 2:
+                    raise
+
+    async def put_block(self, data, container_name, blob_name, block_id, session, content_md5=None, timeout=None):
+        """
+        Uploads a block of a block blob, it is committed by put_block_list.
+
+        Parameters
+        ----------
+        block_id: str
+            base64 encoded, all block ids of a blob must have the same length (see make_block_id)
+        content_md5: str, optional
+            base64 encoded md5 of data, azure rejects the block if it does not match
+        """
+        headers = {"Content-Length": str(len(data)), "Content-Type": "application/octet-stream"}
+        if content_md5 is not None:
+            headers["Content-MD5"] = content_md5
+        url, headers = self._prepare_request(
+            "PUT",
+            container_name,
+            blob_name,
+            query=dict(comp="block", blockid=block_id),
+            headers=headers
+        )
+
+        retry = 0
+        while True:
+            try:
+                response, content = await self._send(
+                    "put_block", session, "put", url, headers, data=data, timeout=timeout, attempt=retry
+                )
+                if response.status == 201:
+                    return
+                retry += 1
+                if retry > 2:
+                    raise AzureBlobStorageAsyncError(
+                        '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content),
+                                                                         container_name, blob_name))
+            except ClientError:
+                retry += 1
+                if retry > 2:
+                    raise
+
+    async def put_block_list(self, block_ids, container_name, blob_name, session, content_md5=None, timeout=None):
+        """
+        Commits uploaded blocks (in the given order) as the content of the blob.
+
+        Parameters
+        ----------
+        content_md5: str, optional
+            base64 encoded md5 of the whole blob, stored as its Content-MD5 property
+        """
+        body = (
+            '<?xml version="1.0" encoding="utf-8"?><BlockList>' +
+            "".join("<Latest>" + block_id + "</Latest>" for block_id in block_ids) +
+            "</BlockList>"
+        ).encode("utf-8")
+        headers = {"Content-Length": str(len(body)), "Content-Type": "application/xml"}
+        if content_md5 is not None:
+            headers["x-ms-blob-content-md5"] = content_md5
+        url, headers = self._prepare_request(
+            "PUT",
+            container_name,
+            blob_name,
+            query=dict(comp="blocklist"),
+            headers=headers
+        )
+
+        retry = 0
+        while True:
+            try:
+                response, content = await self._send(
+                    "put_block_list", session, "put", url, headers, data=body, timeout=timeout, attempt=retry
+                )
+                if response.status == 201:
+                    self._notify_written(container_name, blob_name, None, response)
+                    return
+                retry += 1
+                if retry > 2:
+                    raise AzureBlobStorageAsyncError(
+                        '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content),
+                                                                         container_name, blob_name))
+            except ClientError:
+                retry += 1
+                if retry > 2:
+                    raise
+
+    async def get_block_list(self, container_name, blob_name, session, block_list_type="uncommitted", timeout=None):
+        """
+        Parameters
+        ----------
+        block_list_type: 'committed', 'uncommitted' (uploaded by put_block, not committed yet) or 'all'
+
+        Returns
+        -------
+        list of (block id, size), empty if the blob does not exist
+        """
+        url, headers = self._prepare_request(
+            "GET", container_name, blob_name, query=dict(comp="blocklist", blocklisttype=block_list_type))
+
+        retry = 0
+        while True:
+            try:
+                response, content = await self._send(
+                    "get_block_list", session, "get", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 404:
+                    return []
+                if response.status != 200:
+                    raise AzureBlobStorageAsyncError(
+                        '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content),
+                                                                         container_name, blob_name))
+                break
+            except ClientError:
+                retry += 1
+                if retry > 2:
+                    raise
+
+        return [
+            (block_element.findtext('Name'), int(block_element.findtext('Size')))
+            for block_element in ET.fromstring(content.decode('utf-8')).iter('Block')
+        ]
+
+    @staticmethod
+    def make_block_id(index):
+        return base64.b64encode("{:08d}".format(index).encode("utf-8")).decode("utf-8")
+
     async def delete_container(self, container_name, session, timeout=None):
         date = dt.datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S GMT')
         string_to_sign = 'DELETE\n\n\n\n\n\n\n\n\n\n\n\nx-ms-date:' + date + '\nx-ms-version:' + self.api_version +\
@@ -157,13 +894,16 @@ class AsyncBlobAPI:
         retry = 0
         while True:
             try:
-                async with session.delete(url, headers=headers, timeout=timeout) as response:
-                    content = await response.read()
-                    if response.status == 202:
-                        return
-                    else:
-                        raise AzureBlobStorageAsyncError(
-                            '{}\nContainer name : {}'.format(self.parse_error_code(content), container_name))
+                response, content = await self._send(
+                    "delete_container", session, "delete", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 202:
+                    for listener in self.listeners:
+                        listener.container_deleted(container_name)
+                    return
+                else:
+                    raise AzureBlobStorageAsyncError(
+                        '{}\nContainer name : {}'.format(self.parse_error_code(content), container_name))
             except ClientError:
                 retry += 1
                 if retry > 2:
@@ -187,58 +927,45 @@ class AsyncBlobAPI:
         retry = 0
         while True:
             try:
-                async with session.put(url, headers=headers, timeout=timeout) as response:
-                    content = await response.read()
-                    if response.status == 201:
-                        return
-                    else:
-                        error = self.parse_error_code(content)
-                        if error == 'ContainerAlreadyExists':
-                            raise FileExistsError('{}\nContainer name : {}'.format(error, container_name))
-                        raise AzureBlobStorageAsyncError(
-                            '{}\nContainer name : {}'.format(error, container_name))
+                response, content = await self._send(
+                    "create_container", session, "put", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 201:
+                    return
+                else:
+                    error = self.parse_error_code(content)
+                    if error == 'ContainerAlreadyExists':
+                        raise FileExistsError('{}\nContainer name : {}'.format(error, container_name))
+                    raise AzureBlobStorageAsyncError(
+                        '{}\nContainer name : {}'.format(error, container_name))
             except ClientError:
                 retry += 1
                 if retry > 2:
                     raise
 
     async def delete_blob(self, container_name, blob_name, session, lock_id=None, timeout=None):
-        date = dt.datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S GMT')
-
-        headers = {
-            "x-ms-date": date,
-            "x-ms-version": self.api_version,
-            "x-ms-delete-snapshots": 'include'
-        }
+        headers = {"x-ms-delete-snapshots": "include"}
         if lock_id is not None:
             headers['x-ms-lease-id'] = lock_id
-        url = "https://" + self.account_name + "." + self.storage_type + ".core.windows.net/" + container_name + '/' +\
-              blob_name
-
-        string_to_sign = 'DELETE\n\n\n\n\n\n\n\n\n\n\n'
-        for key, val in sorted(headers.items()):
-            string_to_sign += '\n' + key + ':' + val
-        string_to_sign += '\n/' + self.account_name + '/' + container_name + '/' + blob_name
-
-        signature = base64.b64encode(hmac.new(base64.b64decode(self.account_key), string_to_sign.encode('utf8'),
-                                              digestmod=hashlib.sha256).digest()).decode('utf-8')
-
-        headers["Authorization"] = "SharedKey " + self.account_name + ":" + signature
+        url, headers = self._prepare_request("DELETE", container_name, blob_name, headers=headers)
 
         retry = 0
         while True:
             try:
-                async with session.delete(url, headers=headers, timeout=timeout) as response:
-                    content = await response.read()
-                    if response.status == 202:
-                        return
-                    elif response.status == 404:
-                        raise AzureBlobStorageResourceNotFound('{}\nContainer name : {}\nBlob name : {}'.format(
-                            self.parse_error_code(content), container_name, blob_name))
-                    else:
-                        raise AzureBlobStorageAsyncError(
-                            '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
-                                                                             blob_name))
+                response, content = await self._send(
+                    "delete_blob", session, "delete", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 202:
+                    for listener in self.listeners:
+                        listener.blob_deleted(container_name, blob_name)
+                    return
+                elif response.status == 404:
+                    raise AzureBlobStorageResourceNotFound('{}\nContainer name : {}\nBlob name : {}'.format(
+                        self.parse_error_code(content), container_name, blob_name))
+                else:
+                    raise AzureBlobStorageAsyncError(
+                        '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
+                                                                         blob_name))
             except ClientError:
                 retry += 1
                 if retry > 2:
@@ -272,12 +999,13 @@ class AsyncBlobAPI:
         retry = 0
         while True:
             try:
-                async with session.request("get", url, headers=headers, timeout=timeout) as response:
-                    content = await response.read()
-                    if response.status != 200:
-                        raise AzureBlobStorageAsyncError(
-                            '{}\nContainer name : {}'.format(self.parse_error_code(content), container_name))
-                    break
+                response, content = await self._send(
+                    "list_blobs", session, "get", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status != 200:
+                    raise AzureBlobStorageAsyncError(
+                        '{}\nContainer name : {}'.format(self.parse_error_code(content), container_name))
+                break
             except ClientError:
                 retry += 1
                 if retry > 2:
@@ -291,6 +1019,83 @@ class AsyncBlobAPI:
             names_list.append(blob_element.findtext('Name'))
         return next_marker, names_list
 
+    async def list_blobs_properties(
+            self,
+            container_name,
+            session,
+            marker=None,
+            maxresults=None,
+            prefix=None,
+            timeout=None
+    ):
+        """
+        Same as list_blobs, with blob properties.
+
+        Returns
+        -------
+        next_marker, list of dicts: name, size, etag, content_md5 (base64, None if unknown), last_modified (utc
+            datetime)
+        """
+        query = dict(restype="container", comp="list")
+        if marker is not None:
+            query["marker"] = marker
+        if maxresults is not None:
+            query["maxresults"] = maxresults
+        if prefix is not None:
+            query["prefix"] = prefix
+        url, headers = self._prepare_request("GET", container_name, query=query)
+
+        retry = 0
+        while True:
+            try:
+                response, content = await self._send(
+                    "list_blobs", session, "get", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status != 200:
+                    raise AzureBlobStorageAsyncError(
+                        '{}\nContainer name : {}'.format(self.parse_error_code(content), container_name))
+                break
+            except ClientError:
+                retry += 1
+                if retry > 2:
+                    raise
+
+        list_element = ET.fromstring(content.decode('utf-8'))
+        blobs = []
+        blobs_element = list_element.find('Blobs')
+        if blobs_element is not None:
+            for blob_element in blobs_element.findall('Blob'):
+                properties_element = blob_element.find('Properties')
+                blobs.append(dict(
+                    name=blob_element.findtext('Name'),
+                    size=int(properties_element.findtext('Content-Length')),
+                    etag=properties_element.findtext('Etag'),
+                    content_md5=properties_element.findtext('Content-MD5') or None,
+                    last_modified=email.utils.parsedate_to_datetime(
+                        properties_element.findtext('Last-Modified')).replace(tzinfo=None)
+                ))
+        return list_element.findtext('NextMarker') or None, blobs
+
+    async def iter_blobs(self, container_name, session, prefix=None, page_size=None, timeout=None):
+        """
+        Iterates on all blobs of a container (async generator), see list_blobs_properties. Pages are requested one at a
+        time.
+        """
+        marker = None
+        while True:
+            marker, blobs = await self.list_blobs_properties(
+                container_name,
+                session,
+                marker=marker,
+                maxresults=page_size,
+                prefix=prefix,
+                timeout=timeout
+            )
+            for blob in blobs:
+                yield blob
+            if marker is None:
+                return
+
     # Takes 2.1 seconds for a 5000 blob container
     async def container_size(self, container_name, session, timeout=None):
         date = dt.datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S GMT')
@@ -309,13 +1114,13 @@ class AsyncBlobAPI:
         retry = 0
         while True:
             try:
-                async with session.request("get", url, headers=headers, timeout=timeout) as response:
-                    content = await response.read()
-                    if response.status != 200:
-                        raise AzureBlobStorageAsyncError(
-                            '{}\nContainer name : {}'.format(self.parse_error_code(content), container_name))
-                    xml_ans = await response.read()
-                    break
+                response, content = await self._send(
+                    "container_size", session, "get", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status != 200:
+                    raise AzureBlobStorageAsyncError(
+                        '{}\nContainer name : {}'.format(self.parse_error_code(content), container_name))
+                break
             except ClientError:
                 retry += 1
                 if retry > 2:
@@ -347,14 +1152,15 @@ class AsyncBlobAPI:
         retry = 0
         while True:
             try:
-                async with session.request("head", url, headers=headers, timeout=timeout) as response:
-                    content = await response.read()
-                    if response.status == 200:
-                        return int(response.headers['content-length'])
-                    else:
-                        raise AzureBlobStorageAsyncError(
-                            '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
-                                                                             blob_name))
+                response, content = await self._send(
+                    "get_blob_size", session, "head", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 200:
+                    return int(response.headers['content-length'])
+                else:
+                    raise AzureBlobStorageAsyncError(
+                        '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
+                                                                         blob_name))
             except ClientError:
                 retry += 1
                 if retry > 2:
@@ -382,27 +1188,28 @@ class AsyncBlobAPI:
         retry = 0
         while True:
             try:
-                async with session.request("put", url, headers=headers, timeout=timeout) as response:
-                    content = await response.read()
-                    if response.status == 201:
-                        return response.headers['X-Ms-Lease-Id']
-                    elif response.status == 404:
-                        raise AzureBlobStorageResourceNotFound('{}\nContainer name : {}\nBlob name : {}'.format(
-                            'The requested blob was not found',
-                            container_name,
-                            blob_name
-                        ))
-                    elif response.status == 409:
-                        # blob is already leased
-                        raise AzureBlobStorageAlreadyLeased('{}\nContainer name : {}\nBlob name : {}'.format(
-                            'The blob is already leased',
-                            container_name,
-                            blob_name
-                        ))
-                    else:
-                        raise AzureBlobStorageAsyncError(
-                            '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
-                                                                             blob_name))
+                response, content = await self._send(
+                    "acquire_lease", session, "put", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 201:
+                    return response.headers['X-Ms-Lease-Id']
+                elif response.status == 404:
+                    raise AzureBlobStorageResourceNotFound('{}\nContainer name : {}\nBlob name : {}'.format(
+                        'The requested blob was not found',
+                        container_name,
+                        blob_name
+                    ))
+                elif response.status == 409:
+                    # blob is already leased
+                    raise AzureBlobStorageAlreadyLeased('{}\nContainer name : {}\nBlob name : {}'.format(
+                        'The blob is already leased',
+                        container_name,
+                        blob_name
+                    ))
+                else:
+                    raise AzureBlobStorageAsyncError(
+                        '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
+                                                                         blob_name))
             except ClientError:
                 retry += 1
                 if retry > 2:
@@ -429,17 +1236,18 @@ class AsyncBlobAPI:
         retry = 0
         while True:
             try:
-                async with session.request("put", url, headers=headers, timeout=timeout) as response:
-                    content = await response.read()
-                    if response.status == 200:
-                        return
-                    elif response.status == 404:
-                        raise AzureBlobStorageResourceNotFound('{}\nContainer name : {}\nBlob name : {}'.format(
-                            self.parse_error_code(content), container_name, blob_name))
-                    else:
-                        raise AzureBlobStorageAsyncError(
-                            '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
-                                                                             blob_name))
+                response, content = await self._send(
+                    "release_lease", session, "put", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 200:
+                    return
+                elif response.status == 404:
+                    raise AzureBlobStorageResourceNotFound('{}\nContainer name : {}\nBlob name : {}'.format(
+                        self.parse_error_code(content), container_name, blob_name))
+                else:
+                    raise AzureBlobStorageAsyncError(
+                        '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
+                                                                         blob_name))
             except ClientError:
                 retry += 1
                 if retry > 2:
@@ -466,17 +1274,18 @@ class AsyncBlobAPI:
         retry = 0
         while True:
             try:
-                async with session.request("put", url, headers=headers, timeout=timeout) as response:
-                    content = await response.read()
-                    if response.status == 200:
-                        return
-                    elif response.status == 409:
-                        # blob is already leased
-                        raise AzureBlobStorageAlreadyLeased('The blob is already leased')
-                    else:
-                        raise AzureBlobStorageAsyncError(
-                            '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
-                                                                             blob_name))
+                response, content = await self._send(
+                    "renew_lease", session, "put", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 200:
+                    return
+                elif response.status == 409:
+                    # blob is already leased
+                    raise AzureBlobStorageAlreadyLeased('The blob is already leased')
+                else:
+                    raise AzureBlobStorageAsyncError(
+                        '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content), container_name,
+                                                                         blob_name))
             except ClientError:
                 retry += 1
                 if retry > 2:
@@ -505,19 +1314,113 @@ class AsyncBlobAPI:
         retry = 0
         while True:
             try:
-                async with session.request("put", url, headers=headers, timeout=timeout) as response:
-                    content = await response.read()
-                    if response.status == 202:
-                        return response.headers['x-ms-copy-status'], response.headers['x-ms-copy-id']
-                    else:
-                        raise AzureBlobStorageAsyncError(
-                            '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content),
-                                                                             dest_container_name, dest_blob_name))
+                response, content = await self._send(
+                    "copy_blob", session, "put", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 202:
+                    self._notify_written(dest_container_name, dest_blob_name, None, response)
+                    return response.headers['x-ms-copy-status'], response.headers['x-ms-copy-id']
+                else:
+                    raise AzureBlobStorageAsyncError(
+                        '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content),
+                                                                         dest_container_name, dest_blob_name))
+            except ClientError:
+                retry += 1
+                if retry > 2:
+                    raise
+
+    async def get_blob_properties(self, container_name, blob_name, session, timeout=None):
+        """
+        Returns
+        -------
+        dict: size, etag, content_md5 (None if unknown), last_modified (utc datetime), copy_status (None if the blob
+            was not copied)
+        """
+        url, headers = self._prepare_request("HEAD", container_name, blob_name)
+
+        retry = 0
+        while True:
+            try:
+                response, content = await self._send(
+                    "get_blob_properties", session, "head", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 200:
+                    return dict(
+                        size=int(response.headers["Content-Length"]),
+                        etag=response.headers.get("ETag"),
+                        content_md5=response.headers.get("Content-MD5"),
+                        last_modified=email.utils.parsedate_to_datetime(
+                            response.headers["Last-Modified"]).replace(tzinfo=None),
+                        copy_status=response.headers.get("x-ms-copy-status")
+                    )
+                elif response.status == 404:
+                    raise AzureBlobStorageResourceNotFound(
+                        'BlobNotFound\nContainer name : {}\nBlob name : {}'.format(container_name, blob_name))
+                raise AzureBlobStorageAsyncError(
+                    '{}\nContainer name : {}\nBlob name : {}'.format(response.status, container_name, blob_name))
+            except ClientError:
+                retry += 1
+                if retry > 2:
+                    raise
+
+    async def copy_blob_from_url(self, source_url, dest_container_name, dest_blob_name, session, timeout=None):
+        """
+        Server side copy of a blob of any account (source_url must be readable: public or with a SAS token, see
+        oazure.sas). The copy may still be pending when this returns (see get_blob_properties copy_status).
+
+        Returns
+        -------
+        copy status, copy id
+        """
+        url, headers = self._prepare_request(
+            "PUT", dest_container_name, dest_blob_name, headers={"x-ms-copy-source": source_url})
+
+        retry = 0
+        while True:
+            try:
+                response, content = await self._send(
+                    "copy_blob", session, "put", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 202:
+                    self._notify_written(dest_container_name, dest_blob_name, None, response)
+                    return response.headers['x-ms-copy-status'], response.headers['x-ms-copy-id']
+                raise AzureBlobStorageAsyncError(
+                    '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content),
+                                                                     dest_container_name, dest_blob_name))
             except ClientError:
                 retry += 1
                 if retry > 2:
                     raise
 
+    async def abort_copy_blob(self, container_name, blob_name, copy_id, session, timeout=None):
+        """
+        Aborts a pending copy (see copy_blob_from_url), the destination blob is left empty.
+        """
+        url, headers = self._prepare_request(
+            "PUT",
+            container_name,
+            blob_name,
+            query=dict(comp="copy", copyid=copy_id),
+            headers={"x-ms-copy-action": "abort"}
+        )
+
+        retry = 0
+        while True:
+            try:
+                response, content = await self._send(
+                    "abort_copy_blob", session, "put", url, headers, timeout=timeout, attempt=retry
+                )
+                if response.status == 204:
+                    return
+                message = '{}\nContainer name : {}\nBlob name : {}'.format(self.parse_error_code(content),
+                                                                           container_name, blob_name)
+                if response.status == 404:
+                    raise AzureBlobStorageResourceNotFound(message)
+                raise AzureBlobStorageAsyncError(message)
+            except ClientError:
+                retry += 1
+                if retry > 2:
+                    raise
 
     @staticmethod
     def parse_error_code(error):
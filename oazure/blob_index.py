@@ -0,0 +1,208 @@
+import time
+import sqlite3
+import datetime as dt
+
+from .async_blob_storage import BlobListener
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    container TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER,
+    etag TEXT,
+    content_md5 TEXT,
+    last_modified TEXT,
+    PRIMARY KEY (container, name)
+);
+CREATE TABLE IF NOT EXISTS refreshes (
+    container TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    refreshed REAL NOT NULL,
+    PRIMARY KEY (container, prefix)
+);
+"""
+
+_COLUMNS = ("name", "size", "etag", "content_md5", "last_modified")
+
+
+def _prefix_condition(prefix, column="name"):
+    # range of a prefix (uses the primary key index, unlike LIKE)
+    if not prefix:
+        return "", ()
+    return f" AND {column} >= ? AND {column} < ?", (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def _to_row(blob):
+    last_modified = blob["last_modified"]
+    return (
+        blob["name"],
+        blob["size"],
+        blob["etag"],
+        blob.get("content_md5"),
+        None if last_modified is None else last_modified.isoformat()
+    )
+
+
+def _from_row(row):
+    blob = dict(zip(_COLUMNS, row))
+    if blob["last_modified"] is not None:
+        blob["last_modified"] = dt.datetime.fromisoformat(blob["last_modified"])
+    return blob
+
+
+class BlobIndex(BlobListener):
+    """
+    Local index (sqlite file) of container listings: name, size, etag, content md5 and last modified date of blobs.
+
+    refresh lists prefixes again. Add the index to the listeners of an AsyncBlobAPI to keep it up to date with the
+    writes and deletes of this api (sizes of blobs written by block lists or copies are unknown until the next refresh
+    of their prefix). Writes of other clients are only seen by refreshes.
+
+    Queries (blobs, get, exists, size, count) are local. The index is used from the event loop thread.
+    """
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(_SCHEMA)
+        # container: [running refreshes nb, events received during refreshes]
+        self._journals = {}
+
+    def close(self):
+        self._connection.close()
+
+    def refreshed_at(self, container_name, prefix=""):
+        """
+        Returns
+        -------
+        time.time() of the last refresh of prefix or of an including prefix, None if never refreshed
+        """
+        rows = self._connection.execute(
+            "SELECT prefix, refreshed FROM refreshes WHERE container = ?", (container_name,)).fetchall()
+        refreshes = [refreshed for refreshed_prefix, refreshed in rows if prefix.startswith(refreshed_prefix)]
+        return max(refreshes) if refreshes else None
+
+    async def refresh(self, blob_api, container_name, session, prefixes=("",), max_age=None, page_size=None):
+        """
+        Lists prefixes again and replaces their blobs in the index.
+
+        Parameters
+        ----------
+        prefixes: iterable of str, '' is the whole container
+        max_age: float, optional
+            prefixes refreshed less than max_age seconds ago are skipped
+
+        Returns
+        -------
+        list of refreshed prefixes
+        """
+        refreshed = []
+        for prefix in prefixes:
+            if max_age is not None:
+                refreshed_at = self.refreshed_at(container_name, prefix)
+                if refreshed_at is not None and time.time() - refreshed_at < max_age:
+                    continue
+            await self._refresh_prefix(blob_api, container_name, session, prefix, page_size)
+            refreshed.append(prefix)
+        return refreshed
+
+    async def _refresh_prefix(self, blob_api, container_name, session, prefix, page_size):
+        start = time.time()
+        journal = self._journals.setdefault(container_name, [0, []])
+        journal[0] += 1
+        journal_start = len(journal[1])
+        try:
+            blobs = blob_api.iter_blobs(container_name, session, prefix=prefix or None, page_size=page_size)
+            rows = [_to_row(blob) async for blob in blobs]
+        finally:
+            # writes and deletes that happened while listing may be missing from the listing, they are applied again
+            events = journal[1][journal_start:]
+            journal[0] -= 1
+            if journal[0] == 0:
+                del self._journals[container_name]
+        condition, parameters = _prefix_condition(prefix)
+        with self._connection:
+            self._connection.execute(
+                f"DELETE FROM blobs WHERE container = ?{condition}", (container_name,) + parameters)
+            self._connection.executemany(
+                "INSERT INTO blobs VALUES (?, ?, ?, ?, ?, ?)", ((container_name,) + row for row in rows))
+            # included prefixes are refreshed too
+            condition, parameters = _prefix_condition(prefix, column="prefix")
+            self._connection.execute(
+                f"DELETE FROM refreshes WHERE container = ?{condition}", (container_name,) + parameters)
+            self._connection.execute("INSERT INTO refreshes VALUES (?, ?, ?)", (container_name, prefix, start))
+        for method, args in events:
+            if args[1].startswith(prefix):
+                method(*args)
+
+    def _journal(self, method, args):
+        journal = self._journals.get(args[0])
+        if journal is not None:
+            journal[1].append((method, args))
+
+    def blob_written(self, container_name, blob_name, size, etag, last_modified):
+        self._journal(self.blob_written, (container_name, blob_name, size, etag, last_modified))
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)",
+                (container_name,) + _to_row(dict(
+                    name=blob_name,
+                    size=size,
+                    etag=etag,
+                    last_modified=last_modified
+                ))
+            )
+
+    def blob_deleted(self, container_name, blob_name):
+        self._journal(self.blob_deleted, (container_name, blob_name))
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM blobs WHERE container = ? AND name = ?", (container_name, blob_name))
+
+    def container_deleted(self, container_name):
+        with self._connection:
+            self._connection.execute("DELETE FROM blobs WHERE container = ?", (container_name,))
+            self._connection.execute("DELETE FROM refreshes WHERE container = ?", (container_name,))
+
+    def blobs(self, container_name, prefix=""):
+        """
+        Returns
+        -------
+        list of dicts (same as AsyncBlobAPI.list_blobs_properties), sorted by name
+        """
+        condition, parameters = _prefix_condition(prefix)
+        return [_from_row(row) for row in self._connection.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM blobs WHERE container = ?{condition} ORDER BY name",
+            (container_name,) + parameters
+        )]
+
+    def get(self, container_name, blob_name):
+        """
+        Returns
+        -------
+        dict (see blobs), None if the blob is not indexed
+        """
+        row = self._connection.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM blobs WHERE container = ? AND name = ?",
+            (container_name, blob_name)
+        ).fetchone()
+        return None if row is None else _from_row(row)
+
+    def exists(self, container_name, blob_name):
+        return self._connection.execute(
+            "SELECT 1 FROM blobs WHERE container = ? AND name = ?", (container_name, blob_name)).fetchone() is not None
+
+    def count(self, container_name, prefix=""):
+        condition, parameters = _prefix_condition(prefix)
+        return self._connection.execute(
+            f"SELECT COUNT(*) FROM blobs WHERE container = ?{condition}", (container_name,) + parameters).fetchone()[0]
+
+    def size(self, container_name, prefix=""):
+        """
+        Total size of the blobs of prefix (blobs of unknown size are ignored), local version of
+        AsyncBlobAPI.container_size.
+        """
+        condition, parameters = _prefix_condition(prefix)
+        return self._connection.execute(
+            f"SELECT COALESCE(SUM(size), 0) FROM blobs WHERE container = ?{condition}",
+            (container_name,) + parameters
+        ).fetchone()[0]
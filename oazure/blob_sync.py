@@ -0,0 +1,548 @@
+import os
+import asyncio
+import base64
+import hashlib
+import calendar
+
+from .async_blob_storage import DEFAULT_CHUNK_SIZE, MAX_RANGE_MD5_SIZE, AzureBlobStorageAsyncError
+from .snippets.ojson import dumpb, loads
+
+DEFAULT_CONCURRENCY = 8
+# files above are uploaded by blocks (put_block, at most 100MB with the api version of AsyncBlobAPI)
+DEFAULT_BLOCK_SIZE = DEFAULT_CHUNK_SIZE
+# downloaded files are written there, then renamed
+PARTIAL_SUFFIX = ".oazure-part"
+# progress of resumable transfers, next to their local file
+CHECKPOINT_SUFFIX = ".oazure-checkpoint"
+
+
+class SyncPlan:
+    """
+    transfers: list of (blob_name, path, size) to transfer
+    unchanged: list of blob names that are up to date
+    """
+    def __init__(self):
+        self.transfers = []
+        self.unchanged = []
+
+    @property
+    def transfer_size(self):
+        return sum(size for _, _, size in self.transfers)
+
+    def __repr__(self):
+        return f"<SyncPlan: {len(self.transfers)} transfers ({self.transfer_size} bytes), " \
+               f"{len(self.unchanged)} unchanged>"
+
+
+def _normalize_prefix(prefix):
+    if not prefix or prefix.endswith("/"):
+        return prefix or ""
+    return prefix + "/"
+
+
+def _walk(local_dir):
+    # relative name (/ separated): path, size, mtime (blocking, see _walk_async), empty if local_dir does not exist
+    files = {}
+    for directory, _, file_names in os.walk(local_dir):
+        for file_name in file_names:
+            if file_name.endswith((PARTIAL_SUFFIX, CHECKPOINT_SUFFIX)):
+                continue
+            path = os.path.join(directory, file_name)
+            stat = os.stat(path)
+            files[os.path.relpath(path, local_dir).replace(os.sep, "/")] = (path, stat.st_size, stat.st_mtime)
+    return files
+
+
+async def _walk_async(local_dir):
+    return await asyncio.get_event_loop().run_in_executor(None, _walk, local_dir)
+
+
+def _local_path(local_dir, blob_name):
+    # path of a downloaded blob, which must not escape local_dir (.. or absolute segments)
+    root = os.path.abspath(local_dir)
+    path = os.path.normpath(os.path.join(root, *blob_name.split("/")))
+    if os.path.commonpath([root, path]) != root or path == root:
+        raise ValueError(f"blob {blob_name} would be downloaded outside of {local_dir}")
+    return path
+
+
+def _md5(path):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DEFAULT_CHUNK_SIZE), b""):
+            md5.update(chunk)
+    return base64.b64encode(md5.digest()).decode("utf-8")
+
+
+def _md5_bytes(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode("utf-8")
+
+
+def _timestamp(utc_datetime):
+    return calendar.timegm(utc_datetime.utctimetuple())
+
+
+async def _list(blob_api, container_name, prefix, session):
+    # relative name: blob properties
+    return dict([
+        (blob["name"][len(prefix):], blob)
+        async for blob in blob_api.iter_blobs(container_name, session, prefix=prefix or None)
+    ])
+
+
+async def _same_md5(path, blob):
+    return await asyncio.get_event_loop().run_in_executor(None, _md5, path) == blob["content_md5"]
+
+
+async def plan_upload(blob_api, local_dir, container_name, prefix, session, checksum=False):
+    """
+    A file is transferred if its blob does not exist, has another size, or is older than the file. With checksum=True,
+    the md5 of files is compared to the one of blobs instead of dates, when blobs have one.
+
+    Returns
+    -------
+    SyncPlan
+    """
+    prefix = _normalize_prefix(prefix)
+    blobs = await _list(blob_api, container_name, prefix, session)
+    plan = SyncPlan()
+    for name, (path, size, mtime) in sorted((await _walk_async(local_dir)).items()):
+        blob = blobs.get(name)
+        if blob is None or blob["size"] != size:
+            changed = True
+        elif checksum and blob["content_md5"] is not None:
+            changed = not await _same_md5(path, blob)
+        else:
+            changed = mtime > _timestamp(blob["last_modified"])
+        if changed:
+            plan.transfers.append((prefix + name, path, size))
+        else:
+            plan.unchanged.append(prefix + name)
+    return plan
+
+
+async def _plan_download(blob_api, container_name, prefix, local_dir, session, checksum):
+    # returns plan and blobs (blob name: properties)
+    prefix = _normalize_prefix(prefix)
+    blobs = await _list(blob_api, container_name, prefix, session)
+    files = await _walk_async(local_dir)
+    plan = SyncPlan()
+    for name, blob in sorted(blobs.items()):
+        if not name or name.endswith("/"):
+            # not a file
+            continue
+        path, size, mtime = files.get(name) or (_local_path(local_dir, name), None, None)
+        if size is None or blob["size"] != size:
+            changed = True
+        elif checksum and blob["content_md5"] is not None:
+            changed = not await _same_md5(path, blob)
+        else:
+            changed = int(mtime) != _timestamp(blob["last_modified"])
+        if changed:
+            plan.transfers.append((prefix + name, path, blob["size"]))
+        else:
+            plan.unchanged.append(prefix + name)
+    return plan, dict((prefix + name, blob) for name, blob in blobs.items())
+
+
+async def plan_download(blob_api, container_name, prefix, local_dir, session, checksum=False):
+    """
+    A blob is transferred if its file does not exist, has another size, or another modification date (downloaded files
+    get the date of their blob). With checksum=True, the md5 of files is compared to the one of blobs instead of dates,
+    when blobs have one.
+
+    Returns
+    -------
+    SyncPlan
+
+    Raises
+    ------
+    ValueError if a blob name would be written outside of local_dir (.. or absolute segments)
+    """
+    plan, _ = await _plan_download(blob_api, container_name, prefix, local_dir, session, checksum)
+    return plan
+
+
+async def _upload_file(blob_api, path, size, container_name, blob_name, session, semaphore, block_size):
+    loop = asyncio.get_event_loop()
+    if size <= block_size:
+        async with semaphore:
+            with open(path, "rb") as f:
+                data = await loop.run_in_executor(None, f.read)
+            await blob_api.write_blob(data, container_name, blob_name, session)
+        return
+
+    async def put_block(data, block_id):
+        try:
+            await blob_api.put_block(data, container_name, blob_name, block_id, session)
+        finally:
+            semaphore.release()
+
+    # blocks are read in order (for the md5) and uploaded concurrently, at most concurrency blocks are in memory
+    md5 = hashlib.md5()
+    block_ids = []
+    tasks = []
+    try:
+        with open(path, "rb") as f:
+            while True:
+                await semaphore.acquire()
+                try:
+                    data = await loop.run_in_executor(None, f.read, block_size)
+                    if data:
+                        await loop.run_in_executor(None, md5.update, data)
+                except BaseException:
+                    semaphore.release()
+                    raise
+                if not data:
+                    semaphore.release()
+                    break
+                block_ids.append(blob_api.make_block_id(len(block_ids)))
+                tasks.append(asyncio.ensure_future(put_block(data, block_ids[-1])))
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    await blob_api.put_block_list(
+        block_ids,
+        container_name,
+        blob_name,
+        session,
+        content_md5=base64.b64encode(md5.digest()).decode("utf-8")
+    )
+
+
+async def _download_file(blob_api, container_name, blob_name, path, session, semaphore, last_modified):
+    loop = asyncio.get_event_loop()
+    async with semaphore:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        partial_path = path + PARTIAL_SUFFIX
+        try:
+            with open(partial_path, "wb") as f:
+                async for chunk in blob_api.iter_blob(container_name, blob_name, session):
+                    await loop.run_in_executor(None, f.write, chunk)
+            os.replace(partial_path, path)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+    timestamp = _timestamp(last_modified)
+    os.utime(path, (timestamp, timestamp))
+
+
+async def upload_directory(
+        blob_api,
+        local_dir,
+        container_name,
+        prefix,
+        session,
+        concurrency=DEFAULT_CONCURRENCY,
+        block_size=DEFAULT_BLOCK_SIZE,
+        checksum=False,
+        dry_run=False
+):
+    """
+    Uploads the files of local_dir that changed (see plan_upload) to container_name/prefix. Blobs without file are not
+    deleted.
+
+    Parameters
+    ----------
+    concurrency: maximum number of simultaneous requests
+    block_size: files above are uploaded by blocks of block_size bytes (concurrently)
+    dry_run: if True, nothing is transferred
+
+    Returns
+    -------
+    SyncPlan
+    """
+    plan = await plan_upload(blob_api, local_dir, container_name, prefix, session, checksum=checksum)
+    if not dry_run:
+        semaphore = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*(
+            _upload_file(blob_api, path, size, container_name, blob_name, session, semaphore, block_size)
+            for blob_name, path, size in plan.transfers
+        ))
+    return plan
+
+
+async def download_directory(
+        blob_api,
+        container_name,
+        prefix,
+        local_dir,
+        session,
+        concurrency=DEFAULT_CONCURRENCY,
+        checksum=False,
+        dry_run=False
+):
+    """
+    Downloads the blobs of container_name/prefix that changed (see plan_download) to local_dir. Blobs are streamed to
+    disk (not loaded in memory). Files without blob are not deleted.
+
+    Parameters
+    ----------
+    concurrency: maximum number of simultaneous downloads
+    dry_run: if True, nothing is transferred
+
+    Returns
+    -------
+    SyncPlan
+    """
+    plan, blobs = await _plan_download(blob_api, container_name, prefix, local_dir, session, checksum)
+    if not dry_run:
+        semaphore = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*(
+            _download_file(
+                blob_api, container_name, blob_name, path, session, semaphore, blobs[blob_name]["last_modified"])
+            for blob_name, path, _ in plan.transfers
+        ))
+    return plan
+
+
+def _load_checkpoint(path):
+    try:
+        with open(path, "rb") as f:
+            return loads(f.read(), ordered=False)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        # truncated by a crash while written (should not happen, checkpoints are replaced atomically)
+        return None
+
+
+def _write_checkpoint(path, data):
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+
+
+async def _save_checkpoint(path, checkpoint, lock):
+    # serialized on the event loop (never races with the updates of checkpoint), written in the executor, one write
+    # at a time (lock) in the order of the calls
+    data = dumpb(checkpoint)
+    async with lock:
+        write = asyncio.get_event_loop().run_in_executor(None, _write_checkpoint, path, data)
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            # the next write must not start before this one ends
+            await write
+            raise
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _unchanged_blocks(path, block_size, blocks):
+    # blocks (index: md5) whose content in the file still has this md5
+    with open(path, "rb") as f:
+        return dict(
+            (index, md5) for index, md5 in blocks.items()
+            if _md5_bytes(os.pread(f.fileno(), block_size, int(index) * block_size)) == md5
+        )
+
+
+def _write_at(fd, data, offset):
+    os.pwrite(fd, data, offset)
+    # data must be on disk before the checkpoint says so
+    os.fsync(fd)
+
+
+async def _run_tasks(coroutines):
+    # like gather, other tasks are cancelled (and awaited) as soon as one fails
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def resumable_download(
+        blob_api,
+        container_name,
+        blob_name,
+        path,
+        session,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        concurrency=DEFAULT_CONCURRENCY,
+        checkpoint_path=None
+):
+    """
+    Downloads a blob to path by ranges of chunk_size bytes (concurrently), written to a partial file. Downloaded ranges
+    are recorded in a checkpoint file: if the process stops, calling resumable_download again only downloads the
+    missing ranges (unless the blob changed since, then the download restarts).
+
+    Ranges of at most MAX_RANGE_MD5_SIZE bytes (the default) are checked against their md5 (returned by azure) before
+    they are recorded. The file is checked against the md5 of the blob if it has one, then renamed to path and the
+    checkpoint is removed. On mismatch, the partial file and the checkpoint are removed and
+    AzureBlobStorageAsyncError is raised.
+
+    Parameters
+    ----------
+    checkpoint_path: str, defaults to path + CHECKPOINT_SUFFIX
+
+    Returns
+    -------
+    int: number of bytes downloaded by this call
+    """
+    loop = asyncio.get_event_loop()
+    checkpoint_path = path + CHECKPOINT_SUFFIX if checkpoint_path is None else checkpoint_path
+    partial_path = path + PARTIAL_SUFFIX
+    properties = await blob_api.get_blob_properties(container_name, blob_name, session)
+    size = properties["size"]
+    checkpoint = _load_checkpoint(checkpoint_path)
+    resume = (
+        checkpoint is not None and
+        os.path.exists(partial_path) and
+        (checkpoint["etag"], checkpoint["size"], checkpoint["chunk_size"]) == (properties["etag"], size, chunk_size)
+    )
+    if not resume:
+        checkpoint = dict(etag=properties["etag"], size=size, chunk_size=chunk_size, chunks=[])
+    downloaded = set(checkpoint["chunks"])
+    missing = [index for index in range(-(-size // chunk_size)) if index not in downloaded]
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd = os.open(partial_path, os.O_RDWR | os.O_CREAT | (0 if resume else os.O_TRUNC))
+    semaphore = asyncio.Semaphore(concurrency)
+    checkpoint_lock = asyncio.Lock()
+
+    async def download_chunk(index):
+        start = index * chunk_size
+        async with semaphore:
+            # a blob modified since the checkpoint fails instead of mixing versions
+            data = await blob_api.get_blob_range(
+                container_name,
+                blob_name,
+                start,
+                min(size, start + chunk_size) - 1,
+                session,
+                if_match=properties["etag"],
+                range_md5=chunk_size <= MAX_RANGE_MD5_SIZE
+            )
+            write = loop.run_in_executor(None, _write_at, fd, data, start)
+            try:
+                await asyncio.shield(write)
+            except asyncio.CancelledError:
+                # fd must not be closed while written
+                await write
+                raise
+            checkpoint["chunks"].append(index)
+            await _save_checkpoint(checkpoint_path, checkpoint, checkpoint_lock)
+
+    try:
+        os.ftruncate(fd, size)
+        await _save_checkpoint(checkpoint_path, checkpoint, checkpoint_lock)
+        await _run_tasks(download_chunk(index) for index in missing)
+    finally:
+        os.close(fd)
+
+    if properties["content_md5"] is not None and \
+            await loop.run_in_executor(None, _md5, partial_path) != properties["content_md5"]:
+        _remove(partial_path)
+        _remove(checkpoint_path)
+        raise AzureBlobStorageAsyncError(
+            'Md5Mismatch\nContainer name : {}\nBlob name : {}'.format(container_name, blob_name))
+    os.replace(partial_path, path)
+    _remove(checkpoint_path)
+    timestamp = _timestamp(properties["last_modified"])
+    os.utime(path, (timestamp, timestamp))
+    return sum(min(chunk_size, size - index * chunk_size) for index in missing)
+
+
+async def resumable_upload(
+        blob_api,
+        path,
+        container_name,
+        blob_name,
+        session,
+        block_size=DEFAULT_BLOCK_SIZE,
+        concurrency=DEFAULT_CONCURRENCY,
+        checkpoint_path=None
+):
+    """
+    Uploads a file by blocks of block_size bytes (concurrently, each with its md5, checked by azure). Uploaded block
+    ids and md5s are recorded in a checkpoint file: if the process stops, calling resumable_upload again only uploads
+    the missing blocks (unless the file changed since, or azure discarded the uncommitted blocks, after a week or a
+    write of the blob). Blocks of the checkpoint are read again and uploaded again if their md5 changed.
+
+    Blocks are committed, the md5 of the file is stored as the Content-MD5 property of the blob (it is not checked by
+    azure), then the size of the blob is checked and the checkpoint is removed.
+
+    Parameters
+    ----------
+    checkpoint_path: str, defaults to path + CHECKPOINT_SUFFIX
+
+    Returns
+    -------
+    int: number of bytes uploaded by this call
+    """
+    loop = asyncio.get_event_loop()
+    checkpoint_path = path + CHECKPOINT_SUFFIX if checkpoint_path is None else checkpoint_path
+    stat = os.stat(path)
+    size = stat.st_size
+    if size == 0:
+        await blob_api.write_blob(b"", container_name, blob_name, session)
+        _remove(checkpoint_path)
+        return 0
+
+    block_count = -(-size // block_size)
+    version = dict(container=container_name, blob=blob_name, size=size, mtime=stat.st_mtime, block_size=block_size)
+    checkpoint = _load_checkpoint(checkpoint_path)
+    if checkpoint is not None and checkpoint["version"] == version:
+        # only blocks azure still has, with the content of the file, are kept
+        uploaded = dict(await blob_api.get_block_list(container_name, blob_name, session))
+        blocks = dict(
+            (index, md5) for index, md5 in checkpoint["blocks"].items()
+            if uploaded.get(blob_api.make_block_id(int(index))) == min(block_size, size - int(index) * block_size)
+        )
+        blocks = await loop.run_in_executor(None, _unchanged_blocks, path, block_size, blocks)
+    else:
+        blocks = {}
+    # json object keys are strings
+    checkpoint = dict(version=version, blocks=blocks)
+    missing = [index for index in range(block_count) if str(index) not in blocks]
+
+    fd = os.open(path, os.O_RDONLY)
+    semaphore = asyncio.Semaphore(concurrency)
+    checkpoint_lock = asyncio.Lock()
+
+    async def upload_block(index):
+        async with semaphore:
+            data = await loop.run_in_executor(None, os.pread, fd, block_size, index * block_size)
+            md5 = _md5_bytes(data)
+            await blob_api.put_block(
+                data, container_name, blob_name, blob_api.make_block_id(index), session, content_md5=md5)
+            # recorded before the semaphore is released, so that a failure of the next block does not lose it
+            blocks[str(index)] = md5
+            await _save_checkpoint(checkpoint_path, checkpoint, checkpoint_lock)
+
+    try:
+        await _save_checkpoint(checkpoint_path, checkpoint, checkpoint_lock)
+        await _run_tasks(upload_block(index) for index in missing)
+    finally:
+        os.close(fd)
+
+    stat = os.stat(path)
+    if (stat.st_size, stat.st_mtime) != (size, version["mtime"]):
+        raise AzureBlobStorageAsyncError(f"{path} was modified during its upload")
+    await blob_api.put_block_list(
+        [blob_api.make_block_id(index) for index in range(block_count)],
+        container_name,
+        blob_name,
+        session,
+        content_md5=await loop.run_in_executor(None, _md5, path)
+    )
+    properties = await blob_api.get_blob_properties(container_name, blob_name, session)
+    if properties["size"] != size:
+        raise AzureBlobStorageAsyncError(
+            'SizeMismatch\nContainer name : {}\nBlob name : {}'.format(container_name, blob_name))
+    _remove(checkpoint_path)
+    return sum(min(block_size, size - index * block_size) for index in missing)
@@ -0,0 +1,110 @@
+import time
+import asyncio
+import collections
+
+from .instrumentation import THROTTLING_STATUSES
+
+# limiter key: AdaptiveConcurrencyLimiter
+_shared_limiters = {}
+
+
+def get_shared_limiter(key, **kwargs):
+    """
+    Returns the limiter of key (for example ('blob', account_name)), created with kwargs on first call, so that all
+    clients of an account share the same limit.
+    """
+    try:
+        return _shared_limiters[key]
+    except KeyError:
+        limiter = _shared_limiters[key] = AdaptiveConcurrencyLimiter(**kwargs)
+        return limiter
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Bounds the number of requests in flight, with a limit adjusted by AIMD (additive increase, multiplicative decrease):
+
+    * each healthy response (not throttled, not a server error, faster than latency_limit if given) adds 1 / limit,
+      so the limit grows by about 1 each time limit requests succeed
+    * a throttling response (429, 503), a server error (5xx) or a connection error multiplies the limit by
+      decrease_factor, at most once per cooldown seconds (responses of a same burst only count once)
+
+    Requests waiting for a slot are served in order. Must be used from a single event loop (AsyncBlobAPI and
+    AzureBatchClient accept a concurrency_limiter).
+    """
+    def __init__(
+            self,
+            initial_limit=16,
+            min_limit=1,
+            max_limit=512,
+            decrease_factor=0.5,
+            latency_limit=None,
+            cooldown=1.,
+            clock=time.monotonic
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_limit = latency_limit
+        self.cooldown = cooldown
+        self._clock = clock
+        # float, slots are int(limit)
+        self.limit = float(initial_limit)
+        self.in_flight = 0
+        self.decreases = 0
+        self._last_decrease = None
+        self._waiters = collections.deque()
+
+    async def acquire(self):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # the slot is taken by _wake_up
+            await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # slot was given while cancelled
+                self.in_flight -= 1
+                self._wake_up()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self, duration, status=None, error=None):
+        """
+        Parameters
+        ----------
+        duration: float, seconds
+        status: int, response status (None if no response)
+        error: exception raised instead of a response (cancellations are ignored)
+        """
+        self.in_flight -= 1
+        if error is not None:
+            if not isinstance(error, asyncio.CancelledError):
+                self._decrease()
+        elif status in THROTTLING_STATUSES or status >= 500:
+            self._decrease()
+        elif self.latency_limit is None or duration <= self.latency_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake_up()
+
+    def _decrease(self):
+        now = self._clock()
+        if self._last_decrease is not None and now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        self.decreases += 1
+
+    def _wake_up(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
@@ -1,7 +1,16 @@
 # fixme: see if this should be deleted
-from azure.storage.blob import BlobPermissions
+import asyncio
+import threading
+from urllib.parse import quote
+
+import django
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
-import datetime as dt
+
+from .async_blob_storage import DEFAULT_CHUNK_SIZE, AzureBlobStorageResourceNotFound
+from .sessions import create_session
+from .sas import BlobSasSigner, SasCache, make_permission
 
 
 class DownloadResponse(Response):
@@ -16,32 +25,190 @@ class BlobUrlResponse(Response):
         ))
 
 
-class DRFBlobClient:
-    def __init__(self, block_blob_service, sas_expiry):
-        self._client = block_blob_service
+def content_disposition(filename):
+    """
+    Attachment Content-Disposition header value: quoted filename if it is printable ascii, RFC 5987 encoded else.
+    """
+    if filename.isascii() and filename.isprintable():
+        escaped = filename.replace("\\", "\\\\").replace('"', '\\"')
+        return f'attachment; filename="{escaped}"'
+    return f"attachment; filename*=utf-8''{quote(filename)}"
+
+
+class BlobStreamingResponse(StreamingHttpResponse):
+    def __init__(self, chunks, content_type="application/octet-stream", filename=None):
+        super(BlobStreamingResponse, self).__init__(chunks, content_type=content_type)
+        if filename is not None:
+            self["Content-Disposition"] = content_disposition(filename)
+
+
+def _iter_async_chunks(make_chunks):
+    # sync generator driving the async generator returned by make_chunks(session), in a private event loop run by a
+    # thread (with its own session). Wsgi only: consumed by an asgi server (django < 4.2 iterates sync streaming
+    # responses in its event loop), every chunk would block the event loop
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        raise RuntimeError("sync blob streaming would block the event loop: asgi streaming requires django >= 4.2")
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="oazure-blob-stream", daemon=True)
+    thread.start()
+
+    def run(coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    async def start():
+        session = create_session()
+        return session, make_chunks(session)
+
+    session = chunks = None
+    try:
+        session, chunks = run(start())
+        while True:
+            try:
+                yield run(chunks.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        # also when the response is not fully consumed: releases the upstream connection
+        if chunks is not None:
+            run(chunks.aclose())
+        if session is not None:
+            run(session.close())
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+class _BaseDRFBlobClient:
+    def __init__(self, signer, sas_expiry, sas_rounding, container_scope):
         self._sas_expiry = sas_expiry
+        self._container_scope = container_scope
+        self._sas_cache = SasCache(signer, sas_expiry, rounding=sas_rounding)
 
     def download_response(self, container_name, blob_name):
-        return DownloadResponse(
-            self._client.make_blob_url(container_name, blob_name, protocol="https",
-                                       sas_token=self._client.generate_blob_shared_access_signature(
-                                           container_name,
-                                           blob_name,
-                                           permission=BlobPermissions(read=True),
-                                           expiry=dt.datetime.now() + dt.timedelta(seconds=self._sas_expiry),
-                                           protocol="https"
-                                       ))
-        )
+        return DownloadResponse(self._sas_cache.blob_url(
+            container_name,
+            blob_name,
+            make_permission(read=True),
+            container_scope=self._container_scope
+        ))
 
     def blob_url_response(self, container_name, blob_name, read=False, create=False, add=False, write=False, delete=False):
-        return BlobUrlResponse(
-            self._client.make_blob_url(container_name, blob_name, protocol="https",
-                                       sas_token=self._client.generate_blob_shared_access_signature(
-                                           container_name,
-                                           blob_name,
-                                           permission=BlobPermissions(read=read, create=create, add=add, write=write,
-                                                                      delete=delete),
-                                           expiry=dt.datetime.now() + dt.timedelta(seconds=self._sas_expiry),
-                                           protocol="https"
-                                       ))
+        return BlobUrlResponse(self._sas_cache.blob_url(
+            container_name,
+            blob_name,
+            make_permission(read=read, add=add, create=create, write=write, delete=delete),
+            container_scope=self._container_scope
+        ))
+
+    def blob_urls(self, container_name, blob_names, read=False, create=False, add=False, write=False, delete=False):
+        """
+        Signs the urls of many blobs of a container (for listings).
+
+        Returns
+        -------
+        list of urls (same order as blob_names)
+        """
+        return self._sas_cache.blob_urls(
+            container_name,
+            blob_names,
+            make_permission(read=read, add=add, create=create, write=write, delete=delete),
+            container_scope=self._container_scope
+        )
+
+
+class DRFBlobClient(_BaseDRFBlobClient):
+    """
+    SAS tokens are signed without the storage sdk and cached: expiries are rounded up to sas_rounding seconds, so urls
+    of a blob are stable during sas_rounding seconds (and valid sas_expiry to sas_expiry + sas_rounding seconds).
+
+    If container_scope is True, urls are signed with one token per container and permission (built by concatenation,
+    without signature per blob). Such a token grants its permissions on all the blobs of the container: only use it
+    when any user of a url may access the whole container.
+    """
+    def __init__(self, block_blob_service, sas_expiry, sas_rounding=60, container_scope=False):
+        self._client = block_blob_service
+        super(DRFBlobClient, self).__init__(
+            BlobSasSigner(
+                block_blob_service.account_name,
+                block_blob_service.account_key,
+                endpoint=block_blob_service.primary_endpoint
+            ),
+            sas_expiry,
+            sas_rounding,
+            container_scope
         )
+
+
+class AsyncDRFBlobClient(_BaseDRFBlobClient):
+    """
+    Same as DRFBlobClient, with the credentials of an AsyncBlobAPI (no storage sdk). Url responses only sign tokens
+    (no io), they may be called from async views.
+
+    streaming_download_response proxies a blob that must not be exposed through a SAS url. With django >= 4.2, it
+    returns an async streaming response. With older versions (no async streaming_content), the response is a sync
+    iterator downloading the blob in a private event loop, thread and session: it may only be served by a wsgi server
+    (it raises RuntimeError when an asgi server starts streaming it). Streaming under asgi requires django >= 4.2.
+    """
+    def __init__(self, blob_api, sas_expiry, sas_rounding=60, container_scope=False):
+        self._blob_api = blob_api
+        super(AsyncDRFBlobClient, self).__init__(
+            BlobSasSigner(blob_api.account_name, blob_api.account_key),
+            sas_expiry,
+            sas_rounding,
+            container_scope
+        )
+
+    async def streaming_download_response(
+            self,
+            container_name,
+            blob_name,
+            session,
+            chunk_size=DEFAULT_CHUNK_SIZE,
+            content_type="application/octet-stream",
+            filename=None,
+            timeout=None
+    ):
+        """
+        With django >= 4.2, the blob is streamed with session: it must stay open until the response was fully
+        streamed (or closed). With older versions (wsgi only), session is only used to check that the blob exists.
+
+        Raises
+        ------
+        NotFound if the blob does not exist (the first chunk is read before the response is returned)
+        """
+        if django.VERSION < (4, 2):
+            try:
+                await self._blob_api.get_blob_properties(container_name, blob_name, session, timeout=timeout)
+            except AzureBlobStorageResourceNotFound:
+                raise NotFound()
+            return BlobStreamingResponse(
+                _iter_async_chunks(lambda stream_session: self._blob_api.iter_blob(
+                    container_name, blob_name, stream_session, chunk_size=chunk_size, timeout=timeout)),
+                content_type=content_type,
+                filename=filename
+            )
+
+        chunks = self._blob_api.iter_blob(container_name, blob_name, session, chunk_size=chunk_size, timeout=timeout)
+        try:
+            first_chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            first_chunk = None
+        except AzureBlobStorageResourceNotFound:
+            raise NotFound()
+
+        async def iter_chunks():
+            try:
+                if first_chunk is None:
+                    return
+                yield first_chunk
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                # also when the response is not fully consumed: releases the upstream connection
+                await chunks.aclose()
+
+        return BlobStreamingResponse(iter_chunks(), content_type=content_type, filename=filename)
@@ -0,0 +1,126 @@
+import time
+import asyncio
+import collections
+
+
+class HedgingPolicy:
+    """
+    Hedged requests (AsyncBlobAPI hedging): when a request has not responded after a delay, an identical request is
+    sent and the first response wins, the other request is cancelled.
+
+    The delay is fixed (delay) or the percentile of the latencies of the last window requests (adaptive, clamped to
+    [min_delay, max_delay]). Until min_samples latencies are known, adaptive requests are not hedged.
+
+    Hedges are capped to budget times the requests (for example 0.05: at most 5% of extra requests), with bursts of
+    at most max_burst hedges.
+
+    Not thread safe (used from the event loop), may be shared by clients of a same workload.
+    """
+    def __init__(
+            self,
+            delay=None,
+            percentile=0.95,
+            min_delay=0.005,
+            max_delay=1.,
+            budget=0.05,
+            max_burst=10.,
+            window=1000,
+            min_samples=100
+    ):
+        self.fixed_delay = delay
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.max_burst = max_burst
+        self.min_samples = min_samples
+        self._latencies = collections.deque(maxlen=window)
+        # the percentile is recomputed every _update_every latencies
+        self._update_every = max(1, window // 20)
+        self._since_update = 0
+        self._delay = None
+        self._credits = 0.
+        self.requests = 0
+        self.hedges = 0
+
+    def delay(self):
+        """
+        Returns
+        -------
+        float: seconds to wait before hedging a new request, None if it must not be hedged
+        """
+        self.requests += 1
+        self._credits = min(self.max_burst, self._credits + self.budget)
+        return self.fixed_delay if self.fixed_delay is not None else self._delay
+
+    def try_hedge(self):
+        """
+        Returns
+        -------
+        bool: True if the budget allows a hedge (it is consumed)
+        """
+        if self._credits < 1:
+            return False
+        self._credits -= 1
+        self.hedges += 1
+        return True
+
+    def record(self, duration):
+        """
+        Latency of a request attempt that received a response (or elapsed time of a cancelled one), in seconds.
+        """
+        self._latencies.append(duration)
+        self._since_update += 1
+        if self._since_update >= self._update_every and len(self._latencies) >= self.min_samples:
+            self._since_update = 0
+            latencies = sorted(self._latencies)
+            value = latencies[min(len(latencies) - 1, int(self.percentile * len(latencies)))]
+            self._delay = min(self.max_delay, max(self.min_delay, value))
+
+
+async def _timed(coroutine, policy):
+    # a cancelled attempt (slower request of a hedged pair) is recorded with its elapsed time, a lower bound of its
+    # latency, else the percentile would only see the faster requests
+    start = time.monotonic()
+    try:
+        result = await coroutine
+    except asyncio.CancelledError:
+        policy.record(time.monotonic() - start)
+        raise
+    policy.record(time.monotonic() - start)
+    return result
+
+
+async def hedge(policy, send):
+    """
+    Parameters
+    ----------
+    policy: HedgingPolicy
+    send: function returning a new request coroutine, called once or twice
+
+    Returns
+    -------
+    result of the first request that did not raise (the error of the first request if both raised), and True if the
+    request was hedged
+    """
+    delay = policy.delay()
+    first = asyncio.ensure_future(_timed(send(), policy))
+    tasks = [first]
+    try:
+        if delay is None:
+            return await first, False
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done or not policy.try_hedge():
+            return await first, False
+        tasks.append(asyncio.ensure_future(_timed(send(), policy)))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), True
+        return first.result(), True
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
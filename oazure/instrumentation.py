@@ -0,0 +1,283 @@
+import bisect
+import logging
+import threading
+import collections
+
+logger = logging.getLogger(__name__)
+
+# statuses azure uses to signal that a client must slow down
+THROTTLING_STATUSES = (429, 503)
+
+# upper bounds of latency histogram buckets, in seconds (last bucket is unbounded)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60.)
+
+
+class Instrumentation:
+    """
+    Hooks called by the http clients (AsyncBlobAPI, AzureBatchClient, LogAnalyticsClient) around each request attempt.
+
+    This base class does nothing and is the default of all clients. Subclass it and override the hooks you need
+    (see MetricsRegistry). Hooks are called on the request path (event loop or caller thread): they must be cheap and
+    must not raise.
+
+    client: str, 'blob', 'batch' or 'log_analytics'
+    operation: str, client method name (for example 'get_blob')
+    attempt: int, 0 for the first attempt, n for the nth retry
+    """
+    def request_started(self, client, operation):
+        pass
+
+    def request_ended(self, client, operation, status, duration, bytes_sent=0, bytes_received=0, attempt=0):
+        """
+        A response was received (whatever its status). duration is in seconds.
+        """
+        pass
+
+    def request_failed(self, client, operation, error, duration, attempt=0):
+        """
+        No response was received (connection error, timeout...).
+        """
+        pass
+
+    def request_cancelled(self, client, operation, duration, attempt=0):
+        """
+        The request was cancelled before its response was received (for example the slower request of a hedged pair),
+        it is not an error.
+        """
+        pass
+
+    def request_queued(self, client, operation, delay):
+        """
+        A request waited delay seconds for a client side rate limit (see BlobRateLimiter) before being sent.
+        """
+        pass
+
+    def request_hedged(self, client, operation):
+        """
+        A second identical request was sent because the first one was slow (see HedgingPolicy).
+        """
+        pass
+
+
+NULL_INSTRUMENTATION = Instrumentation()
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        """
+        Upper bound of the bucket containing the q (0 < q <= 1) percentile (max for the unbounded bucket).
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulated = 0
+        for i, count in enumerate(self.counts):
+            cumulated += count
+            if cumulated >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self):
+        return dict(
+            count=self.count,
+            mean=self.total / self.count if self.count else None,
+            min=self.min,
+            max=self.max,
+            p50=self.percentile(0.5),
+            p90=self.percentile(0.9),
+            p99=self.percentile(0.99),
+            buckets=dict(zip([*self.buckets, "inf"], self.counts))
+        )
+
+
+class _OperationMetrics:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.statuses = collections.Counter()
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.hedged = 0
+        self.cancelled = 0
+        self.queue_delay = LatencyHistogram()
+
+    def to_dict(self):
+        return dict(
+            requests=self.requests,
+            retries=self.retries,
+            throttled=self.throttled,
+            errors=self.errors,
+            statuses=dict(self.statuses),
+            bytes_sent=self.bytes_sent,
+            bytes_received=self.bytes_received,
+            in_flight=self.in_flight,
+            max_in_flight=self.max_in_flight,
+            hedged=self.hedged,
+            cancelled=self.cancelled,
+            latency=self.latency.to_dict(),
+            queue_delay=self.queue_delay.to_dict()
+        )
+
+
+class MetricsRegistry(Instrumentation):
+    """
+    Aggregates, per (client, operation): latency histogram, status codes, retries, throttling events, connection
+    errors, bytes in/out, in-flight requests, rate limit queue delays, hedged and cancelled requests. Thread safe, may
+    be shared by all clients.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = collections.defaultdict(_OperationMetrics)
+
+    def request_started(self, client, operation):
+        with self._lock:
+            metrics = self._metrics[(client, operation)]
+            metrics.in_flight += 1
+            metrics.max_in_flight = max(metrics.max_in_flight, metrics.in_flight)
+
+    def request_ended(self, client, operation, status, duration, bytes_sent=0, bytes_received=0, attempt=0):
+        with self._lock:
+            metrics = self._metrics[(client, operation)]
+            metrics.in_flight -= 1
+            metrics.requests += 1
+            metrics.latency.add(duration)
+            metrics.statuses[status] += 1
+            metrics.bytes_sent += bytes_sent
+            metrics.bytes_received += bytes_received
+            if attempt > 0:
+                metrics.retries += 1
+            if status in THROTTLING_STATUSES:
+                metrics.throttled += 1
+
+    def request_failed(self, client, operation, error, duration, attempt=0):
+        with self._lock:
+            metrics = self._metrics[(client, operation)]
+            metrics.in_flight -= 1
+            metrics.requests += 1
+            metrics.errors += 1
+            metrics.latency.add(duration)
+            if attempt > 0:
+                metrics.retries += 1
+
+    def request_cancelled(self, client, operation, duration, attempt=0):
+        with self._lock:
+            metrics = self._metrics[(client, operation)]
+            metrics.in_flight -= 1
+            metrics.cancelled += 1
+
+    def request_queued(self, client, operation, delay):
+        with self._lock:
+            self._metrics[(client, operation)].queue_delay.add(delay)
+
+    def request_hedged(self, client, operation):
+        with self._lock:
+            self._metrics[(client, operation)].hedged += 1
+
+    def snapshot(self, reset=False):
+        """
+        Returns
+        -------
+        dict: {(client, operation): metrics dict}
+        """
+        with self._lock:
+            snapshot = dict((key, metrics.to_dict()) for key, metrics in self._metrics.items())
+            if reset:
+                # in flight requests must survive reset, or their end would make the counter negative
+                in_flight = dict((key, metrics.in_flight) for key, metrics in self._metrics.items()
+                                 if metrics.in_flight)
+                self._metrics.clear()
+                for key, value in in_flight.items():
+                    self._metrics[key].in_flight = value
+        return snapshot
+
+
+class ApplicationInsightsExporter:
+    """
+    Periodically sends the metrics of a registry to Application Insights, through the telemetry client of an
+    AzureLoggingHandler (or directly through an applicationinsights TelemetryClient).
+
+    Metrics are aggregated (one track_metric per metric, client and operation), so that exporting does not add
+    telemetry per request.
+    """
+    def __init__(self, registry, telemetry, interval=60, prefix="oazure"):
+        self.registry = registry
+        self.client = getattr(telemetry, "client", telemetry)
+        self.interval = interval
+        self.prefix = prefix
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def export(self):
+        for (client, operation), metrics in self.registry.snapshot(reset=True).items():
+            properties = dict(client=client, operation=operation)
+            latency = metrics["latency"]
+            if latency["count"]:
+                self.client.track_metric(
+                    f"{self.prefix}.latency",
+                    latency["mean"],
+                    count=latency["count"],
+                    min=latency["min"],
+                    max=latency["max"],
+                    properties=dict(properties, p50=latency["p50"], p90=latency["p90"], p99=latency["p99"])
+                )
+            queue_delay = metrics["queue_delay"]
+            if queue_delay["count"]:
+                self.client.track_metric(
+                    f"{self.prefix}.queue_delay",
+                    queue_delay["mean"],
+                    count=queue_delay["count"],
+                    min=queue_delay["min"],
+                    max=queue_delay["max"],
+                    properties=dict(properties, p90=queue_delay["p90"], p99=queue_delay["p99"])
+                )
+            for name in ("requests", "retries", "throttled", "errors", "bytes_sent", "bytes_received",
+                         "max_in_flight", "hedged", "cancelled"):
+                self.client.track_metric(f"{self.prefix}.{name}", metrics[name], properties=properties)
+            for status, count in metrics["statuses"].items():
+                self.client.track_metric(f"{self.prefix}.status", count, properties=dict(properties, status=status))
+        self.client.flush()
+
+    def start(self):
+        """
+        Starts a daemon thread exporting every interval seconds.
+        """
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="oazure-metrics-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the export thread and exports remaining metrics.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.export()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.export()
+            except Exception:
+                logger.exception("could not export metrics to application insights")
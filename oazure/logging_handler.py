@@ -1,13 +1,18 @@
 import logging
 import socket
-try:
-    from django.core.handlers.wsgi import WSGIRequest
-except ImportError:
-    WSGIRequest = None
+import sys
+import queue
+import threading
+import time
+import random
+import traceback
+import collections
 
 from applicationinsights.logging import LoggingHandler
 
-RESERVED_ATTRS = (
+from .rate_limiting import TokenBucket
+
+RESERVED_ATTRS = frozenset((
     "args",
     "asctime",
     "created",
@@ -28,16 +33,243 @@ RESERVED_ATTRS = (
     "processName",
     "relativeCreated",
     "stack_info",
+    "taskName",
     "thread",
     "threadName"
-)
+))
+
+# extra values of other types (django requests...) are sent as their str
+SERIALIZABLE_TYPES = (str, int, float, bool, type(None), list, tuple, dict)
+
+
+class LogSampler:
+    """
+    Bounds the volume of records sent by an AzureLoggingHandler. Steps are applied in this order:
+
+    * sampling: a record is kept with probability level_rates[level] * logger_rates[logger], levels may be given by
+      name or number, logger rates apply to child loggers ('oazure' applies to 'oazure.monitoring')
+    * deduplication: if dedup_window is given (seconds), records with the same logger, level and message template are
+      only sent once per window. When the window ends, a summary record ('... (repeated n times)') is sent if some
+      were dropped (by the next record, or by the flush timer of the handler). At most max_dedup_keys windows are
+      tracked, the oldest ones are ended first
+    * rate limiting: if rate_limit is given (records per second, bursts of at most burst records), records above the
+      limit are dropped. With per_logger=True, each logger has its own limit
+
+    Records above never_drop_level (if given) skip all steps.
+
+    Counters: sampled_out, deduplicated, rate_limited.
+
+    Not thread safe, used under the handler lock.
+    """
+    def __init__(
+            self,
+            level_rates=None,
+            logger_rates=None,
+            dedup_window=None,
+            rate_limit=None,
+            burst=None,
+            per_logger=False,
+            never_drop_level=None,
+            max_dedup_keys=10000
+    ):
+        self.level_rates = dict(
+            (logging.getLevelName(level) if isinstance(level, str) else level, rate)
+            for level, rate in (level_rates or {}).items())
+        self.logger_rates = logger_rates or {}
+        self.dedup_window = dedup_window
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.per_logger = per_logger
+        self.never_drop_level = never_drop_level
+        self.max_dedup_keys = max_dedup_keys
+
+        self.sampled_out = 0
+        self.deduplicated = 0
+        self.rate_limited = 0
+
+        # logger name: resolved rate
+        self._logger_rates_cache = {}
+        # (logger, level, template): [window end, dropped records nb, last dropped record], ordered by window end
+        self._windows = collections.OrderedDict()
+        self._buckets = {}
+
+    def _get_logger_rate(self, name):
+        try:
+            return self._logger_rates_cache[name]
+        except KeyError:
+            pass
+        rate = 1.
+        parent = name
+        while parent:
+            if parent in self.logger_rates:
+                rate = self.logger_rates[parent]
+                break
+            parent = parent.rpartition(".")[0]
+        self._logger_rates_cache[name] = rate
+        return rate
+
+    def _summary(self, dropped_nb, record):
+        return logging.makeLogRecord(dict(
+            record.__dict__,
+            msg=f"{record.getMessage()} (repeated {dropped_nb} times)",
+            args=None,
+            exc_info=None,
+            exc_text=None,
+            repeated=dropped_nb
+        ))
+
+    def _sweep(self, now, max_windows=None):
+        # ends windows (oldest first) ended at now, and while more than max_windows remain
+        summaries = []
+        while self._windows:
+            key, (window_end, dropped_nb, record) = next(iter(self._windows.items()))
+            if window_end > now and (max_windows is None or len(self._windows) <= max_windows):
+                break
+            del self._windows[key]
+            if dropped_nb:
+                summaries.append(self._summary(dropped_nb, record))
+        return summaries
+
+    def sweep(self):
+        """
+        Returns
+        -------
+        list of summaries of ended deduplication windows
+        """
+        if self.dedup_window is None:
+            return []
+        return self._sweep(time.monotonic())
+
+    def flush(self):
+        """
+        Returns
+        -------
+        list of summaries of all deduplication windows (ended or not)
+        """
+        if self.dedup_window is None:
+            return []
+        return self._sweep(float("inf"))
+
+    def sample(self, record):
+        """
+        Returns
+        -------
+        list of records to send: the record if it is kept, and summaries of deduplicated records
+        """
+        if self.never_drop_level is not None and record.levelno >= self.never_drop_level:
+            return [record]
+
+        rate = self.level_rates.get(record.levelno, 1.) * self._get_logger_rate(record.name)
+        if rate < 1 and random.random() >= rate:
+            self.sampled_out += 1
+            return []
+
+        records = []
+        if self.dedup_window is not None:
+            now = time.monotonic()
+            records.extend(self._sweep(now))
+            # messages may be any object (dicts...), not always hashable
+            template = record.msg if isinstance(record.msg, str) else repr(record.msg)
+            key = (record.name, record.levelno, template)
+            window = self._windows.get(key)
+            if window is not None:
+                window[1] += 1
+                window[2] = record
+                self.deduplicated += 1
+                return records
+            # room for the new window, windows are created in time order so the dict stays ordered by window end
+            records.extend(self._sweep(now, max_windows=self.max_dedup_keys - 1))
+            self._windows[key] = [now + self.dedup_window, 0, None]
+
+        if self.rate_limit is not None:
+            bucket_key = record.name if self.per_logger else None
+            bucket = self._buckets.get(bucket_key)
+            if bucket is None:
+                bucket = self._buckets[bucket_key] = TokenBucket(self.rate_limit, self.burst)
+            if not bucket.try_consume():
+                self.rate_limited += 1
+                return records
+
+        records.append(record)
+        return records
 
 
 class AzureLoggingHandler(LoggingHandler):
-    def __init__(self, instrumentation_key, component_name, *args, **kwargs):
+    """
+    By default, telemetry is sent from the logging thread, which is blocked by the flush of every record above warning.
+
+    If queue_size is given, emit only enqueues the record: a background thread formats it, builds its properties,
+    ships telemetry, flushes it every flush_interval seconds and as soon as possible after a record above warning.
+    Records emitted while queue_size records are waiting are dropped (and counted in dropped_records). Objects given as
+    logging arguments or extras must not be modified after the logging call (they are read later).
+
+    If a LogSampler is given, it is applied before any processing (sampling, deduplication and rate limiting).
+    Summaries of ended deduplication windows are emitted every flush_interval seconds (by the background thread in
+    queued mode, by a timer thread else), so that loggers going quiet get them too.
+    """
+    def __init__(
+            self,
+            instrumentation_key,
+            component_name,
+            *args,
+            queue_size=None,
+            flush_interval=5.,
+            sampler=None,
+            **kwargs
+    ):
         self.hostname = socket.gethostname()
         self.component_name = component_name
         super().__init__(instrumentation_key, *args, **kwargs)
+        self.flush_interval = flush_interval
+        self.sampler = sampler
+        self.dropped_records = 0
+        # properties that only change with the process (after a fork)
+        self._static_properties = None
+        self._static_properties_pid = None
+        self._queue = None
+        self._thread = None
+        self._sweeper = None
+        self._sweeper_stop = threading.Event()
+        if queue_size is not None:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._stop = object()
+            self._flush_requested = threading.Event()
+            # telemetry client is not thread safe
+            self._client_lock = threading.Lock()
+            self._thread = threading.Thread(target=self._run, name="oazure-logging-handler", daemon=True)
+            self._thread.start()
+
+    def _get_properties(self, record):
+        # the set of properties that will ride with the record
+        if record.process != self._static_properties_pid:
+            self._static_properties = dict(
+                process=record.processName,
+                hostname=self.hostname,
+                component=self.component_name
+            )
+            self._static_properties_pid = record.process
+        properties = self._static_properties.copy()
+        properties["module"] = record.name
+        properties["filename"] = record.filename
+        properties["line_number"] = record.lineno
+        properties["level"] = record.levelname
+        for key, value in record.__dict__.items():
+            if key not in RESERVED_ATTRS:
+                properties["_" + key] = value
+        return properties
+
+    def _ship(self, record):
+        properties = self._get_properties(record)
+        # non serializable extras are only converted when shipped
+        for key, value in properties.items():
+            if not isinstance(value, SERIALIZABLE_TYPES):
+                properties[key] = str(value)
+        # if we have exec_info, we will use it as an exception
+        if record.exc_info:
+            self.client.track_exception(*record.exc_info, properties=properties)
+        else:
+            # if we don't have exc_info, we simply format the message and send the trace
+            self.client.track_trace(self.format(record), properties=properties, severity=record.levelname)
 
     def emit(self, record):
         """Emit a record.
@@ -48,29 +280,122 @@ class AzureLoggingHandler(LoggingHandler):
         Args:
             record (:class:`logging.LogRecord`). the record to format and send.
         """
-        # the set of properties that will ride with the record
-        properties = dict(
-            process=record.processName,
-            module=record.name,
-            filename=record.filename,
-            line_number=record.lineno,
-            level=record.levelname,
-            hostname=self.hostname,
-            component=self.component_name,
-            **dict((f'_{key}', record.__dict__[key]) for key in record.__dict__ if key not in RESERVED_ATTRS)
-        )
-
-        # Bad hack for django, find a better way...
-        if WSGIRequest is not None and isinstance(properties.get("_request"), WSGIRequest):
-            properties["_request"] = str(properties["_request"])
+        try:
+            if self.sampler is None:
+                self._emit(record)
+                return
+            if self._queue is None and self._sweeper is None and self.sampler.dedup_window is not None:
+                # called under the handler lock, started once
+                self._sweeper = threading.Thread(
+                    target=self._run_sweeper, name="oazure-logging-sampler", daemon=True)
+                self._sweeper.start()
+            sampled_records = self.sampler.sample(record)
+        except Exception:
+            self.handleError(record)
+            return
+        for sampled_record in sampled_records:
+            try:
+                self._emit(sampled_record)
+            except Exception:
+                self.handleError(sampled_record)
 
-        # if we have exec_info, we will use it as an exception
-        if record.exc_info:
-            self.client.track_exception(*record.exc_info, properties=properties)
-        else:
-            # if we don't simply format the message and send the trace
-            formatted_message = self.format(record)
-            self.client.track_trace(formatted_message, properties=properties, severity=record.levelname)
+    def _sweep_sampler(self):
+        # emits summaries of ended deduplication windows
+        if self.sampler is None:
+            return
+        # the lock may be held by a flush or a close (logging.shutdown) waiting for this thread: next sweep then
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            for summary in self.sampler.sweep():
+                self._emit(summary)
+        finally:
+            self.lock.release()
+
+    def _run_sweeper(self):
+        while not self._sweeper_stop.wait(self.flush_interval):
+            try:
+                self._sweep_sampler()
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
+
+    def _emit(self, record):
+        if self._queue is not None:
+            try:
+                self._enqueue(record)
+            except Exception:
+                self.handleError(record)
+            return
+
+        self._ship(record)
         # We flush immediately for anything above warnings (for info, etc. will be flushed when the queue has 500 msgs)
         if record.levelno >= logging.WARNING:
             self.client.flush()
+
+    def _enqueue(self, record):
+        # the record is formatted and converted by the background thread
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_records += 1
+            return
+        if record.levelno >= logging.WARNING:
+            self._flush_requested.set()
+
+    def flush(self):
+        """
+        In queued mode, blocks until all queued records were shipped.
+        """
+        if self._queue is None:
+            return super().flush()
+        if self._thread is not None:
+            self._queue.join()
+        with self._client_lock:
+            self.client.flush()
+
+    def close(self):
+        if self._sweeper is not None:
+            self._sweeper_stop.set()
+            self._sweeper.join()
+            self._sweeper = None
+        if self.sampler is not None:
+            with self.lock:
+                for summary in self.sampler.flush():
+                    self._emit(summary)
+        if self._thread is not None:
+            self._queue.put(self._stop)
+            self._thread.join()
+            self._thread = None
+        super().close()
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            try:
+                if item is self._stop:
+                    with self._client_lock:
+                        self.client.flush()
+                    return
+                if item is not None:
+                    with self._client_lock:
+                        self._ship(item)
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    # enqueued, shipped by the next iterations
+                    self._sweep_sampler()
+                if self._queue.empty() and (
+                        self._flush_requested.is_set() or time.monotonic() - last_flush >= self.flush_interval):
+                    self._flush_requested.clear()
+                    with self._client_lock:
+                        self.client.flush()
+                    last_flush = time.monotonic()
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
+            finally:
+                if item is not None:
+                    self._queue.task_done()
@@ -1,58 +1,237 @@
 import logging
-import requests
 import datetime
+import time
 import hashlib
 import hmac
 import base64
-import aiohttp
+import asyncio
+import collections
+import gzip
+import queue
+import threading
 
-from .snippets.ojson import dumps
+from .snippets.ojson import dumpb
+from .instrumentation import NULL_INSTRUMENTATION
+from .sessions import create_session
 
 logger = logging.getLogger(__name__)
 
+# maximum size of a data collector api post
+MAX_BODY_SIZE = 30 * 1024 * 1024
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+
+# statuses for which a refused body is sent again
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
 
 class LogAnalyticsClient:
-    def __init__(self, customer_id, shared_key, log_type):
+    """
+    The async api uses a persistent session: the given one (left open), or one created on first request and closed by
+    close() (the client may be used as an async context manager).
+
+    Lists of records bigger than max_body_size are split into several requests (sent concurrently by the async api).
+    If compress is True, bodies are gzip encoded.
+
+    The sync api uses a persistent pooled requests session (thread safe), closed by close_sync().
+    """
+    def __init__(
+            self,
+            customer_id,
+            shared_key,
+            log_type,
+            instrumentation=None,
+            session=None,
+            compress=False,
+            max_body_size=MAX_BODY_SIZE
+    ):
+        if max_body_size > MAX_BODY_SIZE:
+            raise ValueError(f"max_body_size must not exceed {MAX_BODY_SIZE}")
         self._customer_id = customer_id
         self._shared_key = shared_key
         self.log_type = log_type
+        self.compress = compress
+        self.max_body_size = max_body_size
+        self.instrumentation = NULL_INSTRUMENTATION if instrumentation is None else instrumentation
+        self.session = session
+        self._owns_session = session is None
+        self._requests_session = None
+        self._requests_session_lock = threading.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self):
+        if self.session is None:
+            self.session = create_session()
+        return self.session
+
+    def close_sync(self):
+        with self._requests_session_lock:
+            if self._requests_session is not None:
+                self._requests_session.close()
+                self._requests_session = None
+
+    def _get_requests_session(self):
+        with self._requests_session_lock:
+            if self._requests_session is None:
+                # imported on first sync use
+                import requests
+                self._requests_session = requests.Session()
+            return self._requests_session
 
     async def send_json_async(self, data):
-        uri, body, headers = self._prepare_request(data)
-        async with aiohttp.ClientSession() as session:
-            response = await session.post(uri, data=body, headers=headers)
+        """
+        Returns
+        -------
+        bool: True if all data was accepted
+        """
+        accepted = await asyncio.gather(*[
+            self._send_body_async(body, "send_json_async") for body in self._split_body(data)])
+        return all(accepted)
+
+    async def _send_body_async(self, body, operation):
+        uri, body, headers = self._prepare_body_request(body)
+        session = self._get_session()
+        self.instrumentation.request_started("log_analytics", operation)
+        start = time.monotonic()
+        try:
+            async with session.post(uri, data=body, headers=headers) as response:
+                content = await response.read()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                self.instrumentation.request_cancelled("log_analytics", operation, time.monotonic() - start)
+            else:
+                self.instrumentation.request_failed("log_analytics", operation, e, time.monotonic() - start)
+            raise
+        self.instrumentation.request_ended(
+            "log_analytics",
+            operation,
+            response.status,
+            time.monotonic() - start,
+            bytes_sent=len(body),
+            bytes_received=len(content)
+        )
         if 200 <= response.status <= 299:
             logger.info('Data accepted by azure log analytics')
             return True
         else:
-            logger.warning("Data refused by azure log analytics.", extra=dict(response_code=response.status_code))
+            logger.warning("Data refused by azure log analytics.", extra=dict(response_code=response.status))
             return False
 
     def send_json(self, data):
-        uri, body, headers = self._prepare_request(data)
-        response = requests.post(uri, data=body, headers=headers)
+        """
+        Returns
+        -------
+        bool: True if all data was accepted
+        """
+        accepted = [self._send_body(body, "send_json") for body in self._split_body(data)]
+        return all(accepted)
+
+    def _send_body(self, body, operation):
+        return 200 <= self._post_body(body, operation) <= 299
+
+    def _post_body(self, body, operation):
+        """
+        Returns
+        -------
+        int: response status
+        """
+        uri, body, headers = self._prepare_body_request(body)
+        self.instrumentation.request_started("log_analytics", operation)
+        start = time.monotonic()
+        try:
+            response = self._get_requests_session().post(uri, data=body, headers=headers)
+        except BaseException as e:
+            self.instrumentation.request_failed("log_analytics", operation, e, time.monotonic() - start)
+            raise
+        self.instrumentation.request_ended(
+            "log_analytics",
+            operation,
+            response.status_code,
+            time.monotonic() - start,
+            bytes_sent=len(body),
+            bytes_received=len(response.content)
+        )
         if 200 <= response.status_code <= 299:
             logger.info('Data accepted by azure log analytics')
-            return True
         else:
             logger.warning("Data refused by azure log analytics.", extra=dict(response_code=response.status_code))
-            return False
+        return response.status_code
+
+    def _split_body(self, data):
+        """
+        Serializes data to utf-8 bodies. A list is split into bodies of at most max_body_size bytes, each record being
+        serialized once.
+        """
+        if not isinstance(data, list):
+            body = dumpb(data)
+            if len(body) > self.max_body_size:
+                raise ValueError(f"data is bigger than max_body_size ({len(body)} bytes)")
+            return [body]
+        return [body for body, _ in self._split_records(data)]
+
+    def _split_records(self, records):
+        """
+        Returns
+        -------
+        list of (body, number of records in body)
+        """
+        bodies = []
+        serialized_records = []
+        # brackets
+        size = 1
+        for record in records:
+            serialized = dumpb(record)
+            if len(serialized) + 2 > self.max_body_size:
+                raise ValueError(f"record is bigger than max_body_size ({len(serialized)} bytes)")
+            if serialized_records and size + len(serialized) + 1 > self.max_body_size:
+                bodies.append((b"[" + b",".join(serialized_records) + b"]", len(serialized_records)))
+                serialized_records = []
+                size = 1
+            serialized_records.append(serialized)
+            # separator
+            size += len(serialized) + 1
+        bodies.append((b"[" + b",".join(serialized_records) + b"]", len(serialized_records)))
+        return bodies
 
     def _prepare_request(self, data):
-        body = dumps(data)
+        return self._prepare_body_request(dumpb(data))
+
+    def _prepare_body_request(self, body):
+        """
+        Parameters
+        ----------
+        body: bytes
+            utf-8 encoded json
+        """
         method = 'POST'
         content_type = 'application/json'
         resource = '/api/logs'
         rfc1123date = datetime.datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S GMT')
-        content_length = len(body)
-        signature = self._build_signature(self._customer_id, self._shared_key, rfc1123date, content_length, method, content_type, resource)
-        uri = 'https://' + self._customer_id + '.ods.opinsights.azure.com' + resource + '?api-version=2016-04-01'
         headers = {
             'content-type': content_type,
-            'Authorization': signature,
             'Log-Type': self.log_type,
             'x-ms-date': rfc1123date
         }
+        if self.compress:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        # signature uses the length in bytes of the body that is sent
+        content_length = len(body)
+        headers['Authorization'] = self._build_signature(
+            self._customer_id, self._shared_key, rfc1123date, content_length, method, content_type, resource)
+        uri = 'https://' + self._customer_id + '.ods.opinsights.azure.com' + resource + '?api-version=2016-04-01'
         return uri, body, headers
 
     @staticmethod
@@ -65,3 +244,280 @@ class LogAnalyticsClient:
         authorization = "SharedKey {}:{}".format(customer_id, encoded_hash.decode('utf-8'))
         return authorization
 
+
+class LogAnalyticsBuffer:
+    """
+    Accumulates records and sends them by batches through the async api of a LogAnalyticsClient.
+
+    A batch is sent when max_records records or max_bytes bytes are buffered, or flush_interval seconds after the
+    previous batch. max_bytes is capped to the max_body_size of the client. When max_buffered_records records are
+    waiting, add() applies the overflow policy: 'block' (waits for the next batch to be sent), 'drop_newest' (the
+    added record is dropped) or 'drop_oldest'.
+
+    close() (or leaving the async context manager) sends the remaining records and stops the background task. Must be
+    used from a single event loop.
+    """
+    def __init__(
+            self,
+            client,
+            max_records=500,
+            max_bytes=MAX_BODY_SIZE,
+            flush_interval=5.,
+            max_buffered_records=10000,
+            overflow=OVERFLOW_BLOCK
+    ):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST):
+            raise ValueError(f"unknown overflow policy: {overflow}")
+        if max_bytes > MAX_BODY_SIZE:
+            raise ValueError(f"max_bytes must not exceed {MAX_BODY_SIZE}")
+        self.client = client
+        self.max_records = max_records
+        self.max_bytes = min(max_bytes, client.max_body_size)
+        self.flush_interval = flush_interval
+        self.max_buffered_records = max_buffered_records
+        self.overflow = overflow
+
+        self.sent_records = 0
+        self.failed_records = 0
+        self.dropped_records = 0
+
+        # serialized records
+        self._records = collections.deque()
+        self._bytes = 0
+        self._flush_event = None
+        self._space_event = None
+        self._flush_lock = None
+        self._task = None
+        self._closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def _start(self):
+        self._flush_event = asyncio.Event()
+        self._space_event = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def add(self, record):
+        """
+        Parameters
+        ----------
+        record: dict
+        """
+        if self._closed:
+            raise RuntimeError("buffer is closed")
+        if self._task is None:
+            self._start()
+        serialized = dumpb(record)
+        # 2 bytes for brackets of a single record batch
+        if len(serialized) + 2 > self.max_bytes:
+            raise ValueError(f"record is bigger than max_bytes ({len(serialized)} bytes)")
+
+        while len(self._records) >= self.max_buffered_records:
+            if self.overflow == OVERFLOW_DROP_NEWEST:
+                self.dropped_records += 1
+                return
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                self._bytes -= len(self._records.popleft()) + 1
+                self.dropped_records += 1
+                continue
+            self._flush_event.set()
+            self._space_event.clear()
+            await self._space_event.wait()
+
+        self._records.append(serialized)
+        # 1 byte for the separator
+        self._bytes += len(serialized) + 1
+        if len(self._records) >= self.max_records or self._bytes + 1 >= self.max_bytes:
+            self._flush_event.set()
+
+    async def flush(self):
+        """
+        Sends all buffered records.
+        """
+        if self._task is None:
+            return
+        async with self._flush_lock:
+            while self._records:
+                await self._send_batch()
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._task is not None:
+            # wakes the background task up, which sends a last batch and exits
+            self._flush_event.set()
+            await self._task
+            await self.flush()
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            async with self._flush_lock:
+                # one batch (partial on interval), then the full batches buffered meanwhile
+                await self._send_batch()
+                while len(self._records) >= self.max_records or self._bytes + 1 >= self.max_bytes:
+                    await self._send_batch()
+
+    async def _send_batch(self):
+        batch = []
+        # 2 bytes for brackets
+        size = 1
+        while self._records and len(batch) < self.max_records and size + len(self._records[0]) + 1 <= self.max_bytes:
+            record = self._records.popleft()
+            batch.append(record)
+            size += len(record) + 1
+        if not batch:
+            return
+        self._bytes -= size - 1
+        self._space_event.set()
+
+        try:
+            accepted = await self.client._send_body_async(b"[" + b",".join(batch) + b"]", "send_batch_async")
+        except Exception:
+            logger.exception("could not send batch to azure log analytics")
+            accepted = False
+        if accepted:
+            self.sent_records += len(batch)
+        else:
+            self.failed_records += len(batch)
+
+
+class LogAnalyticsSender:
+    """
+    Sends records from a background thread through the sync api of a LogAnalyticsClient, so that callers (django
+    views...) never wait for the network.
+
+    send() only enqueues the record. If max_queued_records records are waiting, the record is dropped (and counted in
+    dropped_records). The thread sends batches of at most max_records records, at most flush_interval seconds after the
+    first record of the batch was queued. Bodies refused with a retryable status or failing with a connection error
+    are sent again, at most retries times, with an exponential backoff.
+
+    close() sends the remaining records and stops the thread.
+    """
+    def __init__(
+            self,
+            client,
+            max_records=500,
+            flush_interval=5.,
+            max_queued_records=10000,
+            retries=3,
+            retry_delay=1.
+    ):
+        self.client = client
+        self.max_records = max_records
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+        self.sent_records = 0
+        self.failed_records = 0
+        self.dropped_records = 0
+
+        self._queue = queue.Queue(maxsize=max_queued_records)
+        self._stop = object()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="oazure-log-analytics-sender", daemon=True)
+        self._thread.start()
+
+    def send(self, record):
+        """
+        Parameters
+        ----------
+        record: dict
+
+        Returns
+        -------
+        bool: False if the record was dropped
+        """
+        if self._closed:
+            raise RuntimeError("sender is closed")
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_records += 1
+            return False
+        return True
+
+    def flush(self):
+        """
+        Blocks until all queued records were processed.
+        """
+        self._queue.join()
+
+    def close(self, timeout=None):
+        if self._closed:
+            return
+        self._closed = True
+        # blocks if queue is full, until the thread makes room
+        self._queue.put(self._stop)
+        self._thread.join(timeout)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = []
+            first = self._queue.get()
+            if first is self._stop:
+                self._queue.task_done()
+                break
+            batch.append(first)
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_records:
+                try:
+                    record = self._queue.get(timeout=max(0., deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is self._stop:
+                    self._queue.task_done()
+                    stop = True
+                    break
+                batch.append(record)
+            try:
+                self._send_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _send_batch(self, batch):
+        # each record is counted once, in sent_records or failed_records
+        try:
+            bodies = self.client._split_records(batch)
+        except Exception:
+            logger.exception("could not serialize batch for azure log analytics")
+            self.failed_records += len(batch)
+            return
+        for body, records_nb in bodies:
+            try:
+                accepted = self._send_body(body)
+            except Exception:
+                logger.exception("could not send batch to azure log analytics")
+                accepted = False
+            if accepted:
+                self.sent_records += records_nb
+            else:
+                self.failed_records += records_nb
+
+    def _send_body(self, body):
+        import requests
+        status = None
+        for retry in range(self.retries + 1):
+            if retry > 0:
+                time.sleep(self.retry_delay * 2 ** (retry - 1))
+            try:
+                status = self.client._post_body(body, "send_batch")
+            except requests.RequestException:
+                logger.warning("could not reach azure log analytics", exc_info=True)
+                continue
+            if status not in RETRY_STATUSES:
+                break
+        return status is not None and 200 <= status <= 299
@@ -0,0 +1,150 @@
+import time
+import asyncio
+
+
+class TokenBucket:
+    """
+    Allows rate tokens per second on average, and bursts of at most capacity tokens (defaults to rate).
+
+    Not thread safe.
+    """
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self.tokens = self.capacity
+        self._clock = clock
+        self._last = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_consume(self, tokens=1):
+        """
+        Returns
+        -------
+        bool: True if tokens were available (they are consumed), False else (nothing is consumed)
+        """
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def reserve(self, tokens=1):
+        """
+        Consumes tokens, even if they are not available yet (the bucket goes in debt).
+
+        Returns
+        -------
+        float: seconds to wait until the reserved tokens are available (0 if they already are)
+        """
+        self._refill()
+        self.tokens -= tokens
+        return 0. if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class BlobRateLimiter:
+    """
+    Client side rate limits of AsyncBlobAPI requests, to stay below azure storage targets instead of being throttled:
+    token buckets per account, per container and per blob, for requests and bytes (sent and received) per second. A
+    None rate disables the limit. Buckets allow bursts of burst seconds of their rate.
+
+    Requests over budget wait (asyncio sleep) instead of failing. Tokens are reserved when a request arrives, so
+    waiting requests are served in arrival order. Received bytes are only known after a response: they are charged
+    then, and delay the next requests.
+
+    Not thread safe (used from the event loop).
+    """
+    def __init__(
+            self,
+            account_requests=20000,
+            account_bytes=None,
+            container_requests=None,
+            container_bytes=None,
+            blob_requests=500,
+            blob_bytes=None,
+            burst=1.,
+            max_buckets=10000,
+            clock=time.monotonic
+    ):
+        # scope: (requests rate, bytes rate)
+        self._rates = dict(
+            account=(account_requests, account_bytes),
+            container=(container_requests, container_bytes),
+            blob=(blob_requests, blob_bytes)
+        )
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self._clock = clock
+        # (scope, key, 'requests' or 'bytes'): TokenBucket
+        self._buckets = {}
+
+    def _get_buckets(self, container_name, blob_name, kind):
+        keys = [("account", None)]
+        if container_name is not None:
+            keys.append(("container", container_name))
+            if blob_name is not None:
+                keys.append(("blob", (container_name, blob_name)))
+        buckets = []
+        for scope, key in keys:
+            rate = self._rates[scope][0 if kind == "requests" else 1]
+            if rate is None:
+                continue
+            bucket = self._buckets.get((scope, key, kind))
+            if bucket is None:
+                if len(self._buckets) >= self.max_buckets:
+                    self._evict()
+                bucket = self._buckets[(scope, key, kind)] = TokenBucket(
+                    rate, capacity=max(1, rate * self.burst), clock=self._clock)
+            buckets.append(bucket)
+        return buckets
+
+    def _evict(self):
+        # full buckets are idle, they would be recreated identical
+        for key, bucket in list(self._buckets.items()):
+            bucket._refill()
+            if bucket.tokens >= bucket.capacity:
+                del self._buckets[key]
+
+    def reserve(self, container_name=None, blob_name=None, bytes_nb=0):
+        """
+        Reserves a request (and bytes_nb bytes).
+
+        Returns
+        -------
+        float: seconds to wait before sending the request
+        """
+        delay = 0.
+        for bucket in self._get_buckets(container_name, blob_name, "requests"):
+            delay = max(delay, bucket.reserve())
+        if bytes_nb:
+            delay = max(delay, self.consume(container_name, blob_name, bytes_nb))
+        return delay
+
+    def consume(self, container_name=None, blob_name=None, bytes_nb=0):
+        """
+        Charges bytes_nb bytes (received bytes, for example) without waiting.
+
+        Returns
+        -------
+        float: seconds before the bytes budget is available again
+        """
+        delay = 0.
+        for bucket in self._get_buckets(container_name, blob_name, "bytes"):
+            delay = max(delay, bucket.reserve(bytes_nb))
+        return delay
+
+    async def acquire(self, container_name=None, blob_name=None, bytes_nb=0):
+        """
+        Waits until a request (and bytes_nb bytes) may be sent.
+
+        Returns
+        -------
+        float: seconds waited
+        """
+        delay = self.reserve(container_name, blob_name, bytes_nb)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
@@ -0,0 +1,203 @@
+import base64
+import hmac
+import hashlib
+import math
+import time
+import datetime as dt
+from urllib.parse import quote
+
+# same version and token layout as azure-storage-blob 2.x generate_*_shared_access_signature
+SAS_VERSION = "2019-02-02"
+SAS_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+BLOB_RESOURCE = "b"
+CONTAINER_RESOURCE = "c"
+
+# permissions must be given in this order
+PERMISSIONS_ORDER = "racwd"
+
+
+def make_permission(read=False, add=False, create=False, write=False, delete=False):
+    """
+    Returns
+    -------
+    str: permission string, same as str(azure.storage.blob.BlobPermissions(...))
+    """
+    return (
+        ("r" if read else "") +
+        ("a" if add else "") +
+        ("c" if create else "") +
+        ("w" if write else "") +
+        ("d" if delete else "")
+    )
+
+
+class BlobSasSigner:
+    """
+    Generates service SAS tokens with an account key, without the storage sdk (the key is only decoded once).
+
+    Tokens are identical to the sdk ones (BlockBlobService.generate_blob_shared_access_signature) for the same
+    arguments.
+    """
+    def __init__(self, account_name, account_key, endpoint=None, protocol="https"):
+        self.account_name = account_name
+        self.endpoint = f"{account_name}.blob.core.windows.net" if endpoint is None else endpoint
+        self.protocol = protocol
+        self._hmac = hmac.new(base64.b64decode(account_key), digestmod=hashlib.sha256)
+
+    def _sign(self, string_to_sign):
+        # copying the keyed hmac skips the key setup
+        digest = self._hmac.copy()
+        digest.update(string_to_sign.encode("utf-8"))
+        return base64.b64encode(digest.digest()).decode("utf-8")
+
+    def _token(self, canonicalized_resource, resource, permission, expiry, start=None):
+        # expiry and start: utc datetimes or already formatted strings
+        if isinstance(expiry, dt.datetime):
+            expiry = expiry.strftime(SAS_DATE_FORMAT)
+        if isinstance(start, dt.datetime):
+            start = start.strftime(SAS_DATE_FORMAT)
+        string_to_sign = "\n".join((
+            permission,
+            start or "",
+            expiry,
+            canonicalized_resource,
+            "",  # signed identifier
+            "",  # ip
+            self.protocol,
+            SAS_VERSION,
+            resource,
+            "",  # snapshot
+            "", "", "", "", ""  # response headers
+        ))
+        query = [] if start is None else [("st", start)]
+        query.extend((
+            ("se", expiry),
+            ("sp", permission),
+            ("spr", self.protocol),
+            ("sv", SAS_VERSION),
+            ("sr", resource),
+            ("sig", self._sign(string_to_sign))
+        ))
+        return "&".join(f"{name}={quote(value)}" for name, value in query)
+
+    def blob_sas(self, container_name, blob_name, permission, expiry, start=None):
+        """
+        Parameters
+        ----------
+        permission: str
+            see make_permission
+        expiry: datetime (utc) or str (SAS_DATE_FORMAT)
+        start: datetime (utc) or str (SAS_DATE_FORMAT), optional
+
+        Returns
+        -------
+        str: sas token (url query, without '?')
+        """
+        return self._token(
+            f"/blob/{self.account_name}/{container_name}/{blob_name}",
+            BLOB_RESOURCE,
+            permission,
+            expiry,
+            start=start
+        )
+
+    def container_sas(self, container_name, permission, expiry, start=None):
+        """
+        Token granting permission on all blobs of the container. See blob_sas.
+        """
+        return self._token(
+            f"/blob/{self.account_name}/{container_name}",
+            CONTAINER_RESOURCE,
+            permission,
+            expiry,
+            start=start
+        )
+
+    def blob_url(self, container_name, blob_name, sas_token=None):
+        """
+        Same as BlockBlobService.make_blob_url (blob name is not quoted).
+        """
+        url = f"{self.protocol}://{self.endpoint}/{container_name}/{blob_name}"
+        return url if sas_token is None else f"{url}?{sas_token}"
+
+
+class SasCache:
+    """
+    Caches the SAS tokens of a BlobSasSigner.
+
+    Expiries are rounded up to a multiple of rounding seconds: a token is valid between sas_expiry and
+    sas_expiry + rounding seconds, and the same token (and url) is returned for a given blob and permission during
+    rounding seconds. Tokens of a previous expiry are dropped.
+
+    Thread safe: a token is always stored with the expiry it was signed with.
+    """
+    def __init__(self, signer, sas_expiry, rounding=60, clock=time.time):
+        self.signer = signer
+        self.sas_expiry = sas_expiry
+        self.rounding = rounding
+        self._clock = clock
+        # expiry, expiry str, tokens of this expiry ((container, blob, permission): token, blob is None for container
+        # tokens), replaced at once so that threads never mix expiries
+        self._state = (None, None, {})
+
+    def _get_state(self):
+        # returns expiry str and its tokens
+        expiry = math.ceil((self._clock() + self.sas_expiry) / self.rounding) * self.rounding
+        state = self._state
+        if expiry != state[0]:
+            state = self._state = (expiry, dt.datetime.utcfromtimestamp(expiry).strftime(SAS_DATE_FORMAT), {})
+        return state[1], state[2]
+
+    def blob_sas(self, container_name, blob_name, permission):
+        expiry, tokens = self._get_state()
+        key = (container_name, blob_name, permission)
+        try:
+            return tokens[key]
+        except KeyError:
+            token = tokens[key] = self.signer.blob_sas(container_name, blob_name, permission, expiry)
+            return token
+
+    def container_sas(self, container_name, permission):
+        expiry, tokens = self._get_state()
+        key = (container_name, None, permission)
+        try:
+            return tokens[key]
+        except KeyError:
+            token = tokens[key] = self.signer.container_sas(container_name, permission, expiry)
+            return token
+
+    def blob_url(self, container_name, blob_name, permission, container_scope=False):
+        """
+        Parameters
+        ----------
+        container_scope: bool
+            if True, the url is signed with the container token (grants permission on all blobs of the container)
+        """
+        if container_scope:
+            token = self.container_sas(container_name, permission)
+        else:
+            token = self.blob_sas(container_name, blob_name, permission)
+        return self.signer.blob_url(container_name, blob_name, token)
+
+    def blob_urls(self, container_name, blob_names, permission, container_scope=False):
+        """
+        Returns
+        -------
+        list of urls (same order as blob_names)
+        """
+        if container_scope:
+            # no signature per blob
+            prefix = self.signer.blob_url(container_name, "")
+            suffix = "?" + self.container_sas(container_name, permission)
+            return [prefix + blob_name + suffix for blob_name in blob_names]
+        expiry, tokens = self._get_state()
+        signer = self.signer
+        urls = []
+        for blob_name in blob_names:
+            key = (container_name, blob_name, permission)
+            token = tokens.get(key)
+            if token is None:
+                token = tokens[key] = signer.blob_sas(container_name, blob_name, permission, expiry)
+            urls.append(signer.blob_url(container_name, blob_name, token))
+        return urls
@@ -0,0 +1,45 @@
+import aiohttp
+
+DEFAULT_CONNECTOR_LIMIT = 100
+DEFAULT_CONNECTOR_LIMIT_PER_HOST = 0
+DEFAULT_KEEPALIVE_TIMEOUT = 30
+DEFAULT_TTL_DNS_CACHE = 300
+
+
+def create_session(
+        limit=DEFAULT_CONNECTOR_LIMIT,
+        limit_per_host=DEFAULT_CONNECTOR_LIMIT_PER_HOST,
+        keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=DEFAULT_TTL_DNS_CACHE,
+        **session_kwargs
+):
+    """
+    Creates an aiohttp session with a sized connection pool. The same session may be shared by several clients
+    (AzureBatchClient, AsyncBlobAPI calls...) so that they all reuse one pool of warm connections.
+
+    Must be called from a coroutine (or with a running event loop), and closed by the caller.
+
+    Parameters
+    ----------
+    limit: int
+        total number of simultaneous connections (0 for no limit)
+    limit_per_host: int
+        number of simultaneous connections to the same endpoint (0 for no limit)
+    keepalive_timeout: float
+        seconds an idle connection is kept in the pool
+    ttl_dns_cache: int
+        seconds DNS resolutions are cached (None to cache forever)
+    session_kwargs:
+        forwarded to aiohttp.ClientSession
+
+    Returns
+    -------
+    aiohttp.ClientSession
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=keepalive_timeout,
+        ttl_dns_cache=ttl_dns_cache
+    )
+    return aiohttp.ClientSession(connector=connector, **session_kwargs)
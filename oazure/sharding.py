@@ -0,0 +1,302 @@
+import asyncio
+import bisect
+import hashlib
+import heapq
+import inspect
+import time
+import datetime as dt
+from urllib.parse import quote
+
+from .async_blob_storage import AsyncBlobAPI, AzureBlobStorageAsyncError
+from .sas import BlobSasSigner, make_permission
+
+# points of each account on the ring, more points spread blobs more evenly
+DEFAULT_REPLICAS = 100
+# validity of the SAS of cross account copies
+COPY_SAS_EXPIRY = 3600
+# validity of the SAS of rebalance copies after their timeout (time to abort them)
+COPY_SAS_MARGIN = 300
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hashing: adding or removing a node only moves the keys of this node (about 1/n of the keys).
+    """
+    def __init__(self, nodes, replicas=DEFAULT_REPLICAS):
+        self.nodes = list(nodes)
+        if len(set(self.nodes)) != len(self.nodes):
+            raise ValueError("nodes must be unique")
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def get_node(self, key):
+        i = bisect.bisect(self._hashes, _hash(key))
+        return self._nodes[i % len(self._nodes)]
+
+
+def _blob_key(container_name, blob_name):
+    return container_name + "/" + blob_name
+
+
+def _routed(name):
+    # method of the shard of the (container_name, blob_name) arguments, positional or keyword
+    signature = inspect.signature(getattr(AsyncBlobAPI, name))
+
+    async def method(self, *args, **kwargs):
+        arguments = signature.bind(self, *args, **kwargs).arguments
+        shard = self.get_shard(arguments["container_name"], arguments["blob_name"])
+        return await getattr(shard, name)(*args, **kwargs)
+    method.__name__ = name
+    method.__signature__ = signature
+    method.__doc__ = f"Same as AsyncBlobAPI.{name}, on the account of the blob."
+    return method
+
+
+class ShardedBlobAPI:
+    """
+    Spreads blobs over several storage accounts (AsyncBlobAPI instances, one per account): each (container, blob) is
+    stored by the account chosen by consistent hashing of its name.
+
+    Blob methods are the ones of AsyncBlobAPI, routed to the account of the blob. Container methods (create_container,
+    delete_container) apply to all accounts, listings (list_blobs, list_blobs_properties, iter_blobs, container_size)
+    are requested to all accounts concurrently and merged. copy_blob copies across accounts if needed.
+
+    Adding an account moves about 1/n of the blobs, see rebalance.
+    """
+    def __init__(self, blob_apis, replicas=DEFAULT_REPLICAS):
+        self.blob_apis = dict((blob_api.account_name, blob_api) for blob_api in blob_apis)
+        self.ring = HashRing(self.blob_apis, replicas=replicas)
+
+    def get_shard(self, container_name, blob_name):
+        """
+        Returns
+        -------
+        AsyncBlobAPI storing the blob
+        """
+        return self.blob_apis[self.ring.get_node(_blob_key(container_name, blob_name))]
+
+    get_blob = _routed("get_blob")
+    get_blob_to_text = _routed("get_blob_to_text")
+    get_blob_with_etag = _routed("get_blob_with_etag")
+    get_blob_size = _routed("get_blob_size")
+    get_blob_properties = _routed("get_blob_properties")
+    get_blob_range = _routed("get_blob_range")
+    write_blob = _routed("write_blob")
+    write_blob_from_text = _routed("write_blob_from_text")
+    write_blob_conditional = _routed("write_blob_conditional")
+    delete_blob = _routed("delete_blob")
+    delete_blob_conditional = _routed("delete_blob_conditional")
+    update_blob = _routed("update_blob")
+    create_append_blob = _routed("create_append_blob")
+    append_block = _routed("append_block")
+    put_block = _routed("put_block")
+    put_block_list = _routed("put_block_list")
+    get_block_list = _routed("get_block_list")
+    make_block_id = staticmethod(AsyncBlobAPI.make_block_id)
+    acquire_lease = _routed("acquire_lease")
+    release_lease = _routed("release_lease")
+    renew_lease = _routed("renew_lease")
+    abort_copy_blob = _routed("abort_copy_blob")
+
+    async def iter_blob(self, container_name, blob_name, session, **kwargs):
+        async for chunk in self.get_shard(container_name, blob_name).iter_blob(
+                container_name, blob_name, session, **kwargs):
+            yield chunk
+
+    async def _fan_out(self, name, *args, **kwargs):
+        return await asyncio.gather(*(
+            getattr(blob_api, name)(*args, **kwargs) for blob_api in self.blob_apis.values()))
+
+    async def create_container(self, container_name, session, timeout=None):
+        await self._fan_out("create_container", container_name, session, timeout=timeout)
+
+    async def delete_container(self, container_name, session, timeout=None):
+        await self._fan_out("delete_container", container_name, session, timeout=timeout)
+
+    async def container_size(self, container_name, session, timeout=None):
+        return sum(await self._fan_out("container_size", container_name, session, timeout=timeout))
+
+    async def _list_page(self, name, container_name, session, marker, maxresults, prefix, timeout):
+        # marker: None (first page) or tuple of account markers, False for accounts that were fully listed
+        markers = (None,) * len(self.blob_apis) if marker is None else marker
+        pages = await asyncio.gather(*(
+            self._list_account_page(
+                blob_api, name, container_name, session, blob_api_marker, maxresults, prefix, timeout)
+            for blob_api, blob_api_marker in zip(self.blob_apis.values(), markers)
+        ))
+        # list_blobs returns an empty marker after the last page
+        next_markers = tuple(next_marker or False for next_marker, _ in pages)
+        return (
+            None if all(next_marker is False for next_marker in next_markers) else next_markers,
+            [items for _, items in pages]
+        )
+
+    @staticmethod
+    async def _list_account_page(blob_api, name, container_name, session, marker, maxresults, prefix, timeout):
+        if marker is False:
+            return None, []
+        return await getattr(blob_api, name)(
+            container_name, session, marker=marker, maxresults=maxresults, prefix=prefix, timeout=timeout)
+
+    async def list_blobs(self, container_name, session, marker=None, maxresults=None, prefix=None, timeout=None):
+        """
+        Same as AsyncBlobAPI.list_blobs: a page holds at most maxresults names per account, sorted. The marker is
+        opaque (tuple of account markers).
+        """
+        marker, pages = await self._list_page(
+            "list_blobs", container_name, session, marker, maxresults, prefix, timeout)
+        return marker, list(heapq.merge(*pages))
+
+    async def list_blobs_properties(
+            self,
+            container_name,
+            session,
+            marker=None,
+            maxresults=None,
+            prefix=None,
+            timeout=None
+    ):
+        """
+        See list_blobs.
+        """
+        marker, pages = await self._list_page(
+            "list_blobs_properties", container_name, session, marker, maxresults, prefix, timeout)
+        return marker, list(heapq.merge(*pages, key=lambda blob: blob["name"]))
+
+    async def iter_blobs(self, container_name, session, prefix=None, page_size=None, timeout=None):
+        """
+        Same as AsyncBlobAPI.iter_blobs, pages of all accounts are requested concurrently (blobs are sorted by page).
+        """
+        marker = None
+        while True:
+            marker, blobs = await self.list_blobs_properties(
+                container_name,
+                session,
+                marker=marker,
+                maxresults=page_size,
+                prefix=prefix,
+                timeout=timeout
+            )
+            for blob in blobs:
+                yield blob
+            if marker is None:
+                return
+
+    def _source_url(self, blob_api, container_name, blob_name, expiry=COPY_SAS_EXPIRY):
+        signer = BlobSasSigner(blob_api.account_name, blob_api.account_key)
+        token = signer.blob_sas(
+            container_name,
+            blob_name,
+            make_permission(read=True),
+            dt.datetime.utcnow() + dt.timedelta(seconds=expiry)
+        )
+        # encoded: blob names may contain spaces, '#', '?' or non ascii characters
+        path = quote(f"{container_name}/{blob_name}", safe="/")
+        return f"{signer.protocol}://{signer.endpoint}/{path}?{token}"
+
+    async def copy_blob(
+            self,
+            source_container_name,
+            source_blob_name,
+            dest_container_name,
+            dest_blob_name,
+            session,
+            timeout=None
+    ):
+        """
+        Same as AsyncBlobAPI.copy_blob, from a SAS url of the source if the destination is on another account.
+        """
+        source = self.get_shard(source_container_name, source_blob_name)
+        dest = self.get_shard(dest_container_name, dest_blob_name)
+        if source is dest:
+            return await source.copy_blob(
+                source_container_name, source_blob_name, dest_container_name, dest_blob_name, session, timeout=timeout)
+        return await dest.copy_blob_from_url(
+            self._source_url(source, source_container_name, source_blob_name),
+            dest_container_name,
+            dest_blob_name,
+            session,
+            timeout=timeout
+        )
+
+
+async def plan_rebalance(old_api, new_api, container_name, session, prefix=None):
+    """
+    Parameters
+    ----------
+    old_api, new_api: ShardedBlobAPI, before and after accounts were added (or removed)
+
+    Returns
+    -------
+    list of (blob_name, source AsyncBlobAPI, destination AsyncBlobAPI) of the blobs that change of account
+    """
+    moves = []
+    for account_name, blob_api in old_api.blob_apis.items():
+        async for blob in blob_api.iter_blobs(container_name, session, prefix=prefix):
+            dest = new_api.get_shard(container_name, blob["name"])
+            if dest.account_name != account_name:
+                moves.append((blob["name"], blob_api, dest))
+    return moves
+
+
+async def rebalance(
+        old_api,
+        new_api,
+        container_name,
+        session,
+        prefix=None,
+        concurrency=8,
+        poll_interval=1.,
+        copy_timeout=COPY_SAS_EXPIRY,
+        dry_run=False
+):
+    """
+    Moves the blobs of a container to their account in new_api (server side copies, then deletes of the sources).
+    Destination containers must exist. Blobs must not be written while they are moved.
+
+    Copies still pending after copy_timeout seconds are aborted (their destination is deleted, their source is kept)
+    and AzureBlobStorageAsyncError is raised: the SAS of the sources are valid copy_timeout + COPY_SAS_MARGIN seconds,
+    so that a copy never outlives the SAS it reads with.
+
+    Returns
+    -------
+    list of moves, see plan_rebalance
+    """
+    moves = await plan_rebalance(old_api, new_api, container_name, session, prefix=prefix)
+    if dry_run:
+        return moves
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def move(blob_name, source, dest):
+        async with semaphore:
+            status, copy_id = await dest.copy_blob_from_url(
+                old_api._source_url(source, container_name, blob_name, expiry=copy_timeout + COPY_SAS_MARGIN),
+                container_name,
+                blob_name,
+                session
+            )
+            deadline = time.monotonic() + copy_timeout
+            while status == "pending":
+                if time.monotonic() >= deadline:
+                    await dest.abort_copy_blob(container_name, blob_name, copy_id, session)
+                    await dest.delete_blob(container_name, blob_name, session)
+                    raise AzureBlobStorageAsyncError(
+                        'CopyTimeout\nContainer name : {}\nBlob name : {}'.format(container_name, blob_name))
+                await asyncio.sleep(poll_interval)
+                status = (await dest.get_blob_properties(container_name, blob_name, session))["copy_status"]
+            if status != "success":
+                raise AzureBlobStorageAsyncError(
+                    'Copy {}\nContainer name : {}\nBlob name : {}'.format(status, container_name, blob_name))
+            await source.delete_blob(container_name, blob_name, session)
+
+    # every move ends (copied or aborted) before an error is raised
+    results = await asyncio.gather(*(move(*move_args) for move_args in moves), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return moves
@@ -1,12 +1,48 @@
 """
 opysnippets/ojson:1.0.0
 """
+import io
+import re
 import json
+import contextlib
 import datetime as dt
 from uuid import UUID
 from collections import OrderedDict
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 ISO_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+# strings strptime may parse with ISO_FORMAT, and the shape dumps writes (parsed without strptime)
+_ISO_CANDIDATE = re.compile(r"\d{4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}\.\d{1,6}Z")
+_ISO_CANONICAL = re.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{1,6}Z")
+
+JSON_BACKEND = "json"
+ORJSON_BACKEND = "orjson"
+
+# orjson output differs from the standard library (see dumpb): it is only used once selected
+_backend = JSON_BACKEND
+
+
+def set_backend(backend):
+    """
+    Parameters
+    ----------
+    backend: str
+        'json' (standard library, default) or 'orjson' (must be installed, see dumpb for its differences)
+    """
+    global _backend
+    if backend not in (JSON_BACKEND, ORJSON_BACKEND):
+        raise ValueError(f"unknown backend: {backend}")
+    if backend == ORJSON_BACKEND and orjson is None:
+        raise ImportError("orjson is not installed")
+    _backend = backend
+
+
+def get_backend():
+    return _backend
 
 
 class _MyJSONEncoder(json.JSONEncoder):
@@ -21,28 +57,89 @@ class _MyJSONEncoder(json.JSONEncoder):
 
 
 def _json_str_to_o(s):
+    # most strings are rejected by this check
+    if s[-1:] != "Z" or _ISO_CANDIDATE.fullmatch(s) is None:
+        return s
     try:
+        if _ISO_CANONICAL.fullmatch(s) is not None:
+            return dt.datetime(
+                int(s[0:4]),
+                int(s[5:7]),
+                int(s[8:10]),
+                int(s[11:13]),
+                int(s[14:16]),
+                int(s[17:19]),
+                int(s[20:-1].ljust(6, "0"))
+            )
         return dt.datetime.strptime(s, ISO_FORMAT)
     except ValueError:
         return s
 
 
-def _parse_dates(o):
-    if isinstance(o, str):
-        return _json_str_to_o(o)
-    elif isinstance(o, dict):
-        iterable = o.items()
-    elif isinstance(o, list):
-        iterable = enumerate(o)
-    else:
+def _parse_list_dates(root):
+    # iterative, lists may be deeply nested
+    stack = [root]
+    while stack:
+        values = stack.pop()
+        for i, value in enumerate(values):
+            if isinstance(value, str):
+                values[i] = _json_str_to_o(value)
+            elif isinstance(value, list):
+                stack.append(value)
+
+
+def _make_object_pairs_hook(mapping_class):
+    # objects are decoded from the innermost, so only their str and list values need to be parsed
+    def object_pairs_hook(pairs):
+        o = mapping_class(pairs)
+        for key, value in o.items():
+            if isinstance(value, str):
+                o[key] = _json_str_to_o(value)
+            elif isinstance(value, list):
+                _parse_list_dates(value)
         return o
-    # is iterable
-    for k, v in list(iterable):
-        o[k] = _parse_dates(v)
-    return o
+    return object_pairs_hook
+
+
+_ordered_object_pairs_hook = _make_object_pairs_hook(OrderedDict)
+_dict_object_pairs_hook = _make_object_pairs_hook(dict)
+
+
+if orjson is not None:
+    # datetimes and dataclasses go through _orjson_default, like with the standard library
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+def _orjson_default(o):
+    if isinstance(o, dt.datetime):
+        return o.strftime(ISO_FORMAT)
+    if isinstance(o, set):
+        return list(o)
+    raise TypeError
+
+
+def dumpb(o, **kwargs):
+    """
+    Same as dumps, but returns utf-8 encoded bytes (without an intermediate str with the orjson backend).
+
+    The orjson backend (if selected with set_backend) is used when no kwargs are given. Its output is compact and not
+    ascii escaped, it writes nan and infinity as null (the standard library writes NaN and Infinity) and serializes
+    enums. Objects it can't serialize (integers above 64 bits, non str keys...) fall back to the standard library.
+    """
+    if _backend == ORJSON_BACKEND and not kwargs:
+        try:
+            return orjson.dumps(o, default=_orjson_default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            pass
+    return json.dumps(o, cls=_MyJSONEncoder, **kwargs).encode("utf-8")
 
 
 def dumps(o, **kwargs):
+    if _backend == ORJSON_BACKEND and not kwargs:
+        try:
+            return orjson.dumps(o, default=_orjson_default, option=_ORJSON_OPTIONS).decode("utf-8")
+        except TypeError:
+            pass
     return json.dumps(o, cls=_MyJSONEncoder, **kwargs)
 
 
@@ -51,11 +148,96 @@ def dump(obj, fp, **kwargs):
         f.write(dumps(obj, **kwargs))
 
 
-def loads(s, **kwargs):
-    o = json.loads(s, object_pairs_hook=OrderedDict, **kwargs)
-    return _parse_dates(o)
+def loads(s, ordered=True, **kwargs):
+    """
+    Strings with the ISO_FORMAT shape are parsed to datetimes.
+
+    Parameters
+    ----------
+    s: str or bytes
+    ordered: bool
+        objects are decoded to OrderedDict if True, to dict else (faster)
+    """
+    o = json.loads(
+        s,
+        object_pairs_hook=_ordered_object_pairs_hook if ordered else _dict_object_pairs_hook,
+        **kwargs
+    )
+    # objects were parsed by the hook
+    if isinstance(o, str):
+        return _json_str_to_o(o)
+    if isinstance(o, list):
+        _parse_list_dates(o)
+    return o
 
 
 def load(fp, **kwargs):
     with open(fp) as f:
-        return loads(f.read())
+        return loads(f.read(), **kwargs)
+
+
+def _open(fp, mode):
+    # fp may be a path or a file object (closed by its owner)
+    if isinstance(fp, (str, bytes)) or hasattr(fp, "__fspath__"):
+        return open(fp, mode)
+    return contextlib.nullcontext(fp)
+
+
+def dump_iter(iterable, fp, **kwargs):
+    """
+    Writes objects as json lines (one object per line), one at a time.
+
+    Parameters
+    ----------
+    iterable: iterable of objects
+    fp: path, or binary or text file object
+    """
+    with _open(fp, "wb") as f:
+        binary = not isinstance(f, io.TextIOBase)
+        for o in iterable:
+            if binary:
+                f.write(dumpb(o, **kwargs) + b"\n")
+            else:
+                f.write(dumps(o, **kwargs) + "\n")
+
+
+def iter_load(fp, **kwargs):
+    """
+    Reads json lines one at a time (generator), empty lines are skipped.
+
+    Parameters
+    ----------
+    fp: path, or binary or text file object
+    kwargs: see loads
+    """
+    with _open(fp, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield loads(line, **kwargs)
+
+
+async def aiter_load(stream, **kwargs):
+    """
+    Reads json lines one at a time from an async byte stream (async generator), empty lines are skipped.
+
+    Parameters
+    ----------
+    stream: async iterable of bytes chunks (chunks need not be split on lines), for example AsyncBlobAPI.iter_blob, or
+        aiohttp stream reader (response.content)
+    kwargs: see loads
+    """
+    chunks = stream.iter_any() if hasattr(stream, "iter_any") else stream
+    pending = bytearray()
+    async for chunk in chunks:
+        end = chunk.rfind(b"\n")
+        if end == -1:
+            pending.extend(chunk)
+            continue
+        pending.extend(chunk[:end])
+        lines = pending.split(b"\n")
+        pending = bytearray(chunk[end + 1:])
+        for line in lines:
+            if line.strip():
+                yield loads(bytes(line), **kwargs)
+    if pending.strip():
+        yield loads(bytes(pending), **kwargs)
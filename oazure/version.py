@@ -1 +1 @@
-version = "1.4.2"
+version = "1.5.0"
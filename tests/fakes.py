@@ -0,0 +1,306 @@
+import asyncio
+import base64
+import hashlib
+import itertools
+import email.utils
+import datetime as dt
+import xml.etree.ElementTree as ET
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from aiohttp.client_exceptions import ClientConnectionError
+from multidict import CIMultiDict
+
+from oazure.async_blob_storage import AsyncBlobAPI
+
+ACCOUNT_KEY = "a2V5a2V5a2V5a2V5a2V5a2V5"
+
+
+class Clock:
+    def __init__(self, now=0.):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def md5(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode("utf-8")
+
+
+class _Blob:
+    def __init__(self, data, blob_type="BlockBlob", content_md5=None, last_modified=None, copy_status=None):
+        self.data = bytearray(data)
+        self.blob_type = blob_type
+        self.content_md5 = content_md5
+        # seconds precision, after the local files written before
+        self.last_modified = last_modified or (
+            dt.datetime.utcnow().replace(microsecond=0) + dt.timedelta(seconds=1))
+        self.copy_status = copy_status
+        self.etag = None
+
+
+class _Content:
+    def __init__(self, body):
+        self._body = body
+
+    async def iter_chunked(self, chunk_size):
+        for i in range(0, len(self._body), chunk_size):
+            await asyncio.sleep(0)
+            yield self._body[i:i + chunk_size]
+
+
+class _Response:
+    def __init__(self, status, body=b"", headers=None):
+        self.status = status
+        self.headers = CIMultiDict(headers or {})
+        self.content = _Content(body)
+        self._body = body
+
+    async def read(self):
+        return self._body
+
+    async def __aenter__(self):
+        # lets other requests run, as a network round trip would
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class FakeBlobStorage:
+    """
+    In memory blob storage of any number of accounts, used as the aiohttp session of AsyncBlobAPI instances (see
+    make_blob_api), so that tests go through the real request code. Signatures are not checked.
+
+    requests: list of (account, method, container, blob, comp) of the received requests
+    fail_after: after this number of requests, requests raise ConnectionError (simulates a stopped process)
+    before_request: function called with (storage, method, container, blob, query, headers) before each request is
+        applied, may return a response to send instead (simulates concurrent writers or server errors)
+    copy_polls: number of get_blob_properties requests for which a copy stays pending
+    corrupt_ranges: number of the next range responses whose content is altered after their md5 was computed
+    lost_responses: number of the next put requests that are applied, then raise ClientConnectionError
+    """
+    def __init__(self):
+        self.blobs = {}
+        self.blocks = {}
+        self.containers = set()
+        self.requests = []
+        self.fail_after = None
+        self.before_request = None
+        self.copy_polls = 0
+        self.corrupt_ranges = 0
+        self.lost_responses = 0
+        self._etags = itertools.count(1)
+        self._copy_ids = itertools.count(1)
+        self._pending_copies = {}
+
+    def store(self, account_name, container_name, blob_name, data, **properties):
+        blob = self.blobs[(account_name, container_name, blob_name)] = _Blob(data, **properties)
+        blob.etag = f'"{next(self._etags)}"'
+        return blob
+
+    def get(self, account_name, container_name, blob_name):
+        blob = self.blobs.get((account_name, container_name, blob_name))
+        return None if blob is None else bytes(blob.data)
+
+    def names(self, account_name, container_name):
+        return sorted(name for account, container, name in self.blobs if (account, container) == (
+            account_name, container_name))
+
+    def count(self, method, comp=None):
+        return sum(1 for _, request_method, _, _, request_comp in self.requests
+                   if (request_method, request_comp) == (method, comp))
+
+    @staticmethod
+    def error(status, code):
+        return _Response(status, f"<?xml version='1.0'?><Error><Code>{code}</Code></Error>".encode())
+
+    def request(self, method, url, data=None, headers=None, timeout=None):
+        if self.fail_after is not None and len(self.requests) >= self.fail_after:
+            raise ConnectionError("stopped")
+        url = urlsplit(url)
+        account_name = url.netloc.split(".")[0]
+        container_name, _, blob_name = unquote(url.path).lstrip("/").partition("/")
+        blob_name = blob_name or None
+        query = dict(parse_qsl(url.query))
+        headers = CIMultiDict(headers or {})
+        self.requests.append((account_name, method, container_name, blob_name, query.get("comp")))
+        if self.before_request is not None:
+            response = self.before_request(self, method, container_name, blob_name, query, headers)
+            if response is not None:
+                return response
+        if blob_name is None:
+            return self._container_request(account_name, method, container_name, query)
+        response = self._blob_request(account_name, method, container_name, blob_name, query, headers, data)
+        if self.lost_responses and method == "put":
+            self.lost_responses -= 1
+            raise ClientConnectionError("response lost")
+        return response
+
+    def _container_request(self, account_name, method, container_name, query):
+        if query.get("comp") == "list":
+            return self._list(account_name, container_name, query)
+        if method == "put":
+            if (account_name, container_name) in self.containers:
+                return self.error(409, "ContainerAlreadyExists")
+            self.containers.add((account_name, container_name))
+            return _Response(201)
+        self.containers.discard((account_name, container_name))
+        for key in [key for key in self.blobs if key[:2] == (account_name, container_name)]:
+            del self.blobs[key]
+        return _Response(202)
+
+    def _list(self, account_name, container_name, query):
+        prefix = query.get("prefix", "")
+        names = [name for name in self.names(account_name, container_name)
+                 if name.startswith(prefix) and name > query.get("marker", "")]
+        maxresults = int(query.get("maxresults", 5000))
+        page, names = names[:maxresults], names[maxresults:]
+        blobs = "".join(
+            "<Blob><Name>{}</Name><Properties><Last-Modified>{}</Last-Modified><Etag>{}</Etag>"
+            "<Content-Length>{}</Content-Length><Content-MD5>{}</Content-MD5></Properties></Blob>".format(
+                name, self._http_date(blob.last_modified), blob.etag, len(blob.data), blob.content_md5 or "")
+            for name, blob in ((name, self.blobs[(account_name, container_name, name)]) for name in page)
+        )
+        next_marker = page[-1] if names else ""
+        body = f"<?xml version='1.0'?><EnumerationResults><Blobs>{blobs}</Blobs>" \
+               f"<NextMarker>{next_marker}</NextMarker></EnumerationResults>"
+        return _Response(200, body.encode("utf-8"))
+
+    @staticmethod
+    def _http_date(value):
+        return email.utils.format_datetime(value.replace(tzinfo=dt.timezone.utc), usegmt=True)
+
+    def _blob_headers(self, blob, **headers):
+        return dict(ETag=blob.etag, **{"Last-Modified": self._http_date(blob.last_modified)}, **headers)
+
+    def _blob_request(self, account_name, method, container_name, blob_name, query, headers, data):
+        key = (account_name, container_name, blob_name)
+        blob = self.blobs.get(key)
+        comp = query.get("comp")
+        if comp == "block":
+            if "Content-MD5" in headers and headers["Content-MD5"] != md5(data):
+                return self.error(400, "Md5Mismatch")
+            self.blocks[key + (query["blockid"],)] = bytes(data)
+            return _Response(201)
+        if comp == "blocklist":
+            if method == "get":
+                return self._block_list(key)
+            return self._put_block_list(key, blob, headers, data)
+        if comp == "appendblock":
+            if blob is None:
+                return self.error(404, "BlobNotFound")
+            position = headers.get("x-ms-blob-condition-appendpos")
+            if position is not None and int(position) != len(blob.data):
+                return self.error(412, "AppendPositionConditionNotMet")
+            offset = len(blob.data)
+            blob.data.extend(data)
+            blob.etag = f'"{next(self._etags)}"'
+            return _Response(201, headers=self._blob_headers(blob, **{"x-ms-blob-append-offset": str(offset)}))
+        if comp == "copy":
+            if blob is None or blob.copy_status != "pending":
+                return self.error(409, "NoPendingCopyOperation")
+            self._pending_copies.pop(key, None)
+            blob.data = bytearray()
+            blob.copy_status = "aborted"
+            return _Response(204)
+        if comp is not None:
+            raise NotImplementedError(comp)
+
+        if "If-Match" in headers and (blob is None or headers["If-Match"] not in ("*", blob.etag)):
+            return self.error(412, "ConditionNotMet")
+        if method == "get":
+            return self._get(blob, headers)
+        if method == "head":
+            return self._head(key, blob)
+        if method == "delete":
+            if blob is None:
+                return self.error(404, "BlobNotFound")
+            del self.blobs[key]
+            return _Response(202)
+        if headers.get("If-None-Match") == "*" and blob is not None:
+            return self.error(409, "BlobAlreadyExists")
+        if "x-ms-copy-source" in headers:
+            return self._copy(key, headers["x-ms-copy-source"])
+        if "Content-MD5" in headers and headers["Content-MD5"] != md5(data or b""):
+            return self.error(400, "Md5Mismatch")
+        blob_type = headers.get("x-ms-blob-type", "BlockBlob")
+        blob = self.store(*key, data or b"", blob_type=blob_type, content_md5=md5(data or b""))
+        return _Response(201, headers=self._blob_headers(blob))
+
+    def _get(self, blob, headers):
+        if blob is None:
+            return self.error(404, "BlobNotFound")
+        if headers.get("If-None-Match") == blob.etag:
+            return _Response(304, headers=dict(ETag=blob.etag))
+        data = bytes(blob.data)
+        if "x-ms-range" not in headers:
+            return _Response(200, data, self._blob_headers(blob))
+        start, end = (int(value) for value in headers["x-ms-range"][len("bytes="):].split("-"))
+        data = data[start:end + 1]
+        range_headers = {}
+        if headers.get("x-ms-range-get-content-md5") == "true":
+            if end - start + 1 > 4 * 1024 * 1024:
+                return self.error(400, "OutOfRangeInput")
+            range_headers["Content-MD5"] = md5(data)
+        if self.corrupt_ranges:
+            self.corrupt_ranges -= 1
+            data = bytes([data[0] ^ 1]) + data[1:]
+        return _Response(206, data, self._blob_headers(blob, **range_headers))
+
+    def _head(self, key, blob):
+        if blob is None:
+            return _Response(404)
+        headers = {"Content-Length": str(len(blob.data))}
+        if blob.content_md5 is not None:
+            headers["Content-MD5"] = blob.content_md5
+        if blob.copy_status is not None:
+            polls = self._pending_copies.get(key, 0)
+            if polls > 0:
+                self._pending_copies[key] = polls - 1
+            else:
+                blob.copy_status = "success"
+            headers["x-ms-copy-status"] = blob.copy_status
+        return _Response(200, headers=self._blob_headers(blob, **headers))
+
+    def _copy(self, key, source_url):
+        source_url = urlsplit(source_url)
+        source_container_name, _, source_blob_name = unquote(source_url.path).lstrip("/").partition("/")
+        source = self.blobs.get((source_url.netloc.split(".")[0], source_container_name, source_blob_name))
+        if source is None:
+            return self.error(404, "CannotVerifyCopySource")
+        status = "pending" if self.copy_polls else "success"
+        blob = self.store(*key, source.data, content_md5=source.content_md5, copy_status=status)
+        if self.copy_polls:
+            self._pending_copies[key] = self.copy_polls
+        return _Response(202, headers=self._blob_headers(
+            blob, **{"x-ms-copy-status": status, "x-ms-copy-id": str(next(self._copy_ids))}))
+
+    def _block_list(self, key):
+        blocks = [(block_key[3], data) for block_key, data in self.blocks.items() if block_key[:3] == key]
+        if not blocks and key not in self.blobs:
+            return self.error(404, "BlobNotFound")
+        body = "<?xml version='1.0'?><BlockList><UncommittedBlocks>{}</UncommittedBlocks></BlockList>".format("".join(
+            f"<Block><Name>{block_id}</Name><Size>{len(data)}</Size></Block>" for block_id, data in blocks))
+        return _Response(200, body.encode("utf-8"))
+
+    def _put_block_list(self, key, blob, headers, data):
+        if "If-Match" in headers and (blob is None or headers["If-Match"] != blob.etag):
+            return self.error(412, "ConditionNotMet")
+        block_ids = [element.text for element in ET.fromstring(data.decode("utf-8")).iter("Latest")]
+        if any(key + (block_id,) not in self.blocks for block_id in block_ids):
+            return self.error(400, "InvalidBlockList")
+        content = b"".join(self.blocks[key + (block_id,)] for block_id in block_ids)
+        # uncommitted blocks are discarded
+        for block_key in [block_key for block_key in self.blocks if block_key[:3] == key]:
+            del self.blocks[block_key]
+        blob = self.store(*key, content, content_md5=headers.get("x-ms-blob-content-md5"))
+        return _Response(201, headers=self._blob_headers(blob))
+
+
+def make_blob_api(account_name="account", **kwargs):
+    """
+    AsyncBlobAPI to use with a FakeBlobStorage session.
+    """
+    return AsyncBlobAPI(account_name, ACCOUNT_KEY, **kwargs)
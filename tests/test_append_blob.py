@@ -0,0 +1,57 @@
+import asyncio
+import unittest
+
+from oazure.append_blob import AppendBlobWriter
+
+from .fakes import FakeBlobStorage, make_blob_api
+
+
+def _record_blocks(session):
+    # sizes of the appended blocks
+    blocks = []
+
+    def before_request(storage, method, container_name, blob_name, query, headers):
+        if query.get("comp") == "appendblock":
+            blocks.append(int(headers["Content-Length"]))
+    session.before_request = before_request
+    return blocks
+
+
+class AppendBlobWriterTest(unittest.TestCase):
+    def test_ordered_blocks(self):
+        api = make_blob_api()
+        session = FakeBlobStorage()
+        blocks = _record_blocks(session)
+
+        async def writer_task(writer, i):
+            for j in range(10):
+                await writer.write(f"{i}-{j};".encode())
+
+        async def run():
+            async with AppendBlobWriter(api, "container", "blob", session, block_size=16, flush_interval=60) as writer:
+                await writer.write(b"header;")
+                await asyncio.gather(*(writer_task(writer, i) for i in range(3)))
+            return writer
+
+        writer = asyncio.run(run())
+        content = session.get("account", "container", "blob")
+        records = content.decode().split(";")[:-1]
+        self.assertEqual("header", records[0])
+        self.assertEqual(31, len(records))
+        # each writer's records are in order
+        for i in range(3):
+            self.assertEqual([f"{i}-{j}" for j in range(10)], [r for r in records if r.startswith(f"{i}-")])
+        self.assertTrue(all(size <= 16 for size in blocks))
+        self.assertEqual(len(content), writer.position)
+
+    def test_interval(self):
+        session = FakeBlobStorage()
+
+        async def run():
+            writer = AppendBlobWriter(make_blob_api(), "container", "blob", session, flush_interval=0.01)
+            await writer.write(b"abc")
+            await asyncio.sleep(0.1)
+            self.assertEqual(b"abc", session.get("account", "container", "blob"))
+            await writer.close()
+
+        asyncio.run(run())
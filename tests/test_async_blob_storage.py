@@ -0,0 +1,86 @@
+import asyncio
+import unittest
+
+from aiohttp.client_exceptions import ClientConnectionError
+
+from oazure.async_blob_storage import AzureBlobStorageConditionNotMet
+
+from .fakes import FakeBlobStorage, make_blob_api
+
+
+class ConditionalWriteTest(unittest.TestCase):
+    def test_conditions(self):
+        api = make_blob_api()
+        session = FakeBlobStorage()
+
+        async def run():
+            etag = await api.write_blob_conditional(b"a", "container", "blob", session, if_none_match="*")
+            with self.assertRaises(AzureBlobStorageConditionNotMet):
+                await api.write_blob_conditional(b"b", "container", "blob", session, if_none_match="*")
+            self.assertEqual((b"a", etag), await api.get_blob_with_etag("container", "blob", session))
+            await api.write_blob_conditional(b"b", "container", "blob", session, if_match=etag)
+            with self.assertRaises(AzureBlobStorageConditionNotMet):
+                await api.write_blob_conditional(b"c", "container", "blob", session, if_match=etag)
+
+        asyncio.run(run())
+
+    def test_update_blob(self):
+        api = make_blob_api()
+        session = FakeBlobStorage()
+
+        def increment(content):
+            return str(int(content or b"0") + 1).encode()
+
+        def concurrent_write(storage, method, container_name, blob_name, query, headers):
+            if method == "put":
+                storage.before_request = None
+                storage.store("account", container_name, blob_name, b"10")
+
+        async def run():
+            # creation, then one read and one write
+            self.assertEqual(b"1", (await api.update_blob("container", "blob", increment, session))[0])
+            requests = len(session.requests)
+            self.assertEqual(b"2", (await api.update_blob("container", "blob", increment, session))[0])
+            self.assertEqual(2, len(session.requests) - requests)
+            # conflict: read again
+            session.before_request = concurrent_write
+            self.assertEqual(b"11", (await api.update_blob("container", "blob", increment, session))[0])
+
+        asyncio.run(run())
+
+    def test_lost_response(self):
+        api = make_blob_api()
+        session = FakeBlobStorage()
+
+        def increment(content):
+            return str(int(content or b"0") + 1).encode()
+
+        async def run():
+            # the write was applied: its etag is returned, the update is not applied twice
+            session.lost_responses = 1
+            self.assertEqual(b"1", (await api.update_blob("container", "blob", increment, session))[0])
+            session.lost_responses = 1
+            content, etag = await api.update_blob("container", "blob", increment, session)
+            self.assertEqual((b"2", etag), await api.get_blob_with_etag("container", "blob", session))
+
+            # the write was not applied: it is retried
+            def fail_write(storage, method, *args):
+                if method == "put":
+                    storage.before_request = None
+                    raise ClientConnectionError("not sent")
+            session.before_request = fail_write
+            etag = await api.write_blob_conditional(b"3", "container", "blob", session, if_match=etag)
+            self.assertEqual((b"3", etag), await api.get_blob_with_etag("container", "blob", session))
+
+            # applied, then modified by another writer: the outcome is unknown
+            def concurrent_write(storage, method, container_name, blob_name, query, headers):
+                if method == "get":
+                    storage.before_request = None
+                    storage.store("account", container_name, blob_name, b"10")
+            session.lost_responses = 1
+            session.before_request = lambda storage, method, *args: setattr(
+                storage, "before_request", concurrent_write)
+            with self.assertRaises(ClientConnectionError):
+                await api.write_blob_conditional(b"4", "container", "blob", session, if_match=etag)
+
+        asyncio.run(run())
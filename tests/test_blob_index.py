@@ -0,0 +1,53 @@
+import asyncio
+import unittest
+import datetime as dt
+
+from oazure.blob_index import BlobIndex
+
+from .fakes import FakeBlobStorage, make_blob_api
+
+_DATE = dt.datetime(2020, 1, 1)
+
+
+def _store(session, names):
+    session.blobs.clear()
+    for name in names:
+        session.store("account", "container", name, b"0" * 10, last_modified=_DATE)
+
+
+class BlobIndexTest(unittest.TestCase):
+    def test_refresh_and_queries(self):
+        api = make_blob_api()
+        session = FakeBlobStorage()
+        _store(session, ["a/1", "a/2", "b/1"])
+        index = BlobIndex()
+        asyncio.run(index.refresh(api, "container", session))
+        self.assertEqual(3, index.count("container"))
+        self.assertEqual(20, index.size("container", "a/"))
+        self.assertTrue(index.exists("container", "b/1"))
+        self.assertFalse(index.exists("other", "b/1"))
+        self.assertEqual(
+            dict(name="a/1", size=10, etag=session.blobs[("account", "container", "a/1")].etag, content_md5=None,
+                 last_modified=_DATE),
+            index.get("container", "a/1")
+        )
+
+        # only a/ is listed again
+        _store(session, ["a/1", "a/3", "b/1"])
+        self.assertEqual(["a/"], asyncio.run(index.refresh(api, "container", session, prefixes=("a/",))))
+        self.assertEqual(["a/1", "a/3", "b/1"], [blob["name"] for blob in index.blobs("container")])
+
+        # refreshed recently
+        self.assertEqual([], asyncio.run(index.refresh(api, "container", session, prefixes=("b/",), max_age=60)))
+        self.assertEqual(2, session.count("get", "list"))
+
+    def test_listener(self):
+        index = BlobIndex()
+        index.blob_written("container", "a", 3, "etag", _DATE)
+        index.blob_written("container", "b", None, "etag", None)
+        self.assertEqual(3, index.size("container"))
+        self.assertEqual(2, index.count("container"))
+        index.blob_deleted("container", "a")
+        self.assertFalse(index.exists("container", "a"))
+        index.container_deleted("container")
+        self.assertEqual(0, index.count("container"))
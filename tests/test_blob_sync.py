@@ -0,0 +1,178 @@
+import os
+import asyncio
+import tempfile
+import unittest
+
+from oazure import AzureBlobStorageAsyncError
+from oazure.blob_sync import (
+    CHECKPOINT_SUFFIX, upload_directory, download_directory, resumable_download, resumable_upload
+)
+from oazure.sharding import ShardedBlobAPI
+from oazure.snippets.ojson import loads
+
+from .fakes import FakeBlobStorage, make_blob_api, md5
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+class BlobSyncTest(unittest.TestCase):
+    def test_upload_download(self):
+        api = make_blob_api()
+        session = FakeBlobStorage()
+        with tempfile.TemporaryDirectory() as source, tempfile.TemporaryDirectory() as target:
+            _write(os.path.join(source, "a.txt"), b"small")
+            _write(os.path.join(source, "sub", "b.bin"), b"0123456789" * 10)
+
+            plan = asyncio.run(upload_directory(api, source, "container", "sim", session, block_size=16, dry_run=True))
+            self.assertEqual(["sim/a.txt", "sim/sub/b.bin"], [blob_name for blob_name, _, _ in plan.transfers])
+            self.assertEqual({}, session.blobs)
+
+            asyncio.run(upload_directory(api, source, "container", "sim", session, block_size=16))
+            self.assertEqual(b"0123456789" * 10, session.get("account", "container", "sim/sub/b.bin"))
+            # 1 blob, 7 blocks and 1 block list
+            self.assertEqual(
+                (1, 7, 1), (session.count("put"), session.count("put", "block"), session.count("put", "blocklist")))
+
+            plan = asyncio.run(upload_directory(api, source, "container", "sim", session, checksum=True))
+            self.assertEqual(([], ["sim/a.txt", "sim/sub/b.bin"]), (plan.transfers, plan.unchanged))
+
+            asyncio.run(download_directory(api, "container", "sim/", target, session))
+            with open(os.path.join(target, "sub", "b.bin"), "rb") as f:
+                self.assertEqual(b"0123456789" * 10, f.read())
+
+            plan = asyncio.run(download_directory(api, "container", "sim/", target, session))
+            self.assertEqual(0, len(plan.transfers))
+            self.assertEqual(2, session.count("get"))
+
+            session.store("account", "container", "sim/a.txt", b"changed", content_md5=md5(b"changed"))
+            plan = asyncio.run(download_directory(api, "container", "sim/", target, session))
+            self.assertEqual(["sim/a.txt"], [blob_name for blob_name, _, _ in plan.transfers])
+            with open(os.path.join(target, "a.txt"), "rb") as f:
+                self.assertEqual(b"changed", f.read())
+
+    def test_download_outside_local_dir(self):
+        api = make_blob_api()
+        session = FakeBlobStorage()
+        with tempfile.TemporaryDirectory() as directory:
+            target = os.path.join(directory, "target")
+            for name in ("sim/../../escaped", "sim/a/.."):
+                session.blobs.clear()
+                session.store("account", "container", name, b"content")
+                with self.assertRaises(ValueError):
+                    asyncio.run(download_directory(api, "container", "sim/", target, session))
+            self.assertEqual([], os.listdir(directory))
+
+            # a leading / is a segment of the name, not an absolute path
+            session.blobs.clear()
+            session.store("account", "container", "sim//etc/passwd", b"content")
+            asyncio.run(download_directory(api, "container", "sim/", target, session))
+            self.assertTrue(os.path.exists(os.path.join(target, "etc", "passwd")))
+
+    def test_resumable_transfers(self):
+        api = make_blob_api()
+        session = FakeBlobStorage()
+        content = bytes(range(256)) * 10
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "source.bin")
+            _write(source, content)
+
+            # stops after 4 of 10 blocks
+            session.fail_after = 4
+            with self.assertRaises(ConnectionError):
+                asyncio.run(resumable_upload(api, source, "container", "blob", session, block_size=256, concurrency=1))
+            self.assertEqual({}, session.blobs)
+            self.assertTrue(os.path.exists(source + CHECKPOINT_SUFFIX))
+            session.fail_after = None
+            uploaded = asyncio.run(resumable_upload(api, source, "container", "blob", session, block_size=256))
+            self.assertEqual(6 * 256, uploaded)
+            self.assertEqual(content, session.get("account", "container", "blob"))
+            self.assertFalse(os.path.exists(source + CHECKPOINT_SUFFIX))
+
+            target = os.path.join(directory, "sub", "target.bin")
+            # stops after the properties and 3 of 10 ranges
+            session.fail_after = len(session.requests) + 4
+            with self.assertRaises(ConnectionError):
+                asyncio.run(
+                    resumable_download(api, "container", "blob", target, session, chunk_size=256, concurrency=1))
+            self.assertFalse(os.path.exists(target))
+            session.fail_after = None
+            downloaded = asyncio.run(resumable_download(api, "container", "blob", target, session, chunk_size=256))
+            self.assertEqual(7 * 256, downloaded)
+            with open(target, "rb") as f:
+                self.assertEqual(content, f.read())
+            self.assertEqual(["source.bin", "sub"], sorted(os.listdir(directory)))
+            self.assertEqual(["target.bin"], os.listdir(os.path.dirname(target)))
+
+    def test_resumable_download_mismatch(self):
+        session = FakeBlobStorage()
+        session.store("account", "container", "blob", b"content", content_md5="wrong")
+        with tempfile.TemporaryDirectory() as directory:
+            target = os.path.join(directory, "target.bin")
+            with self.assertRaises(AzureBlobStorageAsyncError):
+                asyncio.run(resumable_download(make_blob_api(), "container", "blob", target, session))
+            self.assertEqual([], os.listdir(directory))
+
+    def test_resumable_download_range_md5(self):
+        api = make_blob_api()
+        session = FakeBlobStorage()
+        content = bytes(range(256)) * 4
+        # no blob md5: ranges are the only check
+        session.store("account", "container", "blob", content)
+        with tempfile.TemporaryDirectory() as directory:
+            target = os.path.join(directory, "target.bin")
+            # a corrupted range is requested again
+            session.corrupt_ranges = 1
+            asyncio.run(resumable_download(api, "container", "blob", target, session, chunk_size=256))
+            with open(target, "rb") as f:
+                self.assertEqual(content, f.read())
+            self.assertEqual(5, session.count("get"))
+
+            os.remove(target)
+            session.corrupt_ranges = 3
+            with self.assertRaisesRegex(AzureBlobStorageAsyncError, "Md5Mismatch"):
+                asyncio.run(resumable_download(
+                    api, "container", "blob", target, session, chunk_size=256, concurrency=1))
+            # the corrupted range was not recorded
+            with open(target + CHECKPOINT_SUFFIX, "rb") as f:
+                self.assertEqual([], loads(f.read())["chunks"])
+
+    def test_resumable_upload_changed_block(self):
+        api = make_blob_api()
+        session = FakeBlobStorage()
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "source.bin")
+            _write(source, b"a" * 1024)
+            stat = os.stat(source)
+            session.fail_after = 2
+            with self.assertRaises(ConnectionError):
+                asyncio.run(resumable_upload(api, source, "container", "blob", session, block_size=256, concurrency=1))
+
+            # the first block changes, the date of the file does not
+            with open(source, "r+b") as f:
+                f.write(b"b")
+            os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            session.fail_after = None
+            uploaded = asyncio.run(resumable_upload(api, source, "container", "blob", session, block_size=256))
+            self.assertEqual(3 * 256, uploaded)
+            self.assertEqual(b"b" + b"a" * 1023, session.get("account", "container", "blob"))
+
+    def test_sharded_resumable_transfers(self):
+        api = ShardedBlobAPI([make_blob_api(f"account{i}") for i in range(3)])
+        session = FakeBlobStorage()
+        content = bytes(range(256)) * 4
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "source.bin")
+            target = os.path.join(directory, "target.bin")
+            _write(source, content)
+            session.fail_after = 2
+            with self.assertRaises(ConnectionError):
+                asyncio.run(resumable_upload(api, source, "container", "blob", session, block_size=256, concurrency=1))
+            session.fail_after = None
+            asyncio.run(resumable_upload(api, source, "container", "blob", session, block_size=256))
+            asyncio.run(resumable_download(api, "container", "blob", target, session, chunk_size=256))
+            with open(target, "rb") as f:
+                self.assertEqual(content, f.read())
@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+
+from oazure.concurrency import AdaptiveConcurrencyLimiter, get_shared_limiter
+
+from .fakes import Clock
+
+
+class AdaptiveConcurrencyLimiterTest(unittest.TestCase):
+    def test_aimd(self):
+        clock = Clock()
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=4, cooldown=1., clock=clock)
+
+        async def run():
+            # 4 healthy responses: limit + 4 * 1/limit ~ +1
+            for _ in range(4):
+                await limiter.acquire()
+                limiter.release(0.01, status=200)
+            self.assertEqual(4, int(limiter.limit))
+            await limiter.acquire()
+            limiter.release(0.01, status=200)
+            self.assertEqual(5, int(limiter.limit))
+            # throttling burst: one decrease per cooldown
+            for _ in range(3):
+                await limiter.acquire()
+                limiter.release(0.01, status=503)
+            self.assertEqual(1, limiter.decreases)
+            self.assertEqual(2, int(limiter.limit))
+            clock.now = 2
+            await limiter.acquire()
+            limiter.release(0.01, error=ConnectionError())
+            self.assertEqual(1, int(limiter.limit))
+            # not found is healthy
+            await limiter.acquire()
+            limiter.release(0.01, status=404)
+            self.assertEqual(2, int(limiter.limit))
+
+        asyncio.run(run())
+
+    def test_waiters(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2)
+        order = []
+
+        async def request(i):
+            await limiter.acquire()
+            order.append(i)
+            self.assertLessEqual(limiter.in_flight, 2)
+            await asyncio.sleep(0.01)
+            limiter.release(0.01, status=200)
+
+        async def run():
+            await asyncio.gather(*(request(i) for i in range(6)))
+
+        asyncio.run(run())
+        self.assertEqual(list(range(6)), order)
+        self.assertEqual(0, limiter.in_flight)
+
+    def test_shared(self):
+        self.assertIs(get_shared_limiter(("blob", "account")), get_shared_limiter(("blob", "account")))
+        self.assertIsNot(get_shared_limiter(("blob", "account")), get_shared_limiter(("batch", "account")))
@@ -0,0 +1,106 @@
+import asyncio
+import unittest
+
+import django
+from django.conf import settings
+
+from oazure.async_blob_storage import AzureBlobStorageResourceNotFound
+
+from .fakes import ACCOUNT_KEY
+
+if not settings.configured:
+    settings.configure()
+    django.setup()
+
+try:
+    from rest_framework.exceptions import NotFound
+    from oazure.drf_blob_client import AsyncDRFBlobClient, content_disposition
+except Exception as e:  # rest_framework imports optional database drivers
+    import_error = e
+else:
+    import_error = None
+
+
+class _FakeBlobAPI:
+    account_name = "account"
+    account_key = ACCOUNT_KEY
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = 0
+
+    async def get_blob_properties(self, container_name, blob_name, session, timeout=None):
+        if self.chunks is None:
+            raise AzureBlobStorageResourceNotFound()
+        return dict(size=sum(len(chunk) for chunk in self.chunks))
+
+    async def iter_blob(self, container_name, blob_name, session, chunk_size=None, timeout=None):
+        if self.chunks is None:
+            raise AzureBlobStorageResourceNotFound()
+        try:
+            for chunk in self.chunks:
+                await asyncio.sleep(0)
+                yield chunk
+        finally:
+            self.closed += 1
+
+
+@unittest.skipIf(import_error is not None, f"rest_framework can't be imported: {import_error}")
+class AsyncDRFBlobClientTest(unittest.TestCase):
+    def test_content_disposition(self):
+        self.assertEqual('attachment; filename="a b.csv"', content_disposition("a b.csv"))
+        self.assertEqual('attachment; filename="a\\"b\\\\.csv"', content_disposition('a"b\\.csv'))
+        self.assertEqual("attachment; filename*=utf-8''%C3%A9t%C3%A9.csv", content_disposition("été.csv"))
+        self.assertEqual("attachment; filename*=utf-8''a%0D%0Ab", content_disposition("a\r\nb"))
+
+    def test_not_found(self):
+        client = AsyncDRFBlobClient(_FakeBlobAPI(None), 60)
+        with self.assertRaises(NotFound):
+            asyncio.run(client.streaming_download_response("container", "blob", None))
+
+    @unittest.skipIf(django.VERSION >= (4, 2), "sync fallback of django < 4.2")
+    def test_sync_streaming(self):
+        blob_api = _FakeBlobAPI([b"a", b"b", b"c"])
+        client = AsyncDRFBlobClient(blob_api, 60)
+        response = asyncio.run(client.streaming_download_response("container", "blob", None, filename="f.txt"))
+        self.assertEqual('attachment; filename="f.txt"', response["Content-Disposition"])
+        self.assertEqual(b"abc", b"".join(response))
+        self.assertEqual(1, blob_api.closed)
+
+        # partially consumed
+        response = asyncio.run(client.streaming_download_response("container", "blob", None))
+        self.assertEqual(b"a", next(iter(response)))
+        response.close()
+        self.assertEqual(2, blob_api.closed)
+
+    @unittest.skipIf(django.VERSION >= (4, 2), "sync fallback of django < 4.2")
+    def test_sync_streaming_refused_in_event_loop(self):
+        # as served by an asgi server
+        blob_api = _FakeBlobAPI([b"a", b"b", b"c"])
+        client = AsyncDRFBlobClient(blob_api, 60)
+
+        async def run():
+            response = await client.streaming_download_response("container", "blob", None)
+            return b"".join(response)
+
+        with self.assertRaisesRegex(RuntimeError, "django >= 4.2"):
+            asyncio.run(run())
+        self.assertEqual(0, blob_api.closed)
+
+    @unittest.skipIf(django.VERSION < (4, 2), "async streaming requires django >= 4.2")
+    def test_async_streaming(self):
+        blob_api = _FakeBlobAPI([b"a", b"b", b"c"])
+        client = AsyncDRFBlobClient(blob_api, 60)
+
+        async def run():
+            response = await client.streaming_download_response("container", "blob", None)
+            content = b"".join([chunk async for chunk in response])
+            # partially consumed
+            response = await client.streaming_download_response("container", "blob", None)
+            chunks = response.streaming_content
+            await chunks.__anext__()
+            await chunks.aclose()
+            return content
+
+        self.assertEqual(b"abc", asyncio.run(run()))
+        self.assertEqual(2, blob_api.closed)
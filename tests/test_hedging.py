@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+
+from oazure.async_blob_storage import AsyncBlobAPI
+from oazure.hedging import HedgingPolicy
+from oazure.instrumentation import MetricsRegistry
+
+from .fakes import ACCOUNT_KEY
+
+
+class _SlowResponse:
+    def __init__(self, delay, body):
+        self.status = 200
+        self.headers = {}
+        self.delay = delay
+        self._body = body
+
+    async def read(self):
+        return self._body
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.delay)
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class _Session:
+    # requests take the delays in order
+    def __init__(self, delays):
+        self.delays = list(delays)
+        self.requests = 0
+
+    def request(self, method, url, data=None, headers=None, timeout=None):
+        self.requests += 1
+        delay = self.delays.pop(0)
+        return _SlowResponse(delay, f"response {self.requests}".encode())
+
+
+class HedgingPolicyTest(unittest.TestCase):
+    def test_adaptive_delay(self):
+        policy = HedgingPolicy(percentile=0.9, min_delay=0., window=100, min_samples=100)
+        self.assertIsNone(policy.delay())
+        for i in range(100):
+            policy.record(i / 1000)
+        self.assertAlmostEqual(0.09, policy.delay())
+        # clamped
+        policy = HedgingPolicy(max_delay=0.05, window=100, min_samples=100)
+        for i in range(100):
+            policy.record(i / 1000)
+        self.assertEqual(0.05, policy.delay())
+
+    def test_budget(self):
+        policy = HedgingPolicy(delay=0.01, budget=0.125, max_burst=2)
+        hedges = 0
+        for _ in range(1000):
+            policy.delay()
+            hedges += policy.try_hedge()
+        self.assertEqual(125, hedges)
+        # bursts are bounded
+        policy = HedgingPolicy(delay=0.01, budget=0.1, max_burst=2)
+        for _ in range(1000):
+            policy.delay()
+        self.assertEqual([True, True, False], [policy.try_hedge() for _ in range(3)])
+
+
+class HedgedGetBlobTest(unittest.TestCase):
+    def test_first_response_wins(self):
+        registry = MetricsRegistry()
+        api = AsyncBlobAPI(
+            "account", ACCOUNT_KEY, instrumentation=registry, hedging=HedgingPolicy(delay=0.01, budget=1.))
+        # first request is slow, the hedge answers
+        session = _Session([1., 0.])
+
+        async def run():
+            start = asyncio.get_event_loop().time()
+            content = await api.get_blob("container", "blob", session)
+            duration = asyncio.get_event_loop().time() - start
+            # lets the slow request handle its cancellation
+            await asyncio.sleep(0.01)
+            return content, duration
+
+        content, duration = asyncio.run(run())
+        self.assertEqual(b"response 2", content)
+        self.assertLess(duration, 0.5)
+        metrics = registry.snapshot()[("blob", "get_blob")]
+        self.assertEqual(1, metrics["hedged"])
+        # the slow request was cancelled, which is not an error
+        self.assertEqual(1, metrics["cancelled"])
+        self.assertEqual(0, metrics["errors"])
+        self.assertEqual(0, metrics["in_flight"])
+        # the elapsed time of the cancelled request is recorded, not only the latency of the fast one
+        latencies = sorted(api.hedging._latencies)
+        self.assertEqual(2, len(latencies))
+        self.assertGreaterEqual(latencies[1], 0.01)
+
+    def test_fast_response_not_hedged(self):
+        api = AsyncBlobAPI("account", ACCOUNT_KEY, hedging=HedgingPolicy(delay=0.1, budget=1.))
+        session = _Session([0.])
+        self.assertEqual(b"response 1", asyncio.run(api.get_blob("container", "blob", session)))
+        self.assertEqual(1, session.requests)
+        self.assertEqual(0, api.hedging.hedges)
@@ -0,0 +1,29 @@
+import subprocess
+import sys
+import unittest
+
+import oazure
+
+
+class LazyImportTest(unittest.TestCase):
+    def test_attributes(self):
+        for name in oazure.__all__:
+            self.assertIn(name, dir(oazure))
+            self.assertIsNotNone(getattr(oazure, name))
+        with self.assertRaises(AttributeError):
+            oazure.Missing
+
+    def test_import_is_lazy(self):
+        # fresh interpreter, other tests import everything
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, oazure; "
+                "print(any(name in sys.modules for name in ('aiohttp', 'requests', 'applicationinsights')))"
+            ],
+            check=True,
+            capture_output=True,
+            text=True
+        ).stdout
+        self.assertEqual("False", output.strip().splitlines()[-1])
@@ -0,0 +1,45 @@
+import unittest
+
+from oazure.instrumentation import MetricsRegistry, LatencyHistogram
+
+
+class MetricsRegistryTest(unittest.TestCase):
+    def test_request_metrics(self):
+        registry = MetricsRegistry()
+        registry.request_started("blob", "get_blob")
+        registry.request_started("blob", "get_blob")
+        registry.request_ended("blob", "get_blob", 200, 0.02, bytes_received=10)
+        registry.request_ended("blob", "get_blob", 503, 0.3, attempt=1)
+        registry.request_started("blob", "get_blob")
+        registry.request_failed("blob", "get_blob", ConnectionError(), 1., attempt=2)
+        registry.request_started("blob", "get_blob")
+        registry.request_cancelled("blob", "get_blob", 0.5)
+
+        metrics = registry.snapshot()[("blob", "get_blob")]
+        self.assertEqual(metrics["requests"], 3)
+        self.assertEqual(metrics["retries"], 2)
+        self.assertEqual(metrics["throttled"], 1)
+        self.assertEqual(metrics["errors"], 1)
+        self.assertEqual(metrics["cancelled"], 1)
+        self.assertEqual(metrics["statuses"], {200: 1, 503: 1})
+        self.assertEqual(metrics["bytes_received"], 10)
+        self.assertEqual(metrics["in_flight"], 0)
+        self.assertEqual(metrics["max_in_flight"], 2)
+        self.assertEqual(metrics["latency"]["count"], 3)
+
+    def test_reset_keeps_in_flight(self):
+        registry = MetricsRegistry()
+        registry.request_started("batch", "add_task")
+        registry.snapshot(reset=True)
+        registry.request_ended("batch", "add_task", 201, 0.1)
+        self.assertEqual(registry.snapshot()[("batch", "add_task")]["in_flight"], 0)
+
+
+class LatencyHistogramTest(unittest.TestCase):
+    def test_percentile(self):
+        histogram = LatencyHistogram(buckets=(0.1, 1.))
+        for value in (0.05, 0.05, 0.5, 2.):
+            histogram.add(value)
+        self.assertEqual(histogram.percentile(0.5), 0.1)
+        self.assertEqual(histogram.percentile(0.75), 1.)
+        self.assertEqual(histogram.percentile(1.), 2.)
@@ -0,0 +1,163 @@
+import time
+import threading
+import logging
+import unittest
+
+from oazure.logging_handler import AzureLoggingHandler, LogSampler
+
+
+class _FakeTelemetryClient:
+    def __init__(self):
+        self.traces = []
+        self.flushes = 0
+        # if set, shipping waits for it
+        self.release = None
+        self.threads = set()
+
+    def track_trace(self, name, properties=None, severity=None):
+        if self.release is not None:
+            self.release.wait()
+        self.threads.add(threading.current_thread().name)
+        self.traces.append((name, properties, severity))
+
+    def track_exception(self, *args, properties=None):
+        pass
+
+    def flush(self):
+        self.flushes += 1
+
+
+class AzureLoggingHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.handler = AzureLoggingHandler("instrumentation_key", "component")
+        self.handler.client = _FakeTelemetryClient()
+        self.logger = logging.getLogger("oazure.tests.logging_handler")
+        self.logger.handlers = [self.handler]
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+
+    def test_properties(self):
+        request = object()
+        self.logger.info("message %s", 1, extra=dict(value=2, request=request))
+        name, properties, severity = self.handler.client.traces[0]
+        self.assertEqual(name, "message 1")
+        self.assertEqual(severity, "INFO")
+        self.assertEqual(properties["component"], "component")
+        self.assertEqual(properties["_value"], 2)
+        self.assertEqual(properties["_request"], str(request))
+        self.assertNotIn("_msg", properties)
+
+    def test_sampling(self):
+        self.handler.sampler = LogSampler(level_rates=dict(INFO=0.), logger_rates={"oazure.tests": 0.})
+        self.logger.info("dropped")
+        self.logger.warning("dropped")
+        self.assertEqual(self.handler.client.traces, [])
+        self.assertEqual(self.handler.sampler.sampled_out, 2)
+
+    def test_deduplication(self):
+        self.handler.sampler = LogSampler(dedup_window=60)
+        for i in range(10):
+            self.logger.warning("failure %s", i)
+        self.logger.warning("other failure")
+        self.handler.close()
+        self.assertEqual(
+            [trace[0] for trace in self.handler.client.traces],
+            ["failure 0", "other failure", "failure 9 (repeated 9 times)"]
+        )
+
+    def test_deduplication_of_objects(self):
+        self.handler.sampler = LogSampler(dedup_window=60)
+        for i in range(3):
+            self.logger.warning({"a": 1})
+        self.logger.warning({"a": 2})
+        self.handler.close()
+        self.assertEqual(
+            [trace[0] for trace in self.handler.client.traces],
+            ["{'a': 1}", "{'a': 2}", "{'a': 1} (repeated 2 times)"]
+        )
+
+    def test_rate_limit(self):
+        self.handler.sampler = LogSampler(rate_limit=0.001, burst=3, never_drop_level=logging.ERROR)
+        for i in range(10):
+            self.logger.info("info")
+        self.logger.error("error")
+        self.assertEqual([trace[0] for trace in self.handler.client.traces], ["info"] * 3 + ["error"])
+        self.assertEqual(self.handler.sampler.rate_limited, 7)
+
+    def test_deduplication_keys_limit(self):
+        sampler = self.handler.sampler = LogSampler(dedup_window=60, max_dedup_keys=3)
+        for i in range(10):
+            # unique templates
+            self.logger.warning(f"failure {i}")
+            self.logger.warning(f"failure {i}")
+        self.assertEqual(3, len(sampler._windows))
+        # oldest windows were ended, with their summaries
+        self.assertEqual(
+            [trace[0] for trace in self.handler.client.traces][:5],
+            ["failure 0", "failure 1", "failure 2", "failure 0 (repeated 1 times)", "failure 3"]
+        )
+
+    def test_deduplication_timer(self):
+        self.handler.flush_interval = 0.01
+        self.handler.sampler = LogSampler(dedup_window=0.05)
+        for i in range(3):
+            self.logger.warning("failure %s", i)
+        # the logger goes quiet, the summary is sent by the timer
+        time.sleep(0.3)
+        self.assertEqual(
+            [trace[0] for trace in self.handler.client.traces],
+            ["failure 0", "failure 2 (repeated 2 times)"]
+        )
+        self.handler.close()
+
+
+class QueuedAzureLoggingHandlerTest(unittest.TestCase):
+    def make_logger(self, **kwargs):
+        handler = AzureLoggingHandler("instrumentation_key", "component", **kwargs)
+        handler.client = _FakeTelemetryClient()
+        logger = logging.getLogger("oazure.tests.logging_handler.queued")
+        logger.handlers = [handler]
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        self.addCleanup(handler.close)
+        return logger, handler
+
+    def test_enqueue_flush_close(self):
+        logger, handler = self.make_logger(queue_size=100, flush_interval=60)
+        logger.info("message %s", 1, extra=dict(value=2))
+        handler.flush()
+        name, properties, severity = handler.client.traces[0]
+        self.assertEqual(("message 1", 2, "INFO"), (name, properties["_value"], severity))
+        # formatted and shipped by the background thread
+        self.assertEqual({"oazure-logging-handler"}, handler.client.threads)
+        for i in range(10):
+            logger.info("message")
+        handler.close()
+        self.assertEqual(11, len(handler.client.traces))
+        self.assertGreaterEqual(handler.client.flushes, 2)
+
+    def test_overflow(self):
+        logger, handler = self.make_logger(queue_size=2, flush_interval=60)
+        handler.client.release = threading.Event()
+        logger.info("shipping")
+        # waits for the background thread to take the first record
+        while not handler._queue.empty():
+            time.sleep(0.001)
+        for i in range(5):
+            logger.info("queued %s", i)
+        self.assertEqual(3, handler.dropped_records)
+        handler.client.release.set()
+        handler.flush()
+        self.assertEqual(["shipping", "queued 0", "queued 1"], [trace[0] for trace in handler.client.traces])
+
+    def test_flush_interval(self):
+        logger, handler = self.make_logger(queue_size=100, flush_interval=0.02)
+        logger.info("message")
+        time.sleep(0.2)
+        self.assertEqual(1, len(handler.client.traces))
+        self.assertGreaterEqual(handler.client.flushes, 1)
+        # records above warning are flushed without waiting for the interval
+        logger, handler = self.make_logger(queue_size=100, flush_interval=60)
+        logger.warning("warning")
+        time.sleep(0.2)
+        self.assertEqual(1, handler.client.flushes)
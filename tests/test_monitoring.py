@@ -24,3 +24,179 @@
 #     def test_sync(self):
 #         self.assertTrue(self.monitoring_client.send_json(self.json_data))
 #
+
+import json
+import asyncio
+import unittest
+
+from oazure.monitoring import LogAnalyticsBuffer, LogAnalyticsClient, LogAnalyticsSender
+
+
+class LogAnalyticsSplitTest(unittest.TestCase):
+    def test_split_body(self):
+        client = LogAnalyticsClient("customer_id", "a2V5", "test", max_body_size=100)
+        records = [dict(value=i, text="é") for i in range(30)]
+        bodies = client._split_body(records)
+        self.assertGreater(len(bodies), 1)
+        self.assertTrue(all(len(body) <= 100 for body in bodies))
+        self.assertEqual(sum([json.loads(body) for body in bodies], []), records)
+
+    def test_record_too_big(self):
+        client = LogAnalyticsClient("customer_id", "a2V5", "test", max_body_size=10)
+        with self.assertRaises(ValueError):
+            client._split_body([dict(text="too long for a body")])
+
+
+class LogAnalyticsSenderTest(unittest.TestCase):
+    def test_send_with_retry(self):
+        client = LogAnalyticsClient("customer_id", "a2V5", "test")
+        statuses = [503]
+        bodies = []
+
+        def post_body(body, operation):
+            bodies.append(body)
+            return statuses.pop(0) if statuses else 200
+        client._post_body = post_body
+
+        sender = LogAnalyticsSender(client, max_records=5, flush_interval=0.01, retry_delay=0.)
+        for i in range(10):
+            sender.send(dict(value=i))
+        sender.close()
+        # first body was sent twice
+        self.assertEqual(sum(len(json.loads(body)) for body in bodies[1:]), 10)
+        self.assertEqual(sender.sent_records, 10)
+        self.assertEqual(sender.failed_records, 0)
+
+    def test_failed_body_counted_once(self):
+        client = LogAnalyticsClient("customer_id", "a2V5", "test", max_body_size=40)
+        posts = []
+
+        def post_body(body, operation):
+            posts.append(body)
+            if len(posts) == 2:
+                raise RuntimeError("unexpected")
+            return 200
+        client._post_body = post_body
+
+        sender = LogAnalyticsSender(client, max_records=10, flush_interval=0.01, retry_delay=0.)
+        for i in range(9):
+            sender.send(dict(value=i))
+        sender.close()
+        # only the records of the failed body are failed
+        self.assertEqual(sender.failed_records, len(json.loads(posts[1])))
+        self.assertEqual(sender.sent_records + sender.failed_records, 9)
+
+
+class _BufferClient:
+    def __init__(self, max_body_size=1000, accept=True):
+        self.max_body_size = max_body_size
+        self.accept = accept
+        self.bodies = []
+
+    @property
+    def batches(self):
+        return [[record["v"] for record in json.loads(body)] for body in self.bodies]
+
+    async def _send_body_async(self, body, operation):
+        self.bodies.append(body)
+        await asyncio.sleep(0)
+        return self.accept
+
+
+class LogAnalyticsBufferTest(unittest.TestCase):
+    def test_count_trigger(self):
+        client = _BufferClient()
+
+        async def run():
+            async with LogAnalyticsBuffer(client, max_records=3, flush_interval=10.) as buffer:
+                for i in range(7):
+                    await buffer.add(dict(v=i))
+                await asyncio.sleep(0.01)
+                self.assertEqual([[0, 1, 2], [3, 4, 5]], client.batches)
+            return buffer
+
+        buffer = asyncio.run(run())
+        self.assertEqual([[0, 1, 2], [3, 4, 5], [6]], client.batches)
+        self.assertEqual(7, buffer.sent_records)
+
+    def test_bytes_trigger(self):
+        # {"v":0} is 7 bytes, 3 records and brackets fit in 30 bytes
+        client = _BufferClient()
+
+        async def run():
+            async with LogAnalyticsBuffer(client, max_bytes=30, flush_interval=10.) as buffer:
+                for i in range(4):
+                    await buffer.add(dict(v=i))
+                await asyncio.sleep(0.01)
+                self.assertEqual([[0, 1, 2]], client.batches)
+
+        asyncio.run(run())
+        self.assertEqual([[0, 1, 2], [3]], client.batches)
+        self.assertTrue(all(len(body) <= 30 for body in client.bodies))
+
+    def test_max_bytes_capped_by_client(self):
+        client = _BufferClient(max_body_size=30)
+        buffer = LogAnalyticsBuffer(client)
+        self.assertEqual(30, buffer.max_bytes)
+
+        async def run():
+            async with buffer:
+                for i in range(10):
+                    await buffer.add(dict(v=i))
+
+        asyncio.run(run())
+        self.assertTrue(all(len(body) <= 30 for body in client.bodies))
+        self.assertEqual(list(range(10)), sum(client.batches, []))
+
+    def test_interval_trigger(self):
+        client = _BufferClient()
+
+        async def run():
+            async with LogAnalyticsBuffer(client, flush_interval=0.01) as buffer:
+                await buffer.add(dict(v=0))
+                await asyncio.sleep(0.05)
+                self.assertEqual([[0]], client.batches)
+
+        asyncio.run(run())
+        self.assertEqual([[0]], client.batches)
+
+    def test_overflow(self):
+        def run(overflow):
+            client = _BufferClient()
+
+            async def add_all():
+                async with LogAnalyticsBuffer(
+                        client, flush_interval=10., max_buffered_records=2, overflow=overflow) as buffer:
+                    for i in range(4):
+                        await buffer.add(dict(v=i))
+                return buffer
+
+            buffer = asyncio.run(add_all())
+            return client.batches, buffer.dropped_records
+
+        self.assertEqual(([[0, 1]], 2), run("drop_newest"))
+        self.assertEqual(([[2, 3]], 2), run("drop_oldest"))
+        # the third add waits for the first batch
+        self.assertEqual(([[0, 1], [2, 3]], 0), run("block"))
+        with self.assertRaises(ValueError):
+            LogAnalyticsBuffer(_BufferClient(), overflow="unknown")
+
+    def test_flush_and_close(self):
+        client = _BufferClient(accept=False)
+
+        async def run():
+            buffer = LogAnalyticsBuffer(client, flush_interval=10.)
+            for i in range(3):
+                await buffer.add(dict(v=i))
+            await buffer.flush()
+            self.assertEqual([[0, 1, 2]], client.batches)
+            await buffer.add(dict(v=3))
+            await buffer.close()
+            with self.assertRaises(RuntimeError):
+                await buffer.add(dict(v=4))
+            return buffer
+
+        buffer = asyncio.run(run())
+        self.assertEqual([[0, 1, 2], [3]], client.batches)
+        self.assertEqual(0, buffer.sent_records)
+        self.assertEqual(4, buffer.failed_records)
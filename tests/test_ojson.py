@@ -0,0 +1,106 @@
+import io
+import json
+import asyncio
+import uuid
+import unittest
+import datetime as dt
+from collections import OrderedDict
+
+from oazure.snippets import ojson
+
+
+class OjsonDumpsTest(unittest.TestCase):
+    payload = dict(
+        date=dt.datetime(2020, 1, 2, 3, 4, 5, 6),
+        uuid=uuid.UUID(int=1),
+        set={1},
+        values=[1, 2.5, None, True, "é"],
+        big=2 ** 70
+    )
+
+    def tearDown(self):
+        ojson.set_backend(ojson.JSON_BACKEND)
+
+    def _check_backend(self, backend):
+        ojson.set_backend(backend)
+        expected = dict(
+            date="2020-01-02T03:04:05.000006Z",
+            uuid="00000000-0000-0000-0000-000000000001",
+            set=[1],
+            values=[1, 2.5, None, True, "é"],
+            big=2 ** 70
+        )
+        self.assertEqual(json.loads(ojson.dumps(self.payload)), expected)
+        self.assertEqual(json.loads(ojson.dumpb(self.payload).decode("utf-8")), expected)
+        with self.assertRaises(TypeError):
+            ojson.dumps(dict(date=dt.date(2020, 1, 1)))
+
+    def test_json_backend(self):
+        self._check_backend(ojson.JSON_BACKEND)
+
+    @unittest.skipIf(ojson.orjson is None, "orjson is not installed")
+    def test_orjson_backend(self):
+        self._check_backend(ojson.ORJSON_BACKEND)
+
+    def test_default_backend(self):
+        # the standard library, whether orjson is installed or not
+        self.assertEqual(ojson.JSON_BACKEND, ojson.get_backend())
+        self.assertEqual('{"a": NaN, "b": "\\u00e9"}', ojson.dumps(dict(a=float("nan"), b="é")))
+
+    def test_kwargs_use_json(self):
+        self.assertEqual(ojson.dumps(dict(b=1, a=2), sort_keys=True), '{"a": 2, "b": 1}')
+
+
+class OjsonLoadsTest(unittest.TestCase):
+    def test_dates(self):
+        o = ojson.loads(
+            '{"a": "2020-01-02T03:04:05.000006Z", "b": [["2020-1-2T3:4:5.6Z", {"c": "2020-01-02T03:04:05.6Z"}], "x"],'
+            '"d": "2020-13-02T03:04:05.6Z", "e": "Z"}'
+        )
+        self.assertIsInstance(o, OrderedDict)
+        self.assertEqual(o["a"], dt.datetime(2020, 1, 2, 3, 4, 5, 6))
+        self.assertEqual(o["b"][0][0], dt.datetime(2020, 1, 2, 3, 4, 5, 600000))
+        self.assertEqual(o["b"][0][1]["c"], dt.datetime(2020, 1, 2, 3, 4, 5, 600000))
+        self.assertEqual(o["b"][1], "x")
+        self.assertEqual(o["d"], "2020-13-02T03:04:05.6Z")
+        self.assertEqual(o["e"], "Z")
+
+    def test_top_level(self):
+        self.assertEqual(ojson.loads('"2020-01-02T03:04:05.000006Z"'), dt.datetime(2020, 1, 2, 3, 4, 5, 6))
+        self.assertEqual(ojson.loads('["2020-01-02T03:04:05.000006Z"]'), [dt.datetime(2020, 1, 2, 3, 4, 5, 6)])
+
+    def test_not_ordered(self):
+        o = ojson.loads('{"a": {"b": "2020-01-02T03:04:05.000006Z"}}', ordered=False)
+        self.assertIs(type(o["a"]), dict)
+        self.assertEqual(o["a"]["b"], dt.datetime(2020, 1, 2, 3, 4, 5, 6))
+
+    def test_deep_nesting(self):
+        depth = 500
+        o = ojson.loads("[" * depth + '"2020-01-02T03:04:05.000006Z"' + "]" * depth)
+        for _ in range(depth):
+            o = o[0]
+        self.assertEqual(o, dt.datetime(2020, 1, 2, 3, 4, 5, 6))
+
+
+class OjsonLinesTest(unittest.TestCase):
+    records = [dict(value=i, date=dt.datetime(2020, 1, 1, 0, 0, i), text="é\n") for i in range(20)]
+
+    def test_file_object(self):
+        for f in (io.BytesIO(), io.StringIO()):
+            ojson.dump_iter(self.records, f)
+            f.seek(0)
+            self.assertEqual(list(ojson.iter_load(f)), self.records)
+
+    def test_async_stream(self):
+        f = io.BytesIO()
+        ojson.dump_iter(self.records, f)
+        data = f.getvalue()
+
+        async def stream():
+            for i in range(0, len(data), 7):
+                yield data[i:i + 7]
+
+        async def load():
+            return [record async for record in ojson.aiter_load(stream())]
+
+        self.assertEqual(asyncio.run(load()), self.records)
@@ -0,0 +1,58 @@
+import asyncio
+import unittest
+
+from oazure.rate_limiting import TokenBucket, BlobRateLimiter
+
+from .fakes import Clock
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_try_consume(self):
+        clock = Clock()
+        bucket = TokenBucket(10, capacity=2, clock=clock)
+        self.assertTrue(bucket.try_consume())
+        self.assertTrue(bucket.try_consume())
+        self.assertFalse(bucket.try_consume())
+        clock.now = 0.1
+        self.assertTrue(bucket.try_consume())
+        self.assertFalse(bucket.try_consume())
+        # refill is capped by capacity
+        clock.now = 10
+        self.assertTrue(bucket.try_consume(2))
+        self.assertFalse(bucket.try_consume())
+
+    def test_reserve(self):
+        clock = Clock()
+        bucket = TokenBucket(10, capacity=1, clock=clock)
+        self.assertEqual(0, bucket.reserve())
+        # in debt: waits for the tokens
+        self.assertAlmostEqual(0.1, bucket.reserve())
+        self.assertAlmostEqual(0.2, bucket.reserve())
+        clock.now = 0.3
+        self.assertEqual(0, bucket.reserve())
+
+
+class BlobRateLimiterTest(unittest.TestCase):
+    def test_scopes(self):
+        clock = Clock()
+        limiter = BlobRateLimiter(account_requests=100, blob_requests=2, blob_bytes=1000, clock=clock)
+        self.assertEqual(0, limiter.reserve("container", "a"))
+        self.assertEqual(0, limiter.reserve("container", "a"))
+        # blob budget is spent, not the account one
+        self.assertAlmostEqual(0.5, limiter.reserve("container", "a"))
+        self.assertEqual(0, limiter.reserve("container", "b"))
+        # bytes
+        self.assertEqual(0, limiter.reserve("container", "c", bytes_nb=1000))
+        self.assertAlmostEqual(0.5, limiter.consume("container", "c", 500))
+        # container requests are only limited by the account
+        self.assertEqual(0, limiter.reserve("container"))
+
+    def test_acquire(self):
+        limiter = BlobRateLimiter(account_requests=100, burst=0.01)
+
+        async def run():
+            return [await limiter.acquire() for _ in range(3)]
+
+        delays = asyncio.run(run())
+        self.assertEqual(0, delays[0])
+        self.assertGreater(delays[2], 0)
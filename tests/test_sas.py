@@ -0,0 +1,92 @@
+import unittest
+import datetime as dt
+
+from azure.storage.blob import BlockBlobService, BlobPermissions
+
+from oazure.sas import BlobSasSigner, SasCache, make_permission
+
+from .fakes import ACCOUNT_KEY, Clock
+
+
+class BlobSasSignerTest(unittest.TestCase):
+    def test_same_as_sdk(self):
+        service = BlockBlobService(account_name="account", account_key=ACCOUNT_KEY)
+        signer = BlobSasSigner("account", ACCOUNT_KEY)
+        expiry = dt.datetime(2020, 1, 2, 3, 4, 5)
+        for permission in (BlobPermissions(read=True), BlobPermissions(read=True, create=True, delete=True)):
+            expected = service.make_blob_url(
+                "container",
+                "dir/blob.txt",
+                protocol="https",
+                sas_token=service.generate_blob_shared_access_signature(
+                    "container",
+                    "dir/blob.txt",
+                    permission=permission,
+                    expiry=expiry,
+                    protocol="https"
+                )
+            )
+            token = signer.blob_sas("container", "dir/blob.txt", str(permission), expiry)
+            self.assertEqual(expected, signer.blob_url("container", "dir/blob.txt", token))
+
+    def test_container_same_as_sdk(self):
+        service = BlockBlobService(account_name="account", account_key=ACCOUNT_KEY)
+        signer = BlobSasSigner("account", ACCOUNT_KEY)
+        expiry = dt.datetime(2020, 1, 2, 3, 4, 5)
+        expected = service.generate_container_shared_access_signature(
+            "container",
+            permission=BlobPermissions(read=True),
+            expiry=expiry,
+            protocol="https"
+        )
+        self.assertEqual(expected, signer.container_sas("container", "r", expiry))
+
+    def test_make_permission(self):
+        self.assertEqual("racwd", make_permission(read=True, add=True, create=True, write=True, delete=True))
+        self.assertEqual("rw", make_permission(write=True, read=True))
+
+
+class SasCacheTest(unittest.TestCase):
+    def test_rounded_expiry(self):
+        clock = Clock(1000.)
+        cache = SasCache(BlobSasSigner("account", ACCOUNT_KEY), 3600, rounding=60, clock=clock)
+        url = cache.blob_url("container", "blob", "r")
+        # 1000 + 3600 rounded up to 4620
+        self.assertIn("se=1970-01-01T01%3A17%3A00Z", url)
+        clock.now = 1019
+        self.assertEqual(url, cache.blob_url("container", "blob", "r"))
+        self.assertNotEqual(url, cache.blob_url("container", "blob", "rw"))
+        clock.now = 1021
+        self.assertNotEqual(url, cache.blob_url("container", "blob", "r"))
+
+    def test_blob_urls(self):
+        cache = SasCache(BlobSasSigner("account", ACCOUNT_KEY), 3600, clock=Clock(1000.))
+        urls = cache.blob_urls("container", ["a", "b"], "r")
+        self.assertEqual([cache.blob_url("container", name, "r") for name in ("a", "b")], urls)
+
+    def test_container_scope(self):
+        cache = SasCache(BlobSasSigner("account", ACCOUNT_KEY), 3600, clock=Clock(1000.))
+        token = cache.container_sas("container", "r")
+        urls = cache.blob_urls("container", ["a", "b/c"], "r", container_scope=True)
+        self.assertEqual([
+            f"https://account.blob.core.windows.net/container/a?{token}",
+            f"https://account.blob.core.windows.net/container/b/c?{token}"
+        ], urls)
+        self.assertEqual(urls[0], cache.blob_url("container", "a", "r", container_scope=True))
+
+    def test_expiry_change_while_signing(self):
+        # another thread moves to the next expiry while a token is signed: the token must not be cached for it
+        clock = Clock(1000.)
+        signer = BlobSasSigner("account", ACCOUNT_KEY)
+        cache = SasCache(signer, 3600, rounding=60, clock=clock)
+        blob_sas = signer.blob_sas
+
+        def racing_blob_sas(*args):
+            signer.blob_sas = blob_sas
+            clock.now = 1100
+            cache.blob_sas("container", "other", "r")
+            return blob_sas(*args)
+
+        signer.blob_sas = racing_blob_sas
+        self.assertIn("se=1970-01-01T01%3A17%3A00Z", cache.blob_url("container", "blob", "r"))
+        self.assertIn("se=1970-01-01T01%3A19%3A00Z", cache.blob_url("container", "blob", "r"))
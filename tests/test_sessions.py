@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+
+from oazure.async_batch_client import AzureBatchClient
+from oazure.sessions import create_session
+
+from .fakes import ACCOUNT_KEY
+
+
+class _Session:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class CreateSessionTest(unittest.TestCase):
+    def test_connector(self):
+        async def run():
+            session = create_session(limit=7, limit_per_host=2, headers={"x-test": "1"})
+            try:
+                return session.connector.limit, session.connector.limit_per_host, session.headers["x-test"]
+            finally:
+                await session.close()
+
+        self.assertEqual((7, 2, "1"), asyncio.run(run()))
+
+
+class BatchClientSessionTest(unittest.TestCase):
+    def _client(self, **kwargs):
+        return AzureBatchClient("account", ACCOUNT_KEY, "https://account.batch.azure.com", **kwargs)
+
+    def test_shared_session_not_closed(self):
+        session = _Session()
+
+        async def run():
+            async with self._client(session=session) as client:
+                self.assertIs(session, client._get_session())
+            await client.close()
+
+        asyncio.run(run())
+        self.assertFalse(session.closed)
+
+    def test_created_session_closed(self):
+        async def run():
+            async with self._client(connector_limit=7, connector_limit_per_host=2) as client:
+                session = client._get_session()
+                # created once, with the connector parameters
+                self.assertIs(session, client._get_session())
+                self.assertEqual((7, 2), (session.connector.limit, session.connector.limit_per_host))
+            self.assertTrue(session.closed)
+            self.assertIsNone(client.session)
+
+            # closed by close, a later request creates a new session
+            client = self._client()
+            session = client._get_session()
+            await client.close()
+            self.assertTrue(session.closed)
+            session = client._get_session()
+            self.assertFalse(session.closed)
+            await client.close()
+
+        asyncio.run(run())
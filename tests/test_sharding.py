@@ -0,0 +1,124 @@
+import asyncio
+import unittest
+
+from oazure.async_blob_storage import AzureBlobStorageAsyncError
+from oazure.sharding import HashRing, ShardedBlobAPI, rebalance
+
+from .fakes import FakeBlobStorage, make_blob_api
+
+
+def _make_apis(n):
+    return [make_blob_api(f"account{i}") for i in range(n)]
+
+
+class ShardingTest(unittest.TestCase):
+    def test_ring(self):
+        keys = [f"container/blob{i}" for i in range(10000)]
+        ring = HashRing([f"account{i}" for i in range(4)])
+        nodes = [ring.get_node(key) for key in keys]
+        # deterministic and balanced
+        self.assertEqual(nodes, [HashRing([f"account{i}" for i in range(4)]).get_node(key) for key in keys])
+        for i in range(4):
+            self.assertAlmostEqual(0.25, nodes.count(f"account{i}") / len(keys), delta=0.05)
+        # adding a node only moves keys to this node, about 1/5 of them
+        new_ring = HashRing([f"account{i}" for i in range(5)])
+        moved = [key for key, node in zip(keys, nodes) if new_ring.get_node(key) != node]
+        self.assertTrue(all(new_ring.get_node(key) == "account4" for key in moved))
+        self.assertAlmostEqual(0.2, len(moved) / len(keys), delta=0.05)
+
+    def test_routing_and_listing(self):
+        api = ShardedBlobAPI(_make_apis(3))
+        session = FakeBlobStorage()
+        names = [f"blob{i:03d}" for i in range(100)]
+
+        async def run():
+            for name in names:
+                await api.write_blob(name.encode(), "container", name, session)
+            self.assertEqual(b"blob007", await api.get_blob("container", "blob007", session))
+            listed = []
+            marker = None
+            while True:
+                marker, page = await api.list_blobs("container", session, marker=marker, maxresults=10)
+                listed.extend(page)
+                if marker is None:
+                    return listed
+
+        # pages are sorted, not the whole listing
+        self.assertEqual(names, sorted(asyncio.run(run())))
+        for account_name, blob_api in api.blob_apis.items():
+            account_names = session.names(account_name, "container")
+            self.assertTrue(0 < len(account_names) < 100)
+            self.assertTrue(all(api.get_shard("container", name) is blob_api for name in account_names))
+
+    def test_rebalance(self):
+        old_api = ShardedBlobAPI(_make_apis(3))
+        new_api = ShardedBlobAPI(_make_apis(4))
+        session = FakeBlobStorage()
+        names = [f"blob{i}" for i in range(200)]
+
+        async def run():
+            for name in names:
+                await old_api.write_blob(name.encode(), "container", name, session)
+            return await rebalance(old_api, new_api, "container", session)
+
+        moves = asyncio.run(run())
+        self.assertTrue(0 < len(moves) < 100)
+        for name in names:
+            self.assertEqual(
+                [new_api.get_shard("container", name).account_name],
+                [account_name for account_name in new_api.blob_apis
+                 if name in session.names(account_name, "container")]
+            )
+            self.assertEqual(name.encode(), session.get(new_api.get_shard("container", name).account_name,
+                                                        "container", name))
+
+    def test_rebalance_encoded_names(self):
+        old_api = ShardedBlobAPI(_make_apis(2))
+        new_api = ShardedBlobAPI(_make_apis(3))
+        session = FakeBlobStorage()
+        names = [f"run {i}/résultat#{i}?.csv" for i in range(50)]
+        for name in names:
+            session.store(old_api.get_shard("container", name).account_name, "container", name, name.encode())
+
+        moves = asyncio.run(rebalance(old_api, new_api, "container", session))
+        self.assertTrue(0 < len(moves) < 50)
+        for name in names:
+            self.assertEqual(
+                [new_api.get_shard("container", name).account_name],
+                [account_name for account_name in new_api.blob_apis
+                 if name in session.names(account_name, "container")]
+            )
+            self.assertEqual(name.encode(), session.get(new_api.get_shard("container", name).account_name,
+                                                        "container", name))
+
+    def test_keyword_arguments(self):
+        api = ShardedBlobAPI(_make_apis(3))
+        session = FakeBlobStorage()
+
+        async def run():
+            await api.write_blob(b"content", container_name="container", blob_name="blob", session=session)
+            return await api.get_blob("container", blob_name="blob", session=session)
+
+        self.assertEqual(b"content", asyncio.run(run()))
+        account_name = api.get_shard("container", "blob").account_name
+        self.assertEqual(b"content", session.get(account_name, "container", "blob"))
+
+    def test_rebalance_timeout(self):
+        old_api = ShardedBlobAPI(_make_apis(1))
+        new_api = ShardedBlobAPI(_make_apis(2))
+        session = FakeBlobStorage()
+        names = [f"blob{i}" for i in range(20)]
+        # copies stay pending
+        session.copy_polls = 100
+
+        async def run():
+            for name in names:
+                await old_api.write_blob(name.encode(), "container", name, session)
+            await rebalance(old_api, new_api, "container", session, poll_interval=0., copy_timeout=0.01)
+
+        with self.assertRaisesRegex(AzureBlobStorageAsyncError, "CopyTimeout"):
+            asyncio.run(run())
+        # sources are kept, aborted destinations are deleted
+        self.assertEqual(sorted(names), session.names("account0", "container"))
+        self.assertEqual([], session.names("account1", "container"))
+        self.assertGreater(session.count("put", "copy"), 0)
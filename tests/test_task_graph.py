@@ -0,0 +1,132 @@
+import json
+import asyncio
+import unittest
+
+from aiohttp.client_exceptions import ClientConnectionError
+
+from oazure.async_batch_client import AzureBatchClient, BatchResponseError, MAX_COLLECTION_SIZE, validate_task_graph
+from oazure.snippets.ojson import dumpb
+
+from .fakes import ACCOUNT_KEY
+
+
+class _Response:
+    def __init__(self, body):
+        self.status = 200
+        self.content_length = 0
+        self._body = body
+
+    async def json(self):
+        return self._body
+
+    def release(self):
+        pass
+
+
+class _Session:
+    # records add task collection requests (and their sizes), tasks of server_errors fail once, tasks of existing
+    # already exist, the responses of the first lost_responses requests are lost (after the tasks were added)
+    def __init__(self, server_errors=(), existing=(), lost_responses=0):
+        self.collections = []
+        self.sizes = []
+        self.server_errors = set(server_errors)
+        self.existing = set(existing)
+        self.lost_responses = lost_responses
+
+    async def request(self, verb, url, params=None, headers=None, data=None, skip_auto_headers=None):
+        task_ids = [task["id"] for task in json.loads(data)["value"]]
+        self.collections.append(task_ids)
+        self.sizes.append(len(data))
+        results = []
+        for task_id in task_ids:
+            if task_id in self.existing:
+                results.append(dict(status="clienterror", taskId=task_id, error=dict(code="TaskExists")))
+            elif task_id in self.server_errors:
+                self.server_errors.remove(task_id)
+                results.append(dict(status="servererror", taskId=task_id, error=dict(code="ServerError")))
+            else:
+                self.existing.add(task_id)
+                results.append(dict(status="success", taskId=task_id))
+        if self.lost_responses:
+            self.lost_responses -= 1
+            raise ClientConnectionError("response lost")
+        return _Response(dict(value=results))
+
+
+def _task(task_id, depends_on=None, depends_on_ranges=None):
+    return dict(id=task_id, command_line="echo", depends_on=depends_on, depends_on_ranges=depends_on_ranges)
+
+
+class TaskGraphTest(unittest.TestCase):
+    def test_validation(self):
+        tasks = [_task("merge", depends_on=["1", "2"]), _task("1"), _task("2", depends_on=["1"])]
+        self.assertEqual(["1", "2", "merge"], [task["id"] for task in validate_task_graph(tasks)])
+        # ranges
+        tasks = [_task("report", depends_on_ranges=[(1, 3)]), _task("3"), _task("1"), _task("10")]
+        self.assertEqual(["1", "3", "report", "10"], [task["id"] for task in validate_task_graph(tasks)])
+
+        with self.assertRaisesRegex(ValueError, "cycle"):
+            validate_task_graph([_task("a", depends_on=["b"]), _task("b", depends_on=["c"]), _task("c", ["a"])])
+        with self.assertRaisesRegex(ValueError, "cycle"):
+            validate_task_graph([_task("1", depends_on_ranges=[(0, 5)])])
+        with self.assertRaisesRegex(ValueError, "unknown"):
+            validate_task_graph([_task("a", depends_on=["b"])])
+        with self.assertRaisesRegex(ValueError, "duplicate"):
+            validate_task_graph([_task("a"), _task("a")])
+
+    def test_submission(self):
+        # 250 simulations, then a merge of all, then 30 reports
+        tasks = [_task("merge", depends_on_ranges=[(0, 249)])]
+        tasks += [_task(f"report{i}", depends_on=["merge"]) for i in range(30)]
+        tasks += [_task(str(i)) for i in range(250)]
+        session = _Session(server_errors=["7"])
+        client = AzureBatchClient("account", ACCOUNT_KEY, "https://account.batch.azure.com", session=session)
+
+        collections = asyncio.run(client.add_task_graph("job", tasks))
+        self.assertEqual([100, 100, 81], [len(collection) for collection in collections])
+        # the failed task was sent again
+        self.assertEqual([["7"]], [ids for ids in session.collections if len(ids) == 1])
+        added = [task_id for ids in session.collections for task_id in ids]
+        self.assertEqual(len(tasks) + 1, len(added))
+        self.assertLess(added.index("249"), added.index("merge"))
+        self.assertLess(added.index("merge"), added.index("report0"))
+
+    def test_collection_size(self):
+        # 4 task bodies of a quarter of the limit: the request envelope and commas do not fit
+        task_body_size = len(dumpb(AzureBatchClient._task_body("0", "")))
+        tasks = [_task(str(i)) for i in range(4)]
+        for task in tasks:
+            task["command_line"] = "x" * (MAX_COLLECTION_SIZE // 4 - task_body_size)
+        session = _Session()
+        client = AzureBatchClient("account", ACCOUNT_KEY, "https://account.batch.azure.com", session=session)
+
+        collections = asyncio.run(client.add_task_graph("job", tasks))
+        self.assertEqual([3, 1], [len(collection) for collection in collections])
+        self.assertLessEqual(max(session.sizes), MAX_COLLECTION_SIZE)
+
+    def test_resubmission(self):
+        tasks = [_task(str(i)) for i in range(10)] + [_task("merge", depends_on_ranges=[(0, 9)])]
+        # a previous submission added some tasks
+        session = _Session(existing=["0", "1", "2"])
+        client = AzureBatchClient("account", ACCOUNT_KEY, "https://account.batch.azure.com", session=session)
+        with self.assertRaises(BatchResponseError):
+            asyncio.run(client.add_task_graph("job", tasks))
+
+        asyncio.run(client.add_task_graph("job", tasks, exists_ok=True))
+        self.assertEqual(set(str(i) for i in range(10)) | {"merge"}, session.existing)
+
+    def test_lost_response(self):
+        tasks = [_task(str(i)) for i in range(10)] + [_task("merge", depends_on_ranges=[(0, 9)])]
+        # the tasks were added, the response was lost: sent again, the existing tasks are accepted
+        session = _Session(lost_responses=1)
+        client = AzureBatchClient("account", ACCOUNT_KEY, "https://account.batch.azure.com", session=session)
+        asyncio.run(client.add_task_graph("job", tasks))
+        self.assertEqual(2, len(session.collections))
+        self.assertEqual(set(str(i) for i in range(10)) | {"merge"}, session.existing)
+
+        # lost on every attempt
+        session = _Session(lost_responses=3)
+        client = AzureBatchClient("account", ACCOUNT_KEY, "https://account.batch.azure.com", session=session)
+        with self.assertRaises(ClientConnectionError):
+            asyncio.run(client.add_task_graph("job", tasks))
+        self.assertEqual(3, len(session.collections))